@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+
+import pandas as pd
+from pydantic import ValidationError
+
+from features import FEATURE_COLUMNS, CarFeatures
+
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_CONTENT_TYPES = ("text/csv", "application/csv")
+
+
+class InvalidRecord:
+    # Ligne illisible dans un corps NDJSON, signalée sans faire échouer le lot
+    def __init__(self, message):
+        self.message = message
+
+
+def parse_records(body, content_type):
+    """Décode le corps d'une requête de lot (liste JSON, NDJSON ou CSV) en liste d'enregistrements."""
+    content_type = (content_type or "application/json").split(";")[0].strip().lower()
+    text = body.decode("utf-8")
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        records = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                records.append(InvalidRecord(f"Ligne NDJSON invalide : {e}"))
+        return records
+
+    if content_type in CSV_CONTENT_TYPES:
+        return list(csv.DictReader(io.StringIO(text)))
+
+    data = json.loads(text)
+    if not isinstance(data, list):
+        raise ValueError("Le corps de la requête doit être une liste de véhicules.")
+    return data
+
+
+def format_validation_error(error):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])} : {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+def validate_records(records):
+    """Valide chaque enregistrement avec `CarFeatures`.
+
+    Retourne un DataFrame brut des lignes valides (indexé par la position dans le lot)
+    et un dictionnaire {position: message} pour les lignes rejetées.
+    """
+    rows = {}
+    errors = {}
+    for index, record in enumerate(records):
+        if isinstance(record, InvalidRecord):
+            errors[index] = record.message
+            continue
+        if not isinstance(record, dict):
+            errors[index] = "Chaque véhicule doit être un objet JSON."
+            continue
+        try:
+            rows[index] = CarFeatures.parse_obj(record).dict()
+        except ValidationError as e:
+            errors[index] = format_validation_error(e)
+
+    raw = pd.DataFrame.from_dict(rows, orient="index", columns=FEATURE_COLUMNS)
+    return raw, errors
+
+
+def iter_chunks(frame, size):
+    for start in range(0, len(frame), size):
+        yield frame.iloc[start:start + size]
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pandas as pd
+
+from features import FEATURE_COLUMNS
+from metrics import REGISTRY, Histogram
+
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+QUEUE_WAIT_BUCKETS = [0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1]
+
+batch_size = REGISTRY.register(Histogram(
+    "autopredict_batch_size",
+    "Nombre de requêtes regroupées dans chaque lot du micro-batcher.",
+    buckets=BATCH_SIZE_BUCKETS,
+))
+batch_queue_wait = REGISTRY.register(Histogram(
+    "autopredict_batch_queue_wait_seconds",
+    "Attente d'une requête dans la file du micro-batcher avant l'envoi de son lot.",
+    buckets=QUEUE_WAIT_BUCKETS,
+))
+
+
+class MicroBatcher:
+    """Regroupe les requêtes `/predict` concurrentes en un seul appel au modèle.
+
+    Les requêtes sont mises en file puis regroupées pendant au plus `window_ms`
+    millisecondes ou jusqu'à `max_size` lignes. Chaque lot est prédit dans un
+    thread de travail et les résultats sont renvoyés aux coroutines en attente.
+    """
+
+    def __init__(self, predict_fn, window_ms, max_size, executor=None):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.failed_batches = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, row):
+        # `row` est un dictionnaire déjà encodé, avec les colonnes de FEATURE_COLUMNS
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                batch_queue_wait.observe(value=started - enqueued)
+            batch_size.observe(value=len(batch))
+
+            try:
+                input_data = pd.DataFrame([row for row, _, _ in batch], columns=FEATURE_COLUMNS)
+                predictions = await loop.run_in_executor(self.executor, self.predict_fn, input_data)
+            except Exception as e:
+                self.failed_batches += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), prediction in zip(batch, predictions):
+                # La coroutine a pu être annulée (client déconnecté) entre-temps
+                if not future.done():
+                    future.set_result(prediction)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_size": self.max_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "failed_batches": self.failed_batches,
+            "batch_size": batch_size.snapshot(),
+            "queue_wait_seconds": batch_queue_wait.snapshot(),
+        }
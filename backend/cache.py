@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Cache borné (LRU, expiration optionnelle), protégé par un verrou pour être partagé entre threads
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.monotonic()):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ModelCache(LRUCache):
+    """Cache dont les entrées dépendent de la version du modèle servi.
+
+    La version fait partie de chaque clé et le contenu est vidé dès qu'une autre
+    version est déclarée avec `set_version`. Une requête encore servie par l'ancien
+    modèle peut passer sa version : son résultat n'est alors ni lu ni conservé.
+    """
+
+    def __init__(self, maxsize, ttl=None, version=None):
+        super().__init__(maxsize, ttl)
+        self.version = version
+
+    def set_version(self, version):
+        if version != self.version:
+            self.version = version
+            self.clear()
+
+    def get(self, key, version=None):
+        if version is not None and version != self.version:
+            return None
+        return super().get((self.version, key))
+
+    def put(self, key, value, version=None):
+        if version is not None and version != self.version:
+            return
+        super().put((self.version, key), value)
+
+    def stats(self):
+        return {"model_version": self.version, **super().stats()}
@@ -0,0 +1,135 @@
+import copy
+
+import numpy as np
+
+from forest_engine import CompiledForest, float32_floor
+
+
+def node_depths(tree):
+    # Parcours en largeur, un niveau entier à la fois
+    depths = np.zeros(tree.node_count, dtype=np.intp)
+    level, depth = np.array([0]), 0
+    while len(level):
+        depths[level] = depth
+        children = np.concatenate([tree.children_left[level], tree.children_right[level]])
+        level, depth = children[children != -1], depth + 1
+    return depths
+
+
+def compact_tree(estimator, max_depth=None, quantize=True):
+    """Copie d'un arbre de régression coupé à `max_depth`, seuils et valeurs arrondis au float32.
+
+    Un nœud interne situé à `max_depth` devient une feuille : sa valeur (moyenne des
+    échantillons qu'il contient) est exactement la prédiction d'un arbre de cette profondeur.
+    """
+    tree = estimator.tree_
+    state = tree.__getstate__()
+    nodes, values = state["nodes"].copy(), state["values"].copy()
+    depths = node_depths(tree)
+
+    if max_depth is not None and max_depth < tree.max_depth:
+        kept = np.flatnonzero(depths <= max_depth)
+        new_index = np.full(tree.node_count, -1, dtype=np.intp)
+        new_index[kept] = np.arange(len(kept))
+        nodes, values = nodes[kept], values[kept]
+        cut = depths[kept] == max_depth
+        for field in ("left_child", "right_child"):
+            children = nodes[field]
+            nodes[field] = np.where((children == -1) | cut, -1, new_index[children])
+        # Mêmes marqueurs que sklearn pour une feuille
+        nodes["feature"][cut] = -2
+        nodes["threshold"][cut] = -2
+        depths = depths[kept]
+
+    if quantize:
+        internal = nodes["left_child"] != -1
+        # Sans effet sur les décisions : voir `float32_floor`
+        nodes["threshold"][internal] = float32_floor(nodes["threshold"][internal])
+        values = values.astype(np.float32).astype(np.float64)
+
+    compacted = copy.deepcopy(estimator)
+    cls, args = tree.__reduce__()[:2]
+    compacted.tree_ = cls(*args)
+    compacted.tree_.__setstate__({
+        **state,
+        "max_depth": int(depths.max()),
+        "node_count": len(nodes),
+        "nodes": nodes,
+        "values": values,
+    })
+    if max_depth is not None:
+        compacted.max_depth = max_depth if estimator.max_depth is None else min(max_depth, estimator.max_depth)
+    return compacted
+
+
+def compact_pipeline(pipeline, n_trees=None, max_depth=None, quantize=True):
+    """Pipeline identique dont la forêt ne garde que ses `n_trees` premiers arbres, coupés à `max_depth`.
+
+    Les arbres d'une forêt aléatoire sont interchangeables : garder les premiers revient à
+    tirer un sous-ensemble au hasard, sans favoriser les arbres qui réussissent sur le jeu de sélection.
+    """
+    compacted = copy.deepcopy(pipeline)
+    forest = compacted[-1]
+    estimators = forest.estimators_[:n_trees]
+    forest.estimators_ = [compact_tree(estimator, max_depth, quantize) for estimator in estimators]
+    forest.n_estimators = len(forest.estimators_)
+    if max_depth is not None:
+        forest.max_depth = max_depth if forest.max_depth is None else min(max_depth, forest.max_depth)
+    return compacted
+
+
+def compaction_grid(pipeline, X, y, tree_counts, depths, n_bootstrap=500, confidence=0.95, seed=42):
+    """Erreurs et nombre de nœuds de chaque combinaison (arbres, profondeur), en un seul parcours de la forêt.
+
+    Le parcours vectorisé de `CompiledForest` donne, niveau par niveau, le nœud atteint dans
+    chaque arbre : la prédiction d'une forêt coupée à la profondeur d se lit au niveau d, et
+    une somme cumulée sur les arbres donne toutes les tailles de forêt à la fois.
+
+    Chaque combinaison reçoit aussi la borne haute (bootstrap apparié sur les mêmes lignes)
+    de la hausse relative de son erreur par rapport à la forêt complète.
+    """
+    compiled = CompiledForest(pipeline)
+    y = np.asarray(y, dtype=np.float64)
+    tree_counts = np.asarray(sorted(set(min(k, compiled.n_trees) for k in tree_counts) | {compiled.n_trees}))
+    tree_depths = [node_depths(estimator.tree_) for estimator in pipeline[-1].estimators_]
+    wanted = {depth if depth is not None and depth < compiled.max_depth else None for depth in depths} | {None}
+
+    grid, errors = [], []
+    for level, node in enumerate(compiled.iter_levels(X)):
+        depth = None if level == compiled.max_depth else level
+        if depth not in wanted:
+            continue
+        predictions = np.cumsum(compiled.value[node].astype(np.float64), axis=1)[:, tree_counts - 1] / tree_counts
+        error = predictions - y[:, None]
+        # Nœuds gardés par arbre à cette profondeur, cumulés sur les arbres
+        nodes_per_tree = np.array([np.count_nonzero(d <= level) for d in tree_depths])
+        node_counts = np.cumsum(nodes_per_tree)[tree_counts - 1]
+        for column, (k, n_nodes) in enumerate(zip(tree_counts, node_counts)):
+            grid.append({"n_trees": int(k), "max_depth": depth, "nodes": int(n_nodes)})
+            errors.append(error[:, column])
+
+    errors = np.column_stack(errors)
+    # La forêt complète est la dernière combinaison : profondeur illimitée, tous les arbres
+    weights = np.random.default_rng(seed).poisson(1.0, (n_bootstrap, len(y))).astype(np.float64)
+    totals = weights.sum(axis=1, keepdims=True)
+    for metric, losses, root in (("mae", np.abs(errors), False), ("rmse", errors ** 2, True)):
+        values = losses.mean(axis=0)
+        replicates = weights @ losses / totals
+        if root:
+            values, replicates = np.sqrt(values), np.sqrt(replicates)
+        increase = np.quantile(replicates / replicates[:, -1:] - 1, confidence, axis=0)
+        for entry, value, upper in zip(grid, values, increase):
+            entry[metric] = float(value)
+            entry[f"{metric}_increase_upper"] = float(upper)
+    return grid
+
+
+def select_compaction(grid, metric="rmse", tolerance=0.01):
+    """Combinaison la plus petite (en nœuds) dont l'erreur dépasse celle de la forêt complète d'au plus `tolerance` (relatif).
+
+    La tolérance s'applique à la borne haute du bootstrap apparié et non à l'erreur mesurée :
+    sur un petit jeu de sélection, une petite forêt peut passer sous la limite par chance.
+    """
+    full = grid[-1]
+    candidates = [entry for entry in grid if entry[f"{metric}_increase_upper"] <= tolerance]
+    return full, min(candidates, key=lambda entry: (entry["nodes"], entry[metric]))
@@ -0,0 +1,109 @@
+import os
+
+
+# Paramètres de l'API, surchargeables par variables d'environnement
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.getenv("AUTOPREDICT_DATA_PATH", os.path.join(BASE_DIR, "data", "cartest.csv"))
+
+# Modèle servi et origine du chargement : "registry" (serveur MLflow), "snapshot" (fichier
+# local uniquement) ou "auto" (snapshot local s'il existe, sinon registre puis export du snapshot)
+MODEL_URI = os.getenv("MODEL_URI", "models:/OptimizedRandomForestModel/3")
+MODEL_SOURCE = os.getenv("MODEL_SOURCE", "auto")
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR", os.path.join(BASE_DIR, "snapshots"))
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://127.0.0.1:8080")
+
+# Modèles résidents supplémentaires, choisis par requête (en-tête `X-Model` ou paramètre `model`) :
+# "nom=uri,nom=uri". Le modèle MODEL_URI est toujours servi, sous le nom "default"
+SERVED_MODELS = os.getenv("SERVED_MODELS", "")
+# Partage du trafic des requêtes qui ne désignent pas de modèle : "nom=poids,nom=poids" (tout sur "default" si vide)
+MODEL_TRAFFIC_SPLIT = os.getenv("MODEL_TRAFFIC_SPLIT", "")
+# Modèles candidats notant aussi, en shadow et hors du chemin critique, les requêtes servies par un autre modèle : "nom,nom"
+SHADOW_MODELS = os.getenv("SHADOW_MODELS", "")
+# Nombre de mesures récentes conservées par modèle pour les statistiques de latence et de dérive
+MODEL_STATS_WINDOW = _env_int("MODEL_STATS_WINDOW", 1000)
+
+# Rechargement à chaud : fichier contenant l'URI du modèle à servir, surveillé périodiquement
+MODEL_WATCH_FILE = os.getenv("MODEL_WATCH_FILE", "")
+MODEL_WATCH_INTERVAL = _env_float("MODEL_WATCH_INTERVAL", 5)
+
+# Prédiction par lots : nombre maximal de lignes envoyées au modèle en un seul appel
+PREDICT_BATCH_MAX_CHUNK = _env_int("PREDICT_BATCH_MAX_CHUNK", 5000)
+
+# Micro-batching des requêtes `/predict` concurrentes (désactivé par défaut)
+PREDICT_BATCHING_ENABLED = _env_bool("PREDICT_BATCHING_ENABLED", False)
+PREDICT_BATCH_WINDOW_MS = _env_float("PREDICT_BATCH_WINDOW_MS", 5)
+PREDICT_BATCH_MAX_SIZE = _env_int("PREDICT_BATCH_MAX_SIZE", 64)
+
+# Explications SHAP : taille de l'échantillon de fond tiré de `data/cartest.csv`
+EXPLAIN_BACKGROUND_SIZE = _env_int("EXPLAIN_BACKGROUND_SIZE", 100)
+# Fond réduit utilisé par KernelExplainer, en repli pour les modèles non arborescents
+EXPLAIN_KERNEL_BACKGROUND_SIZE = _env_int("EXPLAIN_KERNEL_BACKGROUND_SIZE", 10)
+# Moteur d'explication (et import de shap) construit au chargement du modèle plutôt qu'à la première
+# explication : utile seulement avec EXPLAIN_POOL_KIND=thread, pour une première explication sans attente
+EXPLAIN_PRELOAD = _env_bool("EXPLAIN_PRELOAD", False)
+# Explications par lots : nombre maximal de lignes par appel à l'explainer
+EXPLAIN_BATCH_MAX_CHUNK = _env_int("EXPLAIN_BATCH_MAX_CHUNK", 1000)
+# Nombre de graphiques `/explain_visual` gardés en mémoire (0 pour désactiver le cache)
+EXPLAIN_VISUAL_CACHE_SIZE = _env_int("EXPLAIN_VISUAL_CACHE_SIZE", 256)
+
+# Cache des prédictions `/predict` (désactivé par défaut), TTL en secondes (0 pour ne jamais expirer)
+PREDICT_CACHE_ENABLED = _env_bool("PREDICT_CACHE_ENABLED", False)
+PREDICT_CACHE_SIZE = _env_int("PREDICT_CACHE_SIZE", 10000)
+PREDICT_CACHE_TTL = _env_float("PREDICT_CACHE_TTL", 3600)
+
+# Moteur d'inférence : "pyfunc" (modèle MLflow), "compiled" (forêt compilée en tableaux NumPy)
+# ou "onnx" (pipeline exporté en ONNX, exécuté par onnxruntime)
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "pyfunc")
+# Moteur ONNX : graphes exportés, indexés par l'empreinte du modèle, et threads par appel à onnxruntime
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "onnx_models"))
+ONNX_INTRA_OP_THREADS = _env_int("ONNX_INTRA_OP_THREADS", 1)
+
+# Pools d'exécution : nombre de workers et profondeur maximale de file avant un refus 503
+PREDICT_POOL_WORKERS = _env_int("PREDICT_POOL_WORKERS", 4)
+PREDICT_POOL_MAX_QUEUE = _env_int("PREDICT_POOL_MAX_QUEUE", 64)
+# Explications : "process" (modèle préchargé dans chaque processus) ou "thread"
+EXPLAIN_POOL_KIND = os.getenv("EXPLAIN_POOL_KIND", "process")
+EXPLAIN_POOL_WORKERS = _env_int("EXPLAIN_POOL_WORKERS", 2)
+EXPLAIN_POOL_MAX_QUEUE = _env_int("EXPLAIN_POOL_MAX_QUEUE", 8)
+# Délai suggéré au client (en-tête Retry-After, en secondes) lorsqu'un pool est saturé
+POOL_RETRY_AFTER = _env_int("POOL_RETRY_AFTER", 1)
+
+# Métriques `/metrics` : durée de chaque étape, requêtes en cours (False supprime tout surcoût)
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+
+# Journalisation : niveau des logs et journal des requêtes en JSON lines (une ligne par requête
+# échantillonnée, écrite sur la sortie d'erreur ou dans REQUEST_LOG_PATH)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+REQUEST_LOG_SAMPLE_RATE = _env_float("REQUEST_LOG_SAMPLE_RATE", 0.1)
+REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH", "")
+
+# Jeu de données d'entraînement : cache Parquet typé, indexé par l'empreinte du CSV source,
+# et taille des paquets lus lors de la conversion (la mémoire utilisée ne dépend pas de la taille du CSV)
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", os.path.join(BASE_DIR, "dataset_cache"))
+DATASET_CHUNK_ROWS = _env_int("DATASET_CHUNK_ROWS", 100000)
+
+# Grille de prix précalculée (scripts/OneOrdinal/build_price_grid.py) : `/predict` lit le prix
+# dans la grille du modèle actif, et interroge le modèle seulement pour les entrées hors grille
+PRICE_GRID_ENABLED = _env_bool("PRICE_GRID_ENABLED", False)
+PRICE_GRID_DIR = os.getenv("PRICE_GRID_DIR", os.path.join(BASE_DIR, "price_grids"))
+
+# Jobs asynchrones (`/jobs`) : dossier des jobs et résultats, workers, jobs en attente au plus
+# avant un refus 503, et durée de conservation d'un job terminé (en secondes)
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(BASE_DIR, "job_store"))
+JOBS_WORKERS = _env_int("JOBS_WORKERS", 2)
+JOBS_MAX_QUEUE = _env_int("JOBS_MAX_QUEUE", 100)
+JOBS_TTL = _env_float("JOBS_TTL", 3600)
+# Bail d'un job sur son worker : sans renouvellement depuis ce délai (secondes), un autre worker le reprend
+JOBS_LEASE_TIMEOUT = _env_float("JOBS_LEASE_TIMEOUT", 60)
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from config import DATA_PATH, DATASET_CACHE_DIR, DATASET_CHUNK_ROWS
+from features import DEFAULT_ENCODER, FIELD_LABELS
+from model_loader import file_sha256
+
+
+# Colonnes du jeu de données une fois `name` remplacé par `brand`, dans l'ordre utilisé à l'entraînement
+COLUMNS = ["year", "selling_price", "km_driven", "fuel", "seller_type", "transmission", "owner", "brand"]
+TARGET = "selling_price"
+CATEGORY_COLUMNS = ["fuel", "seller_type", "transmission", "owner", "brand"]
+# Entiers 64 bits comme avec `pd.read_csv` : la signature des modèles enregistrés ne change pas
+CSV_DTYPES = {"year": "int64", "selling_price": "int64", "km_driven": "int64", **{c: "str" for c in CATEGORY_COLUMNS if c != "brand"}}
+
+
+def source_sha256(path, cache_dir=DATASET_CACHE_DIR):
+    """Empreinte du fichier source, recalculée seulement si sa taille ou sa date de modification a changé."""
+    index_path = os.path.join(cache_dir, "sources.json")
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    entry = index.get(key)
+    if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    sha256 = file_sha256(path)
+    index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=cache_dir, delete=False, suffix=".tmp") as f:
+        json.dump(index, f, indent=2)
+    os.replace(f.name, index_path)
+    return sha256
+
+
+def rows_sha256(path=DATA_PATH, n_rows=None, cache_dir=DATASET_CACHE_DIR):
+    """Empreinte des valeurs des `n_rows` premières lignes du jeu typé (toutes par défaut), ou None s'il en a moins.
+
+    Contrairement à l'empreinte du fichier, elle ne dépend ni des fins de ligne, ni des
+    guillemets, ni du saut de ligne final du CSV : des annonces ajoutées à la fin laissent
+    inchangée l'empreinte des lignes d'origine.
+    """
+    digest = hashlib.sha256()
+    remaining = n_rows
+    for batch in iter_dataset(path, cache_dir):
+        if remaining is not None:
+            batch = batch.iloc[:remaining]
+            remaining -= len(batch)
+        # Une empreinte par ligne, calculée sur les valeurs (libellés et non codes des catégories)
+        digest.update(pd.util.hash_pandas_object(batch[COLUMNS], index=False).to_numpy().tobytes())
+        if remaining == 0:
+            break
+    return None if remaining else digest.hexdigest()
+
+
+def _prepare_chunk(chunk):
+    chunk["brand"] = chunk["name"].str.split().str[0]
+    return chunk.drop(columns="name")[COLUMNS]
+
+
+def _dictionary_array(values, categories):
+    # Codes attribués dans l'ordre d'apparition, d'un paquet à l'autre : chaque dictionnaire prolonge le précédent (delta Arrow)
+    for value in values.dropna().unique():
+        categories.setdefault(value, len(categories))
+    codes = values.map(categories).fillna(-1).to_numpy(dtype=np.int32)
+    return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(list(categories), pa.string()))
+
+
+def ingest(path, cache_path, chunk_rows=DATASET_CHUNK_ROWS):
+    """Convertit le CSV en fichier Arrow IPC typé, non compressé, paquet par paquet.
+
+    Chaque paquet devient un record batch : la mémoire ne dépend pas de la taille du fichier.
+    Les colonnes catégorielles sont encodées en dictionnaire.
+    """
+    schema = pa.schema([(column, pa.dictionary(pa.int32(), pa.string()) if column in CATEGORY_COLUMNS else pa.int64()) for column in COLUMNS])
+    categories = {column: {} for column in CATEGORY_COLUMNS}
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    rows = 0
+    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+        for chunk in pd.read_csv(path, dtype=CSV_DTYPES, chunksize=chunk_rows):
+            chunk = _prepare_chunk(chunk)
+            writer.write_batch(pa.record_batch([
+                _dictionary_array(chunk[column], categories[column]) if column in CATEGORY_COLUMNS else pa.array(chunk[column], pa.int64())
+                for column in COLUMNS
+            ], schema=schema))
+            rows += len(chunk)
+    os.replace(tmp_path, cache_path)
+    return rows
+
+
+def _open_cache(path, cache_dir):
+    cache_path = os.path.join(cache_dir, f"{source_sha256(path, cache_dir)}.arrow")
+    if not os.path.exists(cache_path):
+        ingest(path, cache_path)
+    # Fichier projeté en mémoire : les tableaux Arrow pointent directement sur ses pages
+    return pa.ipc.open_file(pa.memory_map(cache_path))
+
+
+def _to_pandas(table, columns):
+    # Colonnes catégorielles relues en `category` ; une colonne numérique d'un seul paquet n'est pas copiée
+    return (table if columns is None else table.select(columns)).to_pandas(split_blocks=True)
+
+
+def load_dataset(path=DATA_PATH, cache_dir=DATASET_CACHE_DIR, columns=None):
+    """Jeu de données typé (colonnes catégorielles, entiers 64 bits), lu depuis le cache Arrow.
+
+    Le cache est indexé par l'empreinte SHA-256 du CSV : il est reconstruit
+    automatiquement lorsque le fichier source change. Il est lu en mémoire mappée,
+    sans décompression : seules les colonnes demandées sont chargées dans le DataFrame.
+    """
+    return _to_pandas(_open_cache(path, cache_dir).read_all(), columns)
+
+
+def iter_dataset(path=DATA_PATH, cache_dir=DATASET_CACHE_DIR, columns=None):
+    """Même contenu que `load_dataset`, un DataFrame par paquet d'ingestion : pour un jeu plus grand que la mémoire."""
+    reader = _open_cache(path, cache_dir)
+    for index in range(reader.num_record_batches):
+        yield _to_pandas(pa.Table.from_batches([reader.get_batch(index)]), columns)
+
+
+def _map_categories(series, encoder, column):
+    # Une recherche par catégorie distincte, puis une indexation par les codes de chaque ligne
+    codes, known = encoder.encode_values(column, series.cat.categories)
+    row_codes = series.cat.codes.to_numpy()
+    # Comme à la prédiction (FeatureEncoder), une valeur inconnue ou absente est refusée
+    unknown = np.append(~known, True)[row_codes]
+    if unknown.any():
+        counts = series[unknown].astype(object).fillna("<vide>").value_counts()
+        detail = ", ".join(f"{label} ({count})" for label, count in counts.items())
+        raise ValueError(
+            f"{FIELD_LABELS.get(column, column)} : valeurs inconnues de l'encodeur dans {int(unknown.sum())} lignes : {detail}. "
+            f"Valeurs possibles : {list(encoder.mappings[column].keys())}"
+        )
+    return codes[row_codes].astype("int64")
+
+
+def encode_categories(df, encoder=DEFAULT_ENCODER):
+    """Remplace les libellés de `fuel`, `transmission`, `owner` et `seller_type` par leurs codes ; `brand` reste une chaîne."""
+    encoded = df.copy()
+    for column in encoder.mappings:
+        encoded[column] = _map_categories(df[column], encoder, column)
+    encoded["brand"] = df["brand"].astype(str)
+    return encoded
+
+
+def decode_categories(df):
+    # Libellés d'origine en chaînes, pour les pipelines qui encodent eux-mêmes (OneHot)
+    return df.astype({column: str for column in CATEGORY_COLUMNS})
+
+
+def load_training_data(path=DATA_PATH, encoded=True, cache_dir=DATASET_CACHE_DIR, encoder=DEFAULT_ENCODER):
+    """Features et cible prêtes pour l'entraînement ou l'évaluation."""
+    df = load_dataset(path, cache_dir)
+    df = encode_categories(df, encoder) if encoded else decode_categories(df)
+    return df.drop(columns=TARGET), df[TARGET]
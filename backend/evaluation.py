@@ -0,0 +1,183 @@
+import base64
+import html
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from features import DEFAULT_ENCODER
+
+
+METRICS = ["mae", "rmse", "r2", "mape"]
+# Dimensions de découpage du rapport
+SLICES = ["brand", "year_bucket", "fuel", "owner"]
+YEAR_BUCKET_SIZE = 5
+
+
+def row_terms(y, pred):
+    """Termes par ligne dont les sommes par groupe suffisent à calculer toutes les métriques.
+
+    Lignes du tableau (7, n) : 1, |erreur|, erreur², y, y², erreur relative (0 si y = 0), y ≠ 0.
+    Calculés une seule fois, puis pondérés à chaque réplication du bootstrap.
+    """
+    error = pred - y
+    nonzero = y != 0
+    ape = np.where(nonzero, np.abs(error) / np.where(nonzero, np.abs(y), 1), 0)
+    # Un terme par ligne du tableau : chaque `np.bincount` lit ainsi un bloc mémoire contigu
+    return np.vstack([np.ones_like(y), np.abs(error), error ** 2, y, y ** 2, ape, nonzero])
+
+
+def grouped_metrics(codes, n_groups, terms, weights=None):
+    """MAE, RMSE, R² et MAPE par groupe, à partir de sommes pondérées calculées par `np.bincount`.
+
+    `codes` donne le groupe de chaque ligne (0 à n_groups - 1) et `terms` vient de `row_terms`.
+    Les poids servent au bootstrap ; sans poids, chaque ligne compte une fois. Retourne un
+    tableau (n_groups, 4) dans l'ordre de METRICS, et le poids total de chaque groupe.
+    """
+    weighted = terms if weights is None else terms * weights
+    count, sae, sse, sy, syy, sape, count_nonzero = (np.bincount(codes, weights=term, minlength=n_groups) for term in weighted)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sst = syy - sy ** 2 / count
+        result = np.column_stack([
+            sae / count,
+            np.sqrt(sse / count),
+            np.where(sst > 0, 1 - sse / sst, np.nan),
+            100 * sape / count_nonzero,
+        ])
+    return result, count
+
+
+def slice_codes(frame, encoder=DEFAULT_ENCODER):
+    """Codes de groupe et libellés de chaque dimension de découpage (plus "overall", un seul groupe)."""
+    decoded = {column: {code: label for label, code in mapping.items()} for column, mapping in encoder.mappings.items()}
+    bucket = (frame["year"].to_numpy() // YEAR_BUCKET_SIZE) * YEAR_BUCKET_SIZE
+    values = {
+        "brand": frame["brand"].to_numpy(),
+        "year_bucket": pd.Series(bucket).map(lambda start: f"{start}-{start + YEAR_BUCKET_SIZE - 1}").to_numpy(),
+        "fuel": frame["fuel"].map(decoded["fuel"]).fillna("inconnu").to_numpy(),
+        "owner": frame["owner"].map(decoded["owner"]).fillna("inconnu").to_numpy(),
+    }
+    slices = {"overall": (np.zeros(len(frame), dtype=np.int64), np.array(["overall"]))}
+    for name in SLICES:
+        codes, labels = pd.factorize(values[name], sort=True)
+        slices[name] = (codes.astype(np.int64), np.asarray(labels))
+    return slices
+
+
+# Données partagées par les processus du bootstrap, transmises une seule fois à leur démarrage
+_shared = {}
+
+
+def _init_bootstrap_worker(terms, slices):
+    _shared.update(terms=terms, slices=slices)
+
+
+def _bootstrap_replicates(seed, n_replicates):
+    # Bootstrap de Poisson : chaque ligne reçoit un poids Poisson(1), sans rééchantillonner les données
+    rng = np.random.default_rng(seed)
+    terms, slices = _shared["terms"], _shared["slices"]
+    results = {name: np.empty((n_replicates, len(labels), len(METRICS))) for name, (_, labels) in slices.items()}
+    for replicate in range(n_replicates):
+        weighted = terms * rng.poisson(1.0, terms.shape[1])
+        for name, (codes, labels) in slices.items():
+            results[name][replicate], _ = grouped_metrics(codes, len(labels), weighted)
+    return results
+
+
+def bootstrap_intervals(terms, slices, n_replicates=1000, workers=None, confidence=0.95, seed=42):
+    """Intervalles de confiance bootstrap de chaque métrique, pour chaque groupe de chaque dimension.
+
+    Les réplications sont réparties entre `workers` processus, chacun avec sa propre
+    graine dérivée de `seed` : le résultat ne dépend que de `seed` et de `workers`.
+    """
+    workers = workers or os.cpu_count()
+    per_worker = np.diff(np.linspace(0, n_replicates, workers + 1).astype(int))
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    with ProcessPoolExecutor(workers, initializer=_init_bootstrap_worker, initargs=(terms, slices)) as pool:
+        parts = list(pool.map(_bootstrap_replicates, seeds, per_worker))
+
+    alpha = (1 - confidence) / 2
+    intervals = {}
+    with warnings.catch_warnings():
+        # R² n'est pas défini pour un groupe d'une seule annonce : son intervalle reste vide
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for name in slices:
+            replicates = np.concatenate([part[name] for part in parts])
+            intervals[name] = np.nanquantile(replicates, [alpha, 1 - alpha], axis=0)
+    return intervals
+
+
+def evaluate(frame, y, pred, n_bootstrap=1000, workers=None, encoder=DEFAULT_ENCODER):
+    """Métriques globales et par découpage, avec intervalles de confiance ; retourne un dictionnaire sérialisable en JSON."""
+    y = np.asarray(y, dtype=np.float64)
+    pred = np.asarray(pred, dtype=np.float64)
+    terms = row_terms(y, pred)
+    slices = slice_codes(frame, encoder)
+    intervals = bootstrap_intervals(terms, slices, n_bootstrap, workers) if n_bootstrap else None
+
+    report = {}
+    for name, (codes, labels) in slices.items():
+        values, counts = grouped_metrics(codes, len(labels), terms)
+        rows = []
+        for group, label in enumerate(labels):
+            row = {"group": str(label), "n": int(counts[group])}
+            for position, metric in enumerate(METRICS):
+                entry = {"value": _finite(values[group, position])}
+                if intervals is not None:
+                    entry["ci_low"] = _finite(intervals[name][0, group, position])
+                    entry["ci_high"] = _finite(intervals[name][1, group, position])
+                row[metric] = entry
+            rows.append(row)
+        report[name] = rows[0] if name == "overall" else sorted(rows, key=lambda row: -row["n"])
+    return report
+
+
+def _finite(value):
+    return float(value) if np.isfinite(value) else None
+
+
+def largest_errors(frame, y, pred, n=10):
+    # Lignes les plus mal prédites, comme le tableau affiché auparavant par model_evaluation.py
+    difference = np.abs(np.asarray(y) - np.asarray(pred))
+    top = np.argsort(difference)[::-1][:n]
+    rows = frame.iloc[top].copy()
+    rows["actual_price"] = np.asarray(y)[top].astype(int)
+    rows["predicted_price"] = np.round(np.asarray(pred)[top]).astype(int)
+    rows["difference"] = np.round(difference[top]).astype(int)
+    return rows
+
+
+def _metric_cell(entry, metric):
+    if entry["value"] is None:
+        return "–"
+    text = f"{entry['value']:.3f}" if metric == "r2" else f"{entry['value']:,.1f}"
+    if entry.get("ci_low") is not None:
+        text += f" <small>[{entry['ci_low']:,.2f} ; {entry['ci_high']:,.2f}]</small>"
+    return text
+
+
+def _metrics_table(rows):
+    header = "".join(f"<th>{metric.upper()}</th>" for metric in METRICS)
+    body = "".join(
+        f"<tr><td>{html.escape(row['group'])}</td><td>{row['n']}</td>"
+        + "".join(f"<td>{_metric_cell(row[metric], metric)}</td>" for metric in METRICS)
+        + "</tr>"
+        for row in rows
+    )
+    return f"<table><tr><th>Groupe</th><th>n</th>{header}</tr>{body}</table>"
+
+
+def render_html(report, images, title):
+    """Rapport HTML autonome : tableaux des métriques et graphiques PNG intégrés en base64."""
+    sections = [f"<h1>{html.escape(title)}</h1>", f"<p>{html.escape(json.dumps(report['meta'], ensure_ascii=False))}</p>"]
+    sections.append("<h2>Global</h2>" + _metrics_table([report["metrics"]["overall"]]))
+    for name, image in images.items():
+        encoded = base64.b64encode(image).decode()
+        sections.append(f'<h2>{html.escape(name)}</h2><img src="data:image/png;base64,{encoded}">')
+    for name in SLICES:
+        sections.append(f"<h2>Par {name}</h2>" + _metrics_table(report["metrics"][name]))
+    style = "body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:4px 8px;text-align:right}img{max-width:100%}"
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title><style>{style}</style></head><body>{''.join(sections)}</body></html>"
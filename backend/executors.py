@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from explainer import ExplanationEngine, encode_background, load_background
+from model_loader import load_model
+from model_state import model_encoder
+from plots import render_waterfall
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    # File d'attente pleine : la requête est refusée plutôt que de laisser la latence grandir
+    def __init__(self, pool_name, retry_after):
+        super().__init__(f"Le pool {pool_name} est saturé, réessayez plus tard.")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class BoundedPool:
+    """Pool d'exécution borné pour le travail CPU des endpoints.
+
+    Au plus `max_workers` tâches s'exécutent en parallèle et au plus `max_queue`
+    attendent leur tour ; au-delà, `run` lève `PoolSaturated`. Les compteurs ne sont
+    modifiés que depuis la boucle d'événements, sans verrou.
+    """
+
+    def __init__(self, name, kind, max_workers, max_queue, retry_after, initializer=None, initargs=()):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._initializer = initializer
+        self.executor = self._create_executor(initargs)
+
+    @property
+    def uses_processes(self):
+        return self.kind == "process"
+
+    def _create_executor(self, initargs):
+        # Gardés pour recréer les processus si le pool est cassé
+        self._initargs = initargs
+        if self.uses_processes:
+            # "spawn" : les processus ne doivent pas hériter des threads de la boucle uvicorn
+            return ProcessPoolExecutor(
+                self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self._initializer,
+                initargs=initargs,
+            )
+        return ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.name)
+
+    def check_capacity(self):
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PoolSaturated(self.name, self.retry_after)
+
+    async def run(self, fn, *args):
+        self.check_capacity()
+        self.pending += 1
+        call = functools.partial(fn, *args)
+        if not self.uses_processes:
+            # Propager le contexte (endpoint en cours pour les métriques) au thread de travail
+            call = functools.partial(contextvars.copy_context().run, call)
+        try:
+            result = await self._submit(call)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        return result
+
+    async def _submit(self, call):
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, call)
+        except BrokenProcessPool:
+            # Un processus est mort (mémoire épuisée, échec du chargement du modèle à l'initialisation) :
+            # le pool est recréé avec les mêmes paramètres et la tâche relancée une fois
+            if self.executor is executor:
+                logger.warning("Pool %s cassé, processus recréés", self.name)
+                self.reset(self._initargs)
+            return await loop.run_in_executor(self.executor, call)
+
+    def reset(self, initargs=()):
+        # Nouveaux processus (par exemple après un changement de modèle) ; les tâches en cours terminent sur les anciens
+        old_executor = self.executor
+        self.executor = self._create_executor(initargs)
+        old_executor.shutdown(wait=False)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self.pending, self.max_workers),
+            "queued": max(0, self.pending - self.max_workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+# Moteur d'explication propre à chaque processus du pool, chargé une fois au démarrage du processus
+_worker_engine = None
+
+
+def init_explain_worker(model_uri, source, snapshot_dir, tracking_uri, data_path, background_size, kernel_background_size):
+    global _worker_engine
+    model, _, _ = load_model(model_uri, source, snapshot_dir, tracking_uri)
+    _worker_engine = ExplanationEngine(
+        model,
+        encode_background(load_background(data_path, background_size), model_encoder(model)),
+        kernel_background_size=kernel_background_size,
+    )
+    logger.info(f"Processus d'explication prêt pour {model_uri} ({_worker_engine.kind})")
+
+
+def explain_rows(engine, input_data):
+    # `engine` vaut None dans un processus du pool : le moteur local au processus est utilisé
+    engine = engine if engine is not None else _worker_engine
+    return engine.base_value, engine.shap_values(input_data)
+
+
+def render_explanation(engine, input_data, columns, image_format):
+    base_value, shap_values = explain_rows(engine, input_data)
+    return render_waterfall(base_value, shap_values[0], input_data.iloc[0].tolist(), columns, image_format=image_format)
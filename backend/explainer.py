@@ -0,0 +1,135 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+
+from features import FEATURE_COLUMNS, encode_frame
+from model_loader import unwrap_sklearn_pipeline
+
+
+logger = logging.getLogger(__name__)
+
+# Ordre des colonnes dans les réponses d'explication
+EXPLAIN_COLUMNS = ["year", "km_driven", "fuel", "seller_type", "transmission", "owner", "brand"]
+
+# Types des colonnes encodées transmises à l'explainer
+EXPLAIN_DTYPES = {
+    "year": "int",
+    "km_driven": "int",
+    "fuel": "int",
+    "seller_type": "int",
+    "transmission": "int",
+    "owner": "int",
+    "brand": "str",
+}
+
+
+def explain_frame(row):
+    """DataFrame d'une ligne encodée, avec les colonnes et les types attendus par l'explainer."""
+    return pd.DataFrame([row]).astype(EXPLAIN_DTYPES)[EXPLAIN_COLUMNS]
+
+
+def load_background(path, size, random_state=42):
+    """Tire un échantillon de fond représentatif depuis le jeu de données brut, avec les libellés d'origine.
+
+    Chaque modèle l'encode ensuite avec son propre encodeur (`encode_background`).
+    """
+    df = pd.read_csv(path)
+    df["brand"] = df["name"].str.split().str[0]
+    raw = df[FEATURE_COLUMNS]
+    # Seules les lignes aux libellés connus sont tirées
+    _, errors = encode_frame(raw)
+    raw = raw.drop(index=list(errors))
+    return raw.sample(n=min(size, len(raw)), random_state=random_state).reset_index(drop=True)
+
+
+def encode_background(background, encoder):
+    encoded, _ = encoder.encode_frame(background)
+    return encoded[EXPLAIN_COLUMNS].reset_index(drop=True)
+
+
+def input_column_map(column_transformer, columns):
+    """Associe chaque colonne transformée à l'indice de la colonne d'entrée dont elle provient."""
+    mapping = {}
+    for name, transformer, transformer_columns in column_transformer.transformers_:
+        if transformer == "drop" or len(transformer_columns) == 0:
+            continue
+        output = column_transformer.output_indices_[name]
+        names = [columns[c] if isinstance(c, (int, np.integer)) else c for c in transformer_columns]
+        width = output.stop - output.start
+        if width == len(names):
+            for offset, column in enumerate(names):
+                mapping[output.start + offset] = columns.index(column)
+        elif len(names) == 1:
+            for position in range(output.start, output.stop):
+                mapping[position] = columns.index(names[0])
+        else:
+            raise ValueError(f"Impossible d'attribuer les sorties du transformateur {name} aux colonnes d'entrée.")
+    return mapping
+
+
+class ExplanationEngine:
+    """Moteur d'explication SHAP, construit une seule fois par modèle.
+
+    Pour un pipeline `ColumnTransformer` + forêt, les valeurs SHAP sont calculées
+    avec `shap.TreeExplainer` sur la forêt puis ramenées aux colonnes d'entrée.
+    Les autres modèles utilisent `shap.KernelExplainer` en solution de repli.
+    """
+
+    def __init__(self, model, background, kernel_background_size=10):
+        self.model = model
+        self.background = background
+        self.kind = None
+
+        pipeline = unwrap_sklearn_pipeline(model)
+        if pipeline is not None:
+            try:
+                self._init_tree(pipeline)
+            except Exception as e:
+                logger.warning(f"TreeExplainer indisponible, repli sur KernelExplainer : {e}")
+        if self.kind is None:
+            self._init_kernel(kernel_background_size)
+
+    def _init_tree(self, pipeline):
+        # Import au premier moteur construit : shap charge numba et LLVM (plusieurs secondes, des centaines de Mo)
+        import shap
+
+        column_transformer = pipeline[0]
+        if len(pipeline) != 2 or not isinstance(column_transformer, ColumnTransformer):
+            raise ValueError("Le pipeline doit être composé d'un ColumnTransformer suivi d'un modèle d'arbres.")
+
+        self.preprocessor = column_transformer
+        self.column_map = input_column_map(column_transformer, EXPLAIN_COLUMNS)
+        self.explainer = shap.TreeExplainer(
+            pipeline[-1],
+            data=column_transformer.transform(self.background),
+            feature_perturbation="interventional",
+        )
+        self.kind = "tree"
+
+    def _init_kernel(self, kernel_background_size):
+        import shap
+
+        def predict_dataframe(data):
+            data = pd.DataFrame(data, columns=EXPLAIN_COLUMNS).astype(self.background.dtypes.to_dict())
+            return self.model.predict(data)
+
+        self.explainer = shap.KernelExplainer(predict_dataframe, self.background.iloc[:kernel_background_size])
+        self.kind = "kernel"
+
+    @property
+    def base_value(self):
+        return float(np.ravel(self.explainer.expected_value)[0])
+
+    def shap_values(self, input_data):
+        """Retourne une matrice (lignes, EXPLAIN_COLUMNS) de contributions SHAP."""
+        input_data = input_data[EXPLAIN_COLUMNS]
+        if self.kind == "kernel":
+            return np.asarray(self.explainer.shap_values(input_data))
+
+        transformed_values = np.asarray(self.explainer.shap_values(self.preprocessor.transform(input_data)))
+        values = np.zeros((len(input_data), len(EXPLAIN_COLUMNS)))
+        for position, column in self.column_map.items():
+            values[:, column] += transformed_values[:, position]
+        return values
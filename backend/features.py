@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+
+# Mappings pour `fuel`, `transmission`, `owner` et `seller_type`
+FUEL_MAPPING = {"Diesel": 0, "Petrol": 1, "LPG": 2, "CNG": 3, "Electric": 4}
+TRANSMISSION_MAPPING = {"Automatic": 0, "Manual": 1}
+
+OWNER_MAPPING = {
+    "First Owner": 0,
+    "Second Owner": 1,
+    "Third Owner": 2,
+    "Fourth & Above Owner": 3,
+    "Test Drive Car": 4,
+}
+SELLER_TYPE_MAPPING = {
+    "Dealer": 0,
+    "Individual": 1,
+    "Trustmark Dealer": 2,
+}
+
+CATEGORICAL_MAPPINGS = {
+    "fuel": FUEL_MAPPING,
+    "transmission": TRANSMISSION_MAPPING,
+    "owner": OWNER_MAPPING,
+    "seller_type": SELLER_TYPE_MAPPING,
+}
+
+# Libellés utilisés dans les messages d'erreur
+FIELD_LABELS = {
+    "fuel": "Fuel",
+    "transmission": "Transmission",
+    "owner": "Owner",
+    "seller_type": "Seller Type",
+}
+
+
+# Définir le schéma d'entrée avec toutes les colonnes
+class CarFeatures(BaseModel):
+    year: int
+    km_driven: int
+    fuel: str
+    transmission: str
+    owner: str
+    seller_type: str
+    brand: str
+
+
+# Ordre des colonnes attendu par le modèle
+FEATURE_COLUMNS = ["year", "km_driven", "fuel", "transmission", "owner", "seller_type", "brand"]
+
+
+class FeatureEncoder:
+    """Encodage des libellés catégoriels en codes du modèle, défini une seule fois.
+
+    Chaque colonne est compilée en un index pandas (table de hachage) et un tableau de
+    codes : un lot entier est encodé par une recherche vectorisée par colonne. L'encodeur
+    est enregistré avec le modèle (`attach_encoder`) : l'API sert chaque modèle avec
+    l'encodage utilisé à son entraînement.
+    """
+
+    def __init__(self, mappings=None):
+        self.mappings = {column: dict(mapping) for column, mapping in (mappings or CATEGORICAL_MAPPINGS).items()}
+        self._labels = {column: pd.Index(list(mapping)) for column, mapping in self.mappings.items()}
+        self._codes = {column: np.array(list(mapping.values())) for column, mapping in self.mappings.items()}
+
+    def invalid_value_message(self, column, value):
+        return f"{FIELD_LABELS.get(column, column)} invalide : {value}. Valeurs possibles : {list(self.mappings[column].keys())}"
+
+    def encode_values(self, column, values):
+        """Codes des valeurs d'une colonne et masque des valeurs connues (le code d'une valeur inconnue n'a pas de sens)."""
+        positions = self._labels[column].get_indexer(values)
+        return self._codes[column][positions], positions >= 0
+
+    def encode_record(self, record):
+        """Encode une seule ligne {colonne: valeur} ; lève ValueError à la première valeur inconnue."""
+        row = dict(record)
+        for column, mapping in self.mappings.items():
+            code = mapping.get(row[column])
+            if code is None:
+                raise ValueError(self.invalid_value_message(column, row[column]))
+            row[column] = code
+        # Marque normalisée ici, pour tous les chemins : prédiction, lots, explications, grille de prix et clés de cache
+        row["brand"] = row["brand"].strip()
+        return row
+
+    def encode_frame(self, raw):
+        """Encode les colonnes catégorielles d'un DataFrame brut en une seule passe par colonne.
+
+        Retourne le DataFrame encodé (lignes valides uniquement, index conservé) et un
+        dictionnaire {index: message} pour les lignes contenant une valeur inconnue.
+        """
+        encoded = raw.copy()
+        errors = {}
+        valid = np.ones(len(raw), dtype=bool)
+
+        for column in self.mappings:
+            codes, known = self.encode_values(column, raw[column])
+            for position in np.flatnonzero(~known & valid):
+                index = raw.index[position]
+                errors[index] = self.invalid_value_message(column, raw.at[index, column])
+            valid &= known
+            encoded[column] = codes
+
+        encoded = encoded[valid]
+        encoded = encoded.astype({"year": "int64", "km_driven": "int64", "brand": "str"})
+        encoded["brand"] = encoded["brand"].str.strip()
+        return encoded[FEATURE_COLUMNS], errors
+
+    def to_dict(self):
+        return {"mappings": self.mappings}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["mappings"])
+
+
+# Encodeur de référence, utilisé à l'entraînement et pour les modèles enregistrés sans encodeur
+DEFAULT_ENCODER = FeatureEncoder()
+
+# Encodeur des pipelines qui encodent eux-mêmes les libellés (OneHot) : les valeurs sont validées
+# puis transmises telles quelles au modèle
+LABEL_ENCODER = FeatureEncoder({column: {label: label for label in mapping} for column, mapping in CATEGORICAL_MAPPINGS.items()})
+
+# Attribut du pipeline sklearn portant l'encodeur (un simple dictionnaire, sans dépendance à ce module)
+ENCODER_ATTRIBUTE = "feature_encoder_"
+
+
+def attach_encoder(pipeline, encoder=DEFAULT_ENCODER):
+    # L'encodeur est sérialisé avec le pipeline : artefact MLflow, snapshot local ou fichier joblib
+    setattr(pipeline, ENCODER_ATTRIBUTE, encoder.to_dict())
+    return pipeline
+
+
+def encoder_from_pipeline(pipeline):
+    """Encodeur enregistré avec le pipeline, ou None pour un modèle antérieur à l'encodeur partagé."""
+    data = getattr(pipeline, ENCODER_ATTRIBUTE, None) if pipeline is not None else None
+    return FeatureEncoder.from_dict(data) if data is not None else None
+
+
+def invalid_value_message(column, value):
+    return DEFAULT_ENCODER.invalid_value_message(column, value)
+
+
+def encode_frame(raw):
+    return DEFAULT_ENCODER.encode_frame(raw)
@@ -0,0 +1,151 @@
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import OrdinalEncoder
+
+
+class UnsupportedModel(ValueError):
+    # Pipeline hors du périmètre du moteur compilé : l'appelant se replie sur le modèle d'origine
+    pass
+
+
+class CompiledForest:
+    """Moteur d'inférence compilé pour un pipeline `ColumnTransformer` + forêt de régression.
+
+    Le prétraitement (moyennes de l'imputer, tables de l'OrdinalEncoder) est précalculé
+    et tous les arbres sont rangés dans des tableaux NumPy contigus (variables, seuils,
+    enfants, valeurs). Les lignes sont évaluées par un parcours vectorisé de tous les
+    arbres à la fois, avec les mêmes conversions de types que sklearn, ce qui donne des
+    prédictions identiques à `pipeline.predict`.
+    """
+
+    def __init__(self, pipeline):
+        column_transformer, forest = pipeline[0], pipeline[-1]
+        if len(pipeline) != 2 or not isinstance(column_transformer, ColumnTransformer):
+            raise UnsupportedModel("Le pipeline doit être composé d'un ColumnTransformer suivi d'une forêt.")
+        if not isinstance(forest, (RandomForestRegressor, ExtraTreesRegressor)) or forest.n_outputs_ != 1:
+            raise UnsupportedModel(f"Modèle non pris en charge : {type(forest).__name__}")
+
+        self.input_columns = list(column_transformer.feature_names_in_)
+        self.steps = [
+            self._compile_step(transformer, columns)
+            for name, transformer, columns in column_transformer.transformers_
+            if transformer != "drop" and len(columns) > 0
+        ]
+        self._compile_trees(forest.estimators_)
+
+    def _compile_step(self, transformer, columns):
+        columns = [self.input_columns[c] if isinstance(c, (int, np.integer)) else c for c in columns]
+
+        if transformer == "passthrough":
+            return ("passthrough", columns, None)
+
+        if isinstance(transformer, SimpleImputer):
+            statistics = np.asarray(transformer.statistics_)
+            if transformer.add_indicator or statistics.dtype == object or np.isnan(statistics).any():
+                raise UnsupportedModel("Configuration de SimpleImputer non prise en charge.")
+            return ("impute", columns, statistics.astype(np.float64))
+
+        if isinstance(transformer, OrdinalEncoder):
+            if transformer.handle_unknown == "use_encoded_value":
+                unknown_value = float(transformer.unknown_value)
+            else:
+                unknown_value = None
+            tables = []
+            for categories in transformer.categories_:
+                # Tables triées pour un encodage par recherche dichotomique
+                order = np.argsort(categories)
+                tables.append((np.asarray(categories)[order], order.astype(np.float64)))
+            return ("ordinal", columns, (tables, unknown_value))
+
+        raise UnsupportedModel(f"Transformateur non pris en charge : {type(transformer).__name__}")
+
+    def _compile_trees(self, estimators):
+        lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            # Une feuille pointe sur elle-même : le parcours peut continuer sans masque
+            lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.feature = np.concatenate(features).astype(np.intp)
+        # Seuils en float32, deux fois moins de mémoire sans changer les décisions (voir `float32_floor`)
+        self.threshold = float32_floor(np.concatenate(thresholds))
+        value = np.concatenate(values).astype(np.float64)
+        # Valeurs gardées en float32 seulement si elles y sont exactes (modèle quantifié, voir compaction.py)
+        self.value = value.astype(np.float32) if np.array_equal(value.astype(np.float32), value) else value
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = max_depth
+        self.n_trees = len(roots)
+
+    def transform(self, data):
+        """Reproduit la sortie du ColumnTransformer ; `data` est un DataFrame ou un dict de colonnes."""
+        outputs = []
+        for kind, columns, params in self.steps:
+            for position, column in enumerate(columns):
+                values = np.asarray(data[column])
+                if kind == "passthrough":
+                    outputs.append(values.astype(np.float64))
+                elif kind == "impute":
+                    values = values.astype(np.float64)
+                    outputs.append(np.where(np.isnan(values), params[position], values))
+                else:
+                    tables, unknown_value = params
+                    categories, codes = tables[position]
+                    values = values.astype(categories.dtype)
+                    index = np.searchsorted(categories, values).clip(0, len(categories) - 1)
+                    known = categories[index] == values
+                    if unknown_value is None and not known.all():
+                        raise ValueError(f"Catégorie inconnue pour la colonne {column}.")
+                    outputs.append(np.where(known, codes[index], np.nan if unknown_value is None else unknown_value))
+        return np.column_stack(outputs)
+
+    def iter_levels(self, data):
+        """Nœud atteint dans chaque arbre (tableau lignes x arbres) après 0, 1, 2… niveaux de parcours.
+
+        Un arbre coupé à la profondeur d prédit la valeur du nœud atteint au niveau d.
+        """
+        # Comme sklearn : variables converties en float32 avant comparaison aux seuils
+        X = self.transform(data).astype(np.float32).astype(np.float64)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        yield node
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+            yield node
+
+    def predict(self, data):
+        for node in self.iter_levels(data):
+            pass
+
+        # Accumulation arbre par arbre, dans le même ordre que RandomForestRegressor.predict
+        leaf_values = self.value[node].astype(np.float64)
+        prediction = np.zeros(len(node))
+        for tree in range(self.n_trees):
+            prediction += leaf_values[:, tree]
+        prediction /= self.n_trees
+        return prediction
+
+
+def float32_floor(values):
+    """Plus grand float32 inférieur ou égal à chaque valeur.
+
+    Les variables étant converties en float32 avant comparaison, `x <= seuil` et
+    `x <= float32_floor(seuil)` sont équivalents pour toute valeur d'entrée.
+    """
+    rounded = values.astype(np.float32)
+    return np.where(rounded > values, np.nextafter(rounded, np.float32(-np.inf)), rounded)
@@ -0,0 +1,455 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+from executors import PoolSaturated
+from metrics import current_endpoint
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+TERMINAL_STATES = ("done", "failed")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def job_key(kind, payload, model_version):
+    # Deux requêtes identiques sur le même modèle ont le même résultat
+    return hashlib.sha256(json.dumps([kind, payload, model_version], sort_keys=True).encode()).hexdigest()
+
+
+class JobStore:
+    """Jobs et résultats sur disque, un fichier JSON par job et un par résultat.
+
+    Les écritures sont atomiques (fichier temporaire puis renommage). Un job terminé
+    expire `ttl` secondes après sa fin : il est alors considéré comme inconnu, et
+    ses fichiers sont supprimés par `purge`.
+
+    Le dossier peut être partagé par plusieurs workers uvicorn. Un job n'est exécuté que
+    par le processus qui détient son bail (`claim`), et l'index des jobs non terminés
+    (`claim_key`) évite de recréer un job identique soumis à un autre worker.
+    """
+
+    def __init__(self, directory, ttl, lease_timeout=60):
+        self.directory = directory
+        self.ttl = ttl
+        self.lease_timeout = lease_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, suffix=""):
+        return os.path.join(self.directory, f"{job_id}{suffix}.json")
+
+    def _lease_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.lease")
+
+    def _write(self, path, data):
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, delete=False, suffix=".tmp") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(f.name, path)
+
+    def _create(self, path, data):
+        # Création exclusive, avec son contenu : FileExistsError si le fichier existe déjà
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, delete=False, suffix=".tmp") as f:
+            json.dump(data, f, ensure_ascii=False)
+        try:
+            os.link(f.name, path)
+        finally:
+            os.remove(f.name)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def save(self, job):
+        self._write(self._path(job["id"]), job)
+
+    def save_result(self, job_id, result):
+        self._write(self._path(job_id, ".result"), result)
+
+    def load(self, job_id):
+        job = self._read(self._path(job_id))
+        if job is None or (job.get("expires_at") is not None and job["expires_at"] < time.time()):
+            return None
+        return job
+
+    def modified(self, job_id):
+        try:
+            return os.stat(self._path(job_id)).st_mtime_ns
+        except OSError:
+            return None
+
+    def remove(self, job_id):
+        self._remove(self._path(job_id))
+        self._remove(self._lease_path(job_id))
+
+    def claim(self, job_id, owner):
+        """Prend le bail du job pour `owner` ; False s'il est détenu par un autre processus actif.
+
+        Le bail est un fichier créé en exclusivité, renouvelé par `renew`. Un bail qui n'a
+        pas été renouvelé depuis `lease_timeout` secondes, ou dont le processus s'est arrêté
+        sur cette machine, est repris.
+        """
+        path = self._lease_path(job_id)
+        for _ in range(2):
+            try:
+                self._create(path, owner)
+                return True
+            except FileExistsError:
+                if not self._break_stale_lease(path):
+                    return False
+        return False
+
+    def _lease_stale(self, path):
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return True
+        owner = self._read(path) or {}
+        if age > self.lease_timeout:
+            return True
+        # Même machine : un processus arrêté ne renouvellera plus son bail, inutile d'attendre
+        return owner.get("host") == socket.gethostname() and not _process_alive(owner.get("pid"))
+
+    def _break_stale_lease(self, path):
+        if not self._lease_stale(path):
+            return False
+        # Renommage d'abord : un seul processus peut reprendre un même bail périmé
+        broken = f"{path}.{uuid.uuid4().hex}"
+        try:
+            os.rename(path, broken)
+        except FileNotFoundError:
+            return True
+        if not self._lease_stale(broken):
+            # Bail repris et renouvelé entre-temps par un autre processus : il est remis en place
+            try:
+                os.link(broken, path)
+            except FileExistsError:
+                pass
+            os.remove(broken)
+            return False
+        os.remove(broken)
+        return True
+
+    def holds(self, job_id, owner):
+        lease = self._read(self._lease_path(job_id))
+        return lease is not None and lease.get("id") == owner["id"]
+
+    def renew(self, job_id):
+        try:
+            os.utime(self._lease_path(job_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def release(self, job_id):
+        self._remove(self._lease_path(job_id))
+
+    def _key_path(self, key):
+        return os.path.join(self.directory, f"{key}.key")
+
+    def claim_key(self, key, job_id):
+        """Enregistre `job_id` comme job de la clé `key` ; False si un job la détient déjà."""
+        try:
+            self._create(self._key_path(key), job_id)
+            return True
+        except FileExistsError:
+            return False
+
+    def key_owner(self, key):
+        return self._read(self._key_path(key))
+
+    def replace_key(self, key, job_id):
+        self._write(self._key_path(key), job_id)
+
+    def release_key(self, key, job_id):
+        if self.key_owner(key) == job_id:
+            self._remove(self._key_path(key))
+
+    def load_result(self, job_id):
+        with open(self._path(job_id, ".result")) as f:
+            return json.load(f)
+
+    def iter_jobs(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") and not name.endswith(".result.json"):
+                job = self.load(name[:-len(".json")])
+                if job is not None:
+                    yield job
+
+    def purge(self):
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name.endswith(".result.json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    expires_at = json.load(f).get("expires_at")
+            except (OSError, ValueError):
+                continue
+            if expires_at is not None and expires_at < now:
+                for expired in (path, self._path(name[:-len(".json")], ".result")):
+                    self._remove(expired)
+                removed += 1
+        return removed
+
+
+def _process_alive(pid):
+    if not isinstance(pid, int) or os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """File de jobs locale, sans broker : priorités, déduplication et workers bornés.
+
+    Les jobs attendent dans une file à priorités (à priorité égale, dans l'ordre d'arrivée)
+    et `max_workers` tâches asyncio les exécutent. Un job identique à un job en attente ou
+    en cours (même type, même contenu, même modèle) n'est pas recréé : son identifiant est
+    renvoyé. Au-delà de `max_queue` jobs en attente, `submit` lève `PoolSaturated`.
+
+    Chaque processus détient le bail des jobs qu'il a acceptés et le renouvelle toutes les
+    `lease_timeout / 4` secondes. Les jobs dont le bail est libre ou périmé (arrêt de l'API,
+    worker disparu) sont repris au démarrage, puis à chaque renouvellement.
+    """
+
+    def __init__(self, store, handlers, max_workers, max_queue, retry_after, purge_interval=60, poll_interval=0.5):
+        self.store = store
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.purge_interval = purge_interval
+        self.poll_interval = poll_interval
+        self.lease_interval = store.lease_timeout / 4
+        self.owner = {"id": uuid.uuid4().hex, "host": socket.gethostname(), "pid": os.getpid()}
+        self.submitted = 0
+        self.deduplicated = 0
+        self.recovered = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue = None
+        self._order = itertools.count()
+        # Jobs dont ce processus détient le bail : en attente ou en cours ici
+        self._leases = set()
+        self._changed = {}
+        self._tasks = []
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._recover(self.store.iter_jobs())
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.max_workers)]
+        self._tasks += [loop.create_task(self._purge_loop()), loop.create_task(self._lease_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Baux rendus : un autre worker reprend aussitôt les jobs non terminés
+        for job_id in self._leases:
+            self.store.release(job_id)
+        self._leases.clear()
+
+    def _enqueue(self, job):
+        self._leases.add(job["id"])
+        self._queue.put_nowait((PRIORITIES[job["priority"]], next(self._order), job["id"]))
+
+    def _recover(self, jobs):
+        """Reprend les jobs non terminés dont aucun processus actif ne détient le bail."""
+        recovered = 0
+        for job in sorted(jobs, key=lambda job: job["created_at"]):
+            if job["status"] in TERMINAL_STATES or job["id"] in self._leases:
+                continue
+            job_id = job["id"]
+            if not self.store.claim(job_id, self.owner):
+                continue
+            # Relu après la prise du bail : le job a pu se terminer entre-temps
+            job = self.store.load(job_id)
+            if job is None or job["status"] in TERMINAL_STATES:
+                self.store.release(job_id)
+                continue
+            job["status"] = "queued"
+            self.store.save(job)
+            self._enqueue(job)
+            recovered += 1
+        if recovered:
+            self.recovered += recovered
+            logger.info("%s jobs repris", recovered)
+
+    def submit(self, kind, payload, priority, model_version):
+        """Crée un job (ou retrouve le job identique en cours) ; retourne le job et True s'il existait déjà."""
+        if kind not in self.handlers:
+            raise ValueError(f"Type de job invalide : {kind}. Valeurs possibles : {list(self.handlers)}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priorité invalide : {priority}. Valeurs possibles : {list(PRIORITIES)}")
+
+        key = job_key(kind, payload, model_version)
+        existing = self._find_existing(key)
+        if existing is not None:
+            self.deduplicated += 1
+            return existing, True
+
+        if self._queue.qsize() >= self.max_queue:
+            raise PoolSaturated("jobs", self.retry_after)
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "priority": priority,
+            "status": "queued",
+            "key": key,
+            "payload": payload,
+            "model_version": model_version,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "expires_at": None,
+            "error": None,
+        }
+        # Bail pris avant l'écriture du job : un autre worker ne le voit jamais sans propriétaire
+        self.store.claim(job["id"], self.owner)
+        self.store.save(job)
+        if not self.store.claim_key(key, job["id"]):
+            existing = self._find_existing(key)
+            if existing is not None:
+                # Job identique soumis au même moment à un autre worker
+                self.store.remove(job["id"])
+                self.deduplicated += 1
+                return existing, True
+            # Clé laissée par un job terminé ou expiré
+            self.store.replace_key(key, job["id"])
+        self._enqueue(job)
+        self.submitted += 1
+        return job, False
+
+    def _find_existing(self, key):
+        job_id = self.store.key_owner(key)
+        job = self.store.load(job_id) if job_id is not None else None
+        if job is not None and job["status"] not in TERMINAL_STATES:
+            return job
+        return None
+
+    def _update(self, job, **changes):
+        job.update(changes)
+        self.store.save(job)
+        # Réveiller les clients qui attendent un changement d'état de ce job
+        event = self._changed.pop(job["id"], None)
+        if event is not None:
+            event.set()
+
+    async def _run(self, job):
+        handler = self.handlers[job["kind"]]
+        while True:
+            try:
+                return await handler(job["payload"])
+            except PoolSaturated:
+                # Les requêtes HTTP directes sont prioritaires : le job attend que le pool se libère
+                await asyncio.sleep(self.retry_after)
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.store.load(job_id)
+            if job is None or job["status"] in TERMINAL_STATES or not self.store.holds(job_id, self.owner):
+                # Bail perdu (non renouvelé à temps) : le job appartient désormais à un autre processus
+                self._leases.discard(job_id)
+                continue
+            current_endpoint.set(f"job:{job['kind']}")
+            self._update(job, status="running", started_at=_now())
+            try:
+                result = await self._run(job)
+                await asyncio.get_running_loop().run_in_executor(None, self.store.save_result, job["id"], result)
+                self.completed += 1
+                status, error = "done", None
+            except asyncio.CancelledError:
+                raise
+            except ValueError as e:
+                self.failed += 1
+                status, error = "failed", str(e)
+            except Exception as e:
+                logger.error("Job %s en échec : %s", job["id"], e)
+                self.failed += 1
+                status, error = "failed", "Erreur interne du serveur."
+            self._update(job, status=status, error=error, finished_at=_now(), expires_at=time.time() + self.store.ttl)
+            self.store.release_key(job["key"], job["id"])
+            self.store.release(job["id"])
+            self._leases.discard(job["id"])
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            removed = await asyncio.get_running_loop().run_in_executor(None, self.store.purge)
+            if removed:
+                logger.info("%s jobs expirés supprimés", removed)
+
+    async def _lease_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.lease_interval)
+            for job_id in list(self._leases):
+                if not self.store.renew(job_id):
+                    self._leases.discard(job_id)
+            self._recover(await loop.run_in_executor(None, lambda: list(self.store.iter_jobs())))
+
+    async def wait_for_change(self, job_id, timeout):
+        """Attend au plus `timeout` secondes un changement d'état du job.
+
+        Un job exécuté dans ce processus réveille l'attente aussitôt. Un job exécuté par un
+        autre worker est suivi par la date de modification de son fichier, relue toutes les
+        `poll_interval` secondes.
+        """
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        modified = self.store.modified(job_id)
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(event.wait(), min(deadline - time.monotonic(), self.poll_interval))
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                if self.store.modified(job_id) != modified:
+                    return
+        finally:
+            if self._changed.get(job_id) is event:
+                del self._changed[job_id]
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._leases),
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "recovered": self.recovered,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -1,16 +1,90 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Match
 import pandas as pd
-import mlflow.pyfunc
+import json
+from collections import deque
 import logging
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from pydantic import BaseModel, ValidationError
 from fastapi.middleware.cors import CORSMiddleware
-import shap
-import matplotlib.pyplot as plt
+
+from config import (
+    PREDICT_BATCH_MAX_CHUNK,
+    PREDICT_BATCHING_ENABLED,
+    PREDICT_BATCH_WINDOW_MS,
+    PREDICT_BATCH_MAX_SIZE,
+    DATA_PATH,
+    EXPLAIN_BACKGROUND_SIZE,
+    EXPLAIN_KERNEL_BACKGROUND_SIZE,
+    EXPLAIN_PRELOAD,
+    EXPLAIN_BATCH_MAX_CHUNK,
+    EXPLAIN_VISUAL_CACHE_SIZE,
+    PREDICT_CACHE_ENABLED,
+    PREDICT_CACHE_SIZE,
+    PREDICT_CACHE_TTL,
+    INFERENCE_ENGINE,
+    ONNX_MODEL_DIR,
+    ONNX_INTRA_OP_THREADS,
+    MODEL_URI,
+    SERVED_MODELS,
+    MODEL_TRAFFIC_SPLIT,
+    SHADOW_MODELS,
+    MODEL_STATS_WINDOW,
+    MODEL_SOURCE,
+    MODEL_SNAPSHOT_DIR,
+    MLFLOW_TRACKING_URI,
+    MODEL_WATCH_FILE,
+    MODEL_WATCH_INTERVAL,
+    PREDICT_POOL_WORKERS,
+    PREDICT_POOL_MAX_QUEUE,
+    EXPLAIN_POOL_KIND,
+    EXPLAIN_POOL_WORKERS,
+    EXPLAIN_POOL_MAX_QUEUE,
+    POOL_RETRY_AFTER,
+    METRICS_ENABLED,
+    LOG_LEVEL,
+    REQUEST_LOG_SAMPLE_RATE,
+    REQUEST_LOG_PATH,
+    PRICE_GRID_ENABLED,
+    PRICE_GRID_DIR,
+    JOBS_DIR,
+    JOBS_LEASE_TIMEOUT,
+    JOBS_WORKERS,
+    JOBS_MAX_QUEUE,
+    JOBS_TTL,
+)
+from features import CarFeatures
+from batch import format_validation_error, parse_records, validate_records, iter_chunks
+from batching import MicroBatcher
+from explainer import EXPLAIN_COLUMNS, explain_frame, load_background
+from plots import IMAGE_MEDIA_TYPES
+from cache import ModelCache
+from model_state import build_model_state
+from model_registry import DEFAULT_MODEL, load_registry, parse_assignments, parse_names, parse_weights
+from metrics import (
+    REGISTRY,
+    CallbackCounter,
+    CallbackGauge,
+    current_endpoint,
+    request_duration,
+    request_started,
+    requests_in_flight,
+    stage_clock,
+)
+from request_logging import RequestLog, request_id, setup_logging, shutdown_logging
+from executors import BoundedPool, PoolSaturated, init_explain_worker, explain_rows, render_explanation
+from jobs import TERMINAL_STATES, JobQueue, JobStore
 
 
-# Configurer les logs
-logging.basicConfig(level=logging.INFO)
+# Configurer les logs : écriture dans un thread dédié, journal des requêtes échantillonné en JSON lines
+setup_logging(LOG_LEVEL, REQUEST_LOG_PATH)
 logger = logging.getLogger(__name__)
+request_log = RequestLog(REQUEST_LOG_SAMPLE_RATE)
 
 # Créer une instance de l'application FastAPI
 app = FastAPI()
@@ -24,311 +98,802 @@ app.add_middleware(
     allow_headers=["*"],  # Permettre tous les headers
 )
 
-# Configurer l'URI de MLflow et charger le modèle
-mlflow.set_tracking_uri("http://127.0.0.1:8080")
-MODEL_URI = "models:/OptimizedRandomForestModel/3"  # Mettre la version correcte de votre modèle
+# Échantillon de fond tiré des données (libellés d'origine), encodé par chaque modèle pour ses explications et sa mise en route
+background = load_background(DATA_PATH, EXPLAIN_BACKGROUND_SIZE)
+
+
+def build_state(model_uri, source=MODEL_SOURCE):
+    return build_model_state(
+        model_uri,
+        source,
+        MODEL_SNAPSHOT_DIR,
+        MLFLOW_TRACKING_URI,
+        INFERENCE_ENGINE,
+        background,
+        EXPLAIN_KERNEL_BACKGROUND_SIZE,
+        PRICE_GRID_DIR if PRICE_GRID_ENABLED else None,
+        ONNX_MODEL_DIR,
+        ONNX_INTRA_OP_THREADS,
+        EXPLAIN_PRELOAD and EXPLAIN_POOL_KIND == "thread",
+    )
+
+
+# Charger le modèle depuis le snapshot local ou le registre MLflow
 try:
-    model = mlflow.pyfunc.load_model(MODEL_URI)
-    logger.info("Modèle chargé avec succès depuis MLflow")
+    state = build_state(MODEL_URI)
+    state.swapped_at = state.loaded_at
+    logger.info("Démarrage à froid : %s", state.timings)
 except Exception as e:
     raise RuntimeError(f"Erreur lors du chargement du modèle : {e}")
 
-# Mappings pour `fuel`, `transmission`, et `brand`
-FUEL_MAPPING = {"Diesel": 0, "Petrol": 1, "LPG": 2, "CNG": 3, "Electric": 4}
-TRANSMISSION_MAPPING = {"Automatic": 0, "Manual": 1}
-
-OWNER_MAPPING = {
-    "First Owner": 0,
-    "Second Owner": 1,
-    "Third Owner": 2,
-    "Fourth & Above Owner": 3,
-    "Test Drive Car": 4,
-}
-SELLER_TYPE_MAPPING = {
-    "Dealer": 0,
-    "Individual": 1,
-    "Trustmark Dealer": 2,
-}
-
-# Définir le schéma d'entrée avec toutes les colonnes
-class CarFeatures(BaseModel):
-    year: int
-    km_driven: int
-    fuel: str
-    transmission: str
-    owner: str
-    seller_type: str
-    brand: str
+
+def load_served_models():
+    served = parse_assignments(SERVED_MODELS)
+    if DEFAULT_MODEL in served:
+        raise ValueError(f"Le nom {DEFAULT_MODEL} est réservé au modèle MODEL_URI.")
+    weights = parse_weights(MODEL_TRAFFIC_SPLIT) or None
+    return load_registry({DEFAULT_MODEL: state, **served}, build_state, weights, parse_names(SHADOW_MODELS), MODEL_STATS_WINDOW)
+
+
+# Modèles résidents : le modèle principal et les candidats, choisis par requête ou selon le partage du trafic
+try:
+    registry = load_served_models()
+except Exception as e:
+    raise RuntimeError(f"Erreur lors du chargement des modèles servis : {e}")
+
+
+def predict_frame(input_data):
+    # Toujours le modèle actif au moment de l'appel
+    return state.predict(input_data)
+
+
+# Cache des graphiques SHAP déjà rendus, indexé par les caractéristiques normalisées
+visual_cache = ModelCache(EXPLAIN_VISUAL_CACHE_SIZE, version=state.version)
+
+# Cache optionnel des prédictions, indexé par les caractéristiques mappées et la version du modèle
+prediction_cache = ModelCache(PREDICT_CACHE_SIZE, ttl=PREDICT_CACHE_TTL, version=state.version) if PREDICT_CACHE_ENABLED else None
+
+# Pools d'exécution bornés : prédictions sur des threads, explications sur des processus
+# (ou des threads) ayant chacun leur propre copie du modèle
+def explain_worker_args(model_uri):
+    return (
+        model_uri,
+        MODEL_SOURCE,
+        MODEL_SNAPSHOT_DIR,
+        MLFLOW_TRACKING_URI,
+        DATA_PATH,
+        EXPLAIN_BACKGROUND_SIZE,
+        EXPLAIN_KERNEL_BACKGROUND_SIZE,
+    )
+
+
+predict_pool = BoundedPool("predict", "thread", PREDICT_POOL_WORKERS, PREDICT_POOL_MAX_QUEUE, POOL_RETRY_AFTER)
+explain_pool = BoundedPool(
+    "explain",
+    EXPLAIN_POOL_KIND,
+    EXPLAIN_POOL_WORKERS,
+    EXPLAIN_POOL_MAX_QUEUE,
+    POOL_RETRY_AFTER,
+    initializer=init_explain_worker,
+    initargs=explain_worker_args(state.model_uri),
+)
+
+
+async def explain_engine_for(current):
+    # Les processus du pool utilisent leur propre moteur : rien à leur transmettre
+    if explain_pool.uses_processes:
+        return None
+    if current.explainer_kind is None:
+        # Première explication de ce modèle : shap et le moteur sont chargés hors de la boucle d'événements
+        await asyncio.get_running_loop().run_in_executor(None, current.load_explanation_engine)
+    return current.explanation_engine
+
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc):
+    logger.warning("%s", exc)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.on_event("shutdown")
+async def stop_pools():
+    predict_pool.shutdown()
+    explain_pool.shutdown()
+
+# Regroupement optionnel des requêtes `/predict` concurrentes
+batcher = None
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global batcher
+    if PREDICT_BATCHING_ENABLED:
+        batcher = MicroBatcher(predict_frame, PREDICT_BATCH_WINDOW_MS, PREDICT_BATCH_MAX_SIZE, executor=predict_pool.executor)
+        batcher.start()
+        logger.info("Micro-batching activé pour /predict")
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher is not None:
+        await batcher.stop()
+
+
+# Rechargement à chaud : le nouveau modèle est chargé et mis en route en arrière-plan,
+# puis activé en une seule affectation. Les requêtes en cours terminent sur l'ancien.
+reload_status = {"state": "idle"}
+model_watcher = None
+
+
+def activate_state(new_state, name=DEFAULT_MODEL):
+    global state
+    new_state.swapped_at = datetime.now(timezone.utc).isoformat()
+    registry.replace(name, new_state)
+    # Les caches et les processus d'explication ne suivent que le modèle principal
+    if name != DEFAULT_MODEL:
+        logger.info("Modèle %s actif : %s", name, new_state.version)
+        return
+    state = new_state
+    visual_cache.set_version(new_state.version)
+    if prediction_cache is not None:
+        prediction_cache.set_version(new_state.version)
+    if explain_pool.uses_processes:
+        explain_pool.reset(explain_worker_args(new_state.model_uri))
+    logger.info("Modèle actif : %s", new_state.version)
+
+
+async def reload_model(model_uri, source, name=DEFAULT_MODEL):
+    reload_status.clear()
+    reload_status.update({"state": "loading", "model": name, "model_uri": model_uri, "started_at": datetime.now(timezone.utc).isoformat()})
+    try:
+        new_state = await asyncio.get_running_loop().run_in_executor(None, build_state, model_uri, source)
+    except Exception as e:
+        logger.error("Échec du rechargement de %s : %s", model_uri, e)
+        reload_status.update({"state": "failed", "error": str(e)})
+        return
+    activate_state(new_state, name)
+    reload_status.update({"state": "done", "version": new_state.version, "swapped_at": new_state.swapped_at})
+
+
+async def watch_model_file():
+    # Le fichier surveillé contient l'URI du modèle à servir ; toute modification déclenche un rechargement
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.path.getmtime(MODEL_WATCH_FILE)
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime != last_mtime:
+            with open(MODEL_WATCH_FILE) as f:
+                model_uri = f.read().strip()
+            changed = last_mtime is not None or model_uri != state.model_uri
+            if model_uri and changed and reload_status["state"] != "loading":
+                await reload_model(model_uri, MODEL_SOURCE)
+            last_mtime = mtime
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_model_watcher():
+    global model_watcher
+    if MODEL_WATCH_FILE:
+        model_watcher = asyncio.get_running_loop().create_task(watch_model_file())
+        logger.info("Surveillance de %s pour le rechargement du modèle", MODEL_WATCH_FILE)
+
+
+@app.on_event("shutdown")
+async def stop_model_watcher():
+    if model_watcher is not None:
+        model_watcher.cancel()
+
+
+@app.on_event("shutdown")
+async def flush_logs():
+    shutdown_logging()
+
+
+class ReloadRequest(BaseModel):
+    model_uri: Optional[str] = None
+    source: Optional[str] = None
+    model: str = DEFAULT_MODEL
+
+
+# Endpoint d'administration pour charger une nouvelle version d'un modèle sans redémarrage
+@app.post("/admin/reload", status_code=202)
+async def admin_reload(request: ReloadRequest):
+    if reload_status["state"] == "loading":
+        raise HTTPException(status_code=409, detail="Un rechargement est déjà en cours.")
+    try:
+        current = registry.get(request.model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    model_uri = request.model_uri or current.model_uri
+    # Marquer le rechargement avant de rendre la main pour refuser les demandes concurrentes
+    reload_status.update({"state": "loading", "model": request.model, "model_uri": model_uri})
+    asyncio.get_running_loop().create_task(reload_model(model_uri, request.source or MODEL_SOURCE, request.model))
+    return {"message": "Rechargement lancé", "model": request.model, "model_uri": model_uri}
+
+
+@app.get("/admin/reload")
+async def get_reload_status():
+    return {"active": state.describe(), "reload": reload_status}
+
+
+class TrafficRequest(BaseModel):
+    weights: Dict[str, float]
+    shadows: List[str] = []
+
+
+# Partage du trafic et modèles shadow, modifiables sans redémarrage (montée en charge d'un candidat)
+@app.post("/admin/traffic")
+async def admin_traffic(request: TrafficRequest):
+    try:
+        registry.set_traffic(request.weights, request.shadows)
+    except ValueError as e:
+        logger.error("Erreur utilisateur : %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"weights": registry.weights, "shadows": registry.shadows}
+
+
+# Modèles résidents, partage du trafic et modèles shadow
+@app.get("/models")
+async def get_models():
+    return {"default": DEFAULT_MODEL, "weights": registry.weights, "shadows": registry.shadows, "models": registry.describe()}
 
 # Endpoint pour vérifier le statut de l'API
 @app.get("/status")
 async def get_status():
-    return {"status": "Model is ready for prediction"}
+    return {
+        "status": "Model is ready for prediction",
+        "model_source": state.source,
+        "cold_start_seconds": {
+            **{phase: round(duration, 4) for phase, duration in state.timings.items()},
+            "total": round(sum(state.timings.values()), 4),
+        },
+    }
 
 # Endpoint pour récupérer les métadonnées du modèle
 @app.get("/metadata")
 async def get_metadata():
     return {
-        "model_uri": MODEL_URI,
-        "fuel_mapping": FUEL_MAPPING,
-        "transmission_mapping": TRANSMISSION_MAPPING,
-        "owner_mapping": list(OWNER_MAPPING.keys()),
-        "seller_type_mapping": list(SELLER_TYPE_MAPPING.keys()),
+        "model_uri": state.model_uri,
+        "model_version": state.version,
+        "swapped_at": state.swapped_at,
+        "fuel_mapping": state.encoder.mappings["fuel"],
+        "transmission_mapping": state.encoder.mappings["transmission"],
+        "owner_mapping": list(state.encoder.mappings["owner"].keys()),
+        "seller_type_mapping": list(state.encoder.mappings["seller_type"].keys()),
         "brand_handling": "Directly handled by the model pipeline using OrdinalEncoder.",
+        "explainer": state.explainer_kind,
+        "inference_engine": state.inference_engine,
+        "prediction_cache": prediction_cache.stats() if prediction_cache is not None else {"enabled": False},
+        "served_models": list(registry.states),
         "status": "Modèle chargé avec succès"
     }
 
+# Endpoint pour suivre les statistiques de service
+@app.get("/stats")
+async def get_stats():
+    return {
+        "batching": batcher.stats() if batcher is not None else {"enabled": False},
+        "prediction_cache": prediction_cache.stats() if prediction_cache is not None else {"enabled": False},
+        "price_grid": state.price_grid.stats() if state.price_grid is not None else {"enabled": False},
+        "visual_cache": visual_cache.stats(),
+        "pools": {"predict": predict_pool.stats(), "explain": explain_pool.stats()},
+        "jobs": job_queue.stats(),
+        "models": registry.stats(),
+    }
+
+# Identifiant fourni par le client, repris dans le journal des requêtes
+@app.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    request_id.set(request.headers.get("x-request-id"))
+    return await call_next(request)
+
+
+# Métriques au format d'exposition texte Prometheus
+def route_template(scope):
+    # Gabarit de la route (et non le chemin brut) pour borner le nombre de séries
+    for route in app.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.path
+    return "other"
+
+
+if METRICS_ENABLED:
+    @app.middleware("http")
+    async def track_requests(request: Request, call_next):
+        endpoint = route_template(request.scope)
+        current_endpoint.set(endpoint)
+        request_started.set(time.perf_counter())
+        requests_in_flight.inc(endpoint)
+        status = "500"
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            requests_in_flight.dec(endpoint)
+            request_duration.observe(endpoint, status, value=time.perf_counter() - request_started.get())
+
+
+def model_load_metrics():
+    return [((current.model_uri, phase), duration) for current in registry.unique_states() for phase, duration in current.timings.items()]
+
+
+def cache_stats():
+    caches = {"visual": visual_cache, "prediction": prediction_cache, "price_grid": state.price_grid}
+    return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+
+def cache_lookup_metrics():
+    return [((name, stat), stats[stat]) for name, stats in cache_stats().items() for stat in ("hits", "misses")]
+
+
+def cache_metrics():
+    return [((name, "hit_rate"), stats["hit_rate"]) for name, stats in cache_stats().items()]
+
+
+def pool_task_metrics():
+    return [((pool.name, key), pool.stats()[key]) for pool in (predict_pool, explain_pool) for key in ("completed", "failed", "rejected")]
+
+
+def pool_metrics():
+    return [((pool.name, key), pool.stats()[key]) for pool in (predict_pool, explain_pool) for key in ("in_flight", "queued")]
+
+
+REGISTRY.register(CallbackGauge("autopredict_model_load_seconds", "Durée de chargement des modèles résidents par phase.", ["model_uri", "phase"], model_load_metrics))
+REGISTRY.register(CallbackCounter(
+    "autopredict_model_predictions",
+    "Lignes notées, erreurs et shadows abandonnés, par modèle et par rôle.",
+    ["model", "role", "stat"],
+    registry.counter_samples,
+))
+REGISTRY.register(CallbackGauge(
+    "autopredict_model_predictions",
+    "Prédiction moyenne et écart au modèle servi, par modèle et par rôle.",
+    ["model", "role", "stat"],
+    registry.gauge_samples,
+))
+REGISTRY.register(CallbackCounter("autopredict_cache_lookups", "Succès et échecs des caches.", ["cache", "stat"], cache_lookup_metrics))
+REGISTRY.register(CallbackGauge("autopredict_cache", "Taux de succès des caches.", ["cache", "stat"], cache_metrics))
+
+
+def batching_metrics():
+    return [((), batcher.stats()["queue_depth"])] if batcher is not None else []
+
+
+REGISTRY.register(CallbackCounter("autopredict_pool_tasks", "Tâches terminées, en échec et refusées par pool d'exécution.", ["pool", "stat"], pool_task_metrics))
+REGISTRY.register(CallbackGauge("autopredict_pool", "Occupation des pools d'exécution.", ["pool", "stat"], pool_metrics))
+REGISTRY.register(CallbackGauge("autopredict_batch_queue_depth", "Requêtes en attente dans le micro-batcher.", [], batching_metrics))
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Choix du modèle par requête : paramètre `model` ou en-tête X-Model, sinon tirage selon le partage du trafic
+def route_request(request):
+    return registry.select(request.query_params.get("model") or request.headers.get("x-model"))
+
+
+def predict_raw(current, raw_data):
+    # Encodage propre au modèle (un candidat OneHot attend les libellés d'origine) puis prédiction
+    input_data, _ = current.encoder.encode_frame(pd.DataFrame(raw_data))
+    return input_data.index, current.predict(input_data) if len(input_data) else []
+
+
+async def score_shadow(name, shadow, raw_data, reference):
+    current_endpoint.set(f"shadow:{name}")
+    start = time.perf_counter()
+    try:
+        index, predictions = await predict_pool.run(predict_raw, shadow, raw_data)
+    except PoolSaturated:
+        registry.record_skipped(name)
+        return
+    except Exception as e:
+        logger.warning("Échec de la prédiction shadow de %s : %s", name, e)
+        registry.record_error(name, "shadow")
+        return
+    if len(index):
+        registry.record_shadow(name, predictions, [reference[position] for position in index], time.perf_counter() - start)
+
+
+shadow_tasks = set()
+
+
+def schedule_shadows(name, raw_data, reference):
+    """Note les lignes servies par `name` avec les modèles shadow, en tâche de fond : la réponse n'attend pas.
+
+    `raw_data` : lignes validées avec leurs libellés d'origine ; `reference` : {position: prix servi}.
+    Un shadow n'est lancé que si un worker du pool de prédiction est libre.
+    """
+    for shadow_name, shadow in registry.shadows_for(name):
+        if predict_pool.pending >= predict_pool.max_workers:
+            registry.record_skipped(shadow_name)
+            continue
+        task = asyncio.get_running_loop().create_task(score_shadow(shadow_name, shadow, raw_data, reference))
+        shadow_tasks.add(task)
+        task.add_done_callback(shadow_tasks.discard)
+
+
 # Endpoint pour prédire le prix de vente d'une voiture
 @app.post("/predict")
-async def predict(features: CarFeatures):
+async def predict(features: CarFeatures, request: Request, response: Response):
+    start = time.perf_counter()
+    clock = stage_clock()
+    name = None
     try:
-        logger.info(f"Requête reçue : {features.dict()}")
-
-        # Mapper les valeurs textuelles
-        fuel = FUEL_MAPPING.get(features.fuel)
-        transmission = TRANSMISSION_MAPPING.get(features.transmission)
-        owner = OWNER_MAPPING.get(features.owner)
-        seller_type = SELLER_TYPE_MAPPING.get(features.seller_type)
-
-        # Valider les entrées
-        if fuel is None:
-            raise ValueError(f"Fuel invalide : {features.fuel}. Valeurs possibles : {list(FUEL_MAPPING.keys())}")
-        if transmission is None:
-            raise ValueError(f"Transmission invalide : {features.transmission}. Valeurs possibles : {list(TRANSMISSION_MAPPING.keys())}")
-        if owner is None:
-            raise ValueError(f"Owner invalide : {features.owner}. Valeurs possibles : {list(OWNER_MAPPING.keys())}")
-        if seller_type is None:
-            raise ValueError(f"Seller Type invalide : {features.seller_type}. Valeurs possibles : {list(SELLER_TYPE_MAPPING.keys())}")
-
-        # Préparer les données
-        input_data = pd.DataFrame([{
-            "year": features.year,
-            "km_driven": features.km_driven,
-            "fuel": fuel,
-            "transmission": transmission,
-            "owner": owner,
-            "seller_type": seller_type,
-            "brand": features.brand,
-        }])
-
-        logger.info(f"Données préparées pour le modèle : {input_data}")
-
-        # Faire une prédiction
-        prediction = model.predict(input_data)
-        logger.info(f"Prédiction effectuée : {prediction[0]}")
-
-        return {"predicted_selling_price": round(prediction[0], 2)}
+        # Le modèle est lu une seule fois : un rechargement n'affecte pas la requête en cours
+        name, current = route_request(request)
+        record = features.dict()
+
+        # Mapper et valider les valeurs textuelles avec l'encodeur du modèle choisi
+        row = current.encoder.encode_record(record)
+        clock.mark("mapping")
+
+        def served(predicted_selling_price, **details):
+            registry.record(name, "primary", [predicted_selling_price], time.perf_counter() - start)
+            if registry.shadows:
+                schedule_shadows(name, [record], {0: predicted_selling_price})
+            request_log.log("/predict", row, clock.timings, prediction=predicted_selling_price, model=name, **details)
+            response.headers["X-Model"] = name
+            return {"predicted_selling_price": predicted_selling_price}
+
+        # Prix lu dans la grille précalculée du modèle choisi ; le modèle ne sert qu'aux entrées hors grille
+        if current.price_grid is not None:
+            price = current.price_grid.lookup(row)
+            clock.mark("price_grid")
+            if price is not None:
+                return served(round(price, 2), price_grid=True)
+
+        # Les combinaisons déjà vues sont servies depuis le cache (modèle principal uniquement)
+        cache_key = tuple(row.values())
+        if prediction_cache is not None:
+            cached = prediction_cache.get(cache_key, version=current.version)
+            clock.mark("cache_lookup")
+            if cached is not None:
+                return served(cached, cached=True)
+
+        # Faire une prédiction, regroupée avec les requêtes concurrentes du modèle principal si le micro-batching est actif
+        if batcher is not None and current is state:
+            prediction = await batcher.submit(row)
+            clock.mark("batch_queue_and_model")
+        else:
+            prediction = (await predict_pool.run(current.predict, {column: [value] for column, value in row.items()}))[0]
+            clock.mark("predict_pool")
+
+        predicted_selling_price = round(float(prediction), 2)
+        if prediction_cache is not None:
+            prediction_cache.put(cache_key, predicted_selling_price, version=current.version)
+        return served(predicted_selling_price, model_version=current.version)
+
+    except PoolSaturated:
+        raise
+    except ValueError as e:
+        logger.error("Erreur utilisateur : %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Erreur interne : %s", e)
+        if name is not None:
+            registry.record_error(name, "primary")
+        raise HTTPException(status_code=500, detail="Erreur interne du serveur.")
+
 
+async def predict_records(records, name, current):
+    start = time.perf_counter()
+    # Valider chaque ligne puis mapper les colonnes textuelles en une seule passe
+    raw_data, errors = validate_records(records)
+    input_data, encoding_errors = current.encoder.encode_frame(raw_data)
+    errors.update(encoding_errors)
+
+    # Un seul appel au modèle par paquet de lignes
+    predictions = {}
+    for chunk in iter_chunks(input_data, PREDICT_BATCH_MAX_CHUNK):
+        predictions.update(zip(chunk.index, await predict_pool.run(current.predict, chunk)))
+    if predictions:
+        registry.record(name, "primary", list(predictions.values()), time.perf_counter() - start)
+        if registry.shadows:
+            schedule_shadows(name, raw_data.loc[input_data.index], predictions)
+
+    results = []
+    for index in range(len(records)):
+        if index in predictions:
+            results.append({"index": index, "predicted_selling_price": round(float(predictions[index]), 2)})
+        else:
+            results.append({"index": index, "error": errors[index]})
+
+    logger.info("Lot traité : %s prédictions, %s erreurs", len(predictions), len(errors))
+    return {"n_predictions": len(predictions), "n_errors": len(errors), "results": results}
+
+
+# Endpoint pour prédire le prix de vente d'un lot de voitures (liste JSON, NDJSON ou CSV)
+@app.post("/predict_batch")
+async def predict_batch(request: Request, response: Response):
+    try:
+        name, current = route_request(request)
+        records = parse_records(await request.body(), request.headers.get("content-type"))
     except ValueError as e:
-        logger.error(f"Erreur utilisateur : {str(e)}")
+        logger.error("Erreur utilisateur : %s", e)
         raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        response.headers["X-Model"] = name
+        return await predict_records(records, name, current)
+    except PoolSaturated:
+        raise
     except Exception as e:
-        logger.error(f"Erreur interne : {str(e)}")
+        logger.error("Erreur interne : %s", e)
         raise HTTPException(status_code=500, detail="Erreur interne du serveur.")
-    
-print(model.metadata.get_input_schema())
+
+
+# Générer la description d'un impact SHAP
+def format_impact(impact, feature_name):
+    if abs(impact) < 1e-6:
+        return f"Pas d'impact significatif"
+    elif impact > 0:
+        return f"Contribution positive importante : +{impact:.2f}"
+    else:
+        return f"Réduction due à {feature_name} : {impact:.2f}"
+
+
+async def explain_record(record, current, clock):
+    # Mapper et valider les valeurs textuelles, puis préparer les données pour SHAP
+    row = current.encoder.encode_record(record)
+    input_data = explain_frame(row)
+    clock.mark("mapping")
+
+    # Expliquer avec le moteur construit au démarrage, hors de la boucle d'événements
+    explanation_engine = await explain_engine_for(current)
+    base_value, shap_values = await explain_pool.run(explain_rows, explanation_engine, input_data)
+    clock.mark("shap")
+
+    # Prédiction totale
+    prediction = base_value + sum(shap_values[0])
+
+    # Générer des descriptions d'impacts
+    feature_impact = {
+        col: format_impact(shap_values[0][i], col)
+        for i, col in enumerate(input_data.columns)
+    }
+
+    # Formater la réponse
+    response = {
+        "base_value": round(base_value, 2),
+        "prediction": round(prediction, 2),
+        "feature_impact": feature_impact
+    }
+    return row, response
 
 
 # Endpoint pour expliquer une prédiction
 @app.post("/explain")
 async def explain(features: CarFeatures):
+    clock = stage_clock()
     try:
-        logger.info(f"Requête reçue pour explication : {features.dict()}")
-
-        # Mapper les valeurs textuelles
-        fuel = FUEL_MAPPING.get(features.fuel)
-        transmission = TRANSMISSION_MAPPING.get(features.transmission)
-        brand = features.brand
-        owner = OWNER_MAPPING.get(features.owner)
-        seller_type = SELLER_TYPE_MAPPING.get(features.seller_type)
-
-        # Valider les entrées
-        if fuel is None or transmission is None or brand is None or owner is None or seller_type is None:
-            raise ValueError("Certaines valeurs des caractéristiques sont invalides.")
-
-        # Préparer les données pour SHAP
-        input_data = pd.DataFrame([{
-            "year": features.year,
-            "km_driven": features.km_driven,
-            "fuel": fuel,
-            "seller_type": seller_type,
-            "transmission": transmission,
-            "owner": owner,
-            "brand": features.brand
-        }])
-
-        background = pd.DataFrame([{
-            "year": 2010,
-            "km_driven": 50000,
-            "fuel": 1,
-            "seller_type": 0,
-            "transmission": 1,
-            "owner": 0,
-            "brand": "Hyundai"
-        }])
-
-        # Conversion des types
-        expected_columns = ["year", "km_driven", "fuel", "seller_type", "transmission", "owner", "brand"]
-        background = background.astype({
-            "year": "int",
-            "km_driven": "int",
-            "fuel": "int",
-            "seller_type": "int",
-            "transmission": "int",
-            "owner": "int",
-            "brand": "str"
-        })[expected_columns]
-
-        input_data = input_data.astype({
-            "year": "int",
-            "km_driven": "int",
-            "fuel": "int",
-            "seller_type": "int",
-            "transmission": "int",
-            "owner": "int",
-            "brand": "str"
-        })[expected_columns]
-
-        # Fonction prédictive alignée
-        def predict_dataframe(data):
-            data = pd.DataFrame(data, columns=expected_columns)
-            return model.predict(data)
-
-        # Expliquer avec KernelExplainer
-        explainer = shap.KernelExplainer(predict_dataframe, background)
-        shap_values = explainer.shap_values(input_data)
-
-        # Base value
-        base_value = explainer.expected_value
-
-        # Prédiction totale
-        prediction = base_value + sum(shap_values[0])
-
-        # Générer des descriptions d'impacts
-        def format_impact(impact, feature_name):
-            if abs(impact) < 1e-6:
-                return f"Pas d'impact significatif"
-            elif impact > 0:
-                return f"Contribution positive importante : +{impact:.2f}"
+        row, response = await explain_record(features.dict(), state, clock)
+        request_log.log("/explain", row, clock.timings, prediction=response["prediction"])
+        return response
+
+    except PoolSaturated:
+        raise
+    except ValueError as e:
+        logger.error("Erreur utilisateur : %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Erreur interne : %s", e)
+        raise HTTPException(status_code=500, detail="Erreur interne du serveur.")
+
+
+
+async def iter_explanations(records, current, raw):
+    """Explications d'un lot, ligne par ligne dans l'ordre du lot (les lignes invalides portent leur erreur)."""
+    explanation_engine = await explain_engine_for(current)
+    raw_data, errors = validate_records(records)
+    input_data, encoding_errors = current.encoder.encode_frame(raw_data)
+    errors.update(encoding_errors)
+    input_data = input_data[EXPLAIN_COLUMNS]
+    pending_errors = deque(sorted(errors))
+
+    def error_items(below):
+        # Restituer les lignes en erreur à leur place dans le flux
+        while pending_errors and pending_errors[0] < below:
+            index = pending_errors.popleft()
+            yield {"index": int(index), "error": errors[index]}
+
+    # Un seul appel à l'explainer par paquet : la mémoire ne dépend pas de la taille du lot
+    for chunk in iter_chunks(input_data, EXPLAIN_BATCH_MAX_CHUNK):
+        base_value, shap_values = await explain_pool.run(explain_rows, explanation_engine, chunk)
+        for position, index in enumerate(chunk.index):
+            for item in error_items(index):
+                yield item
+            values = shap_values[position]
+            if raw:
+                feature_impact = {col: float(values[i]) for i, col in enumerate(EXPLAIN_COLUMNS)}
             else:
-                return f"Réduction due à {feature_name} : {impact:.2f}"
+                feature_impact = {col: format_impact(values[i], col) for i, col in enumerate(EXPLAIN_COLUMNS)}
+            yield {
+                "index": int(index),
+                "base_value": round(base_value, 2),
+                "prediction": round(base_value + float(values.sum()), 2),
+                "feature_impact": feature_impact,
+            }
+    for item in error_items(len(records)):
+        yield item
+    logger.info("Lot expliqué : %s explications, %s erreurs", len(input_data), len(errors))
+
+
+# Endpoint pour expliquer un lot de voitures, renvoyé en NDJSON au fil du calcul
+@app.post("/explain_batch")
+async def explain_batch(request: Request, raw: bool = False):
+    try:
+        records = parse_records(await request.body(), request.headers.get("content-type"))
+    except ValueError as e:
+        logger.error("Erreur utilisateur : %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
 
-        feature_impact = {
-            col: format_impact(shap_values[0][i], col)
-            for i, col in enumerate(input_data.columns)
-        }
+    # Refuser le lot avant de commencer le flux si le pool est déjà saturé
+    explain_pool.check_capacity()
+    explanations = iter_explanations(records, state, raw)
 
-        # Formater la réponse
-        response = {
-            "base_value": round(base_value, 2),
-            "prediction": round(prediction, 2),
-            "feature_impact": feature_impact
-        }
+    async def generate():
+        try:
+            async for item in explanations:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except PoolSaturated as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
-        logger.info("Explication générée avec succès.")
-        return response
 
+@app.post("/explain_visual")
+async def explain_visual(features: CarFeatures, image_format: str = Query("png", alias="format")):
+    current = state
+    clock = stage_clock()
+    try:
+        if image_format not in IMAGE_MEDIA_TYPES:
+            raise ValueError(f"Format invalide : {image_format}. Valeurs possibles : {list(IMAGE_MEDIA_TYPES.keys())}")
+
+        # Mapper et valider les valeurs textuelles avec l'encodeur du modèle actif
+        row = current.encoder.encode_record(features.dict())
+
+        # Les configurations populaires sont servies depuis le cache sans recalcul ni rendu
+        cache_key = (*row.values(), image_format)
+        image = visual_cache.get(cache_key, version=current.version)
+        clock.mark("mapping_and_cache_lookup")
+        cached = image is not None
+        if image is None:
+            # Expliquer puis dessiner en mémoire le graphique en cascade, hors de la boucle d'événements
+            input_data = explain_frame(row)
+            explanation_engine = await explain_engine_for(current)
+            image = await explain_pool.run(render_explanation, explanation_engine, input_data, EXPLAIN_COLUMNS, image_format)
+            clock.mark("shap_and_render")
+            visual_cache.put(cache_key, image, version=current.version)
+
+        request_log.log("/explain_visual", row, clock.timings, image_format=image_format, cached=cached)
+        return Response(content=image, media_type=IMAGE_MEDIA_TYPES[image_format])
+
+    except PoolSaturated:
+        raise
     except ValueError as e:
-        logger.error(f"Erreur utilisateur : {str(e)}")
+        logger.error("Erreur utilisateur : %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Erreur interne : {str(e)}")
+        logger.error("Erreur interne : %s", e)
         raise HTTPException(status_code=500, detail="Erreur interne du serveur.")
 
 
+# Jobs asynchrones : les traitements longs sont soumis puis suivis via `/jobs/{job_id}`
+def job_records(payload):
+    records = payload.get("records")
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise ValueError("Le champ `records` doit être une liste d'objets JSON.")
+    return records
 
 
-@app.post("/explain_visual")
-async def explain_visual(features: CarFeatures):
+async def run_predict_batch_job(payload):
+    name, current = registry.select(payload.get("model"))
+    return await predict_records(job_records(payload), name, current)
+
+
+async def run_explain_job(payload):
     try:
-        logger.info(f"Requête reçue pour visualisation : {features.dict()}")
-
-        # Mapper les valeurs textuelles
-        fuel = FUEL_MAPPING.get(features.fuel)
-        transmission = TRANSMISSION_MAPPING.get(features.transmission)
-        owner = OWNER_MAPPING.get(features.owner)
-        seller_type = SELLER_TYPE_MAPPING.get(features.seller_type)
-
-        # Valider les entrées
-        if fuel is None or transmission is None or owner is None or seller_type is None:
-            raise ValueError("Certaines valeurs des caractéristiques sont invalides.")
-
-        # Préparer les données pour SHAP
-        input_data = pd.DataFrame([{
-            "year": features.year,
-            "km_driven": features.km_driven,
-            "fuel": fuel,
-            "seller_type": seller_type,
-            "transmission": transmission,
-            "owner": owner,
-            "brand": features.brand
-        }])
-
-        background = pd.DataFrame([{
-            "year": 2010,
-            "km_driven": 50000,
-            "fuel": 1,
-            "seller_type": 0,
-            "transmission": 1,
-            "owner": 0,
-            "brand": "Hyundai"
-        }])
-
-        # Conversion des types
-        expected_columns = ["year", "km_driven", "fuel", "seller_type", "transmission", "owner", "brand"]
-        background = background.astype({
-            "year": "int",
-            "km_driven": "int",
-            "fuel": "int",
-            "seller_type": "int",
-            "transmission": "int",
-            "owner": "int",
-            "brand": "str"
-        })[expected_columns]
-
-        input_data = input_data.astype({
-            "year": "int",
-            "km_driven": "int",
-            "fuel": "int",
-            "seller_type": "int",
-            "transmission": "int",
-            "owner": "int",
-            "brand": "str"
-        })[expected_columns]
-
-        # Fonction prédictive alignée
-        def predict_dataframe(data):
-            data = pd.DataFrame(data, columns=expected_columns)
-            return model.predict(data)
-
-        # Expliquer avec KernelExplainer
-        explainer = shap.KernelExplainer(predict_dataframe, background)
-        shap_values = explainer.shap_values(input_data)
-
-        # # Visualiser avec force_plot
-        # shap.force_plot(
-        #     explainer.expected_value,
-        #     shap_values[0],
-        #     input_data.iloc[0],
-        #     matplotlib=True
-        # )
-
-         
-        # # Sauvegarder l'image
-        # plt.savefig("shap_force_plot.png")
-        # plt.close()
-
-        shap.waterfall_plot(shap.Explanation(values=shap_values[0], base_values=explainer.expected_value, data=input_data.iloc[0]))
-        plt.savefig("shap_waterfall_plot.png")
-        plt.close()
-       
-
-        logger.info("Visualisation générée et sauvegardée avec succès.")
-        return {"message": "Visualisation générée et sauvegardée sous shap_force_plot.png"}
+        features = CarFeatures(**payload)
+    except ValidationError as e:
+        raise ValueError(format_validation_error(e))
+    _, response = await explain_record(features.dict(), state, stage_clock())
+    return response
+
+
+async def run_explain_batch_job(payload):
+    return {"results": [item async for item in iter_explanations(job_records(payload), state, bool(payload.get("raw", False)))]}
+
+
+job_queue = JobQueue(
+    JobStore(JOBS_DIR, JOBS_TTL, JOBS_LEASE_TIMEOUT),
+    {"predict_batch": run_predict_batch_job, "explain": run_explain_job, "explain_batch": run_explain_batch_job},
+    JOBS_WORKERS,
+    JOBS_MAX_QUEUE,
+    POOL_RETRY_AFTER,
+)
 
+
+@app.on_event("startup")
+async def start_jobs():
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await job_queue.stop()
+
+
+class JobRequest(BaseModel):
+    kind: str
+    payload: dict
+    priority: str = "normal"
+
+
+def job_view(job):
+    return {key: job[key] for key in ("id", "kind", "priority", "status", "model_version", "created_at", "started_at", "finished_at", "error")}
+
+
+async def job_with_result(job):
+    view = job_view(job)
+    if job["status"] == "done":
+        view["result"] = await asyncio.get_running_loop().run_in_executor(None, job_queue.store.load_result, job["id"])
+    return view
+
+
+def load_job(job_id):
+    job = job_queue.store.load(job_id) if job_id.isalnum() else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job inconnu ou expiré : {job_id}")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    try:
+        job, deduplicated = job_queue.submit(request.kind, request.payload, request.priority, state.version)
+    except PoolSaturated:
+        raise
     except ValueError as e:
-        logger.error(f"Erreur utilisateur : {str(e)}")
+        logger.error("Erreur utilisateur : %s", e)
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        logger.error(f"Erreur interne : {str(e)}")
-        raise HTTPException(status_code=500, detail="Erreur interne du serveur.")
+    return {"job_id": job["id"], "status": job["status"], "deduplicated": deduplicated}
+
+
+# État d'un job, avec son résultat une fois terminé. `wait` : attendre la fin au plus ce nombre
+# de secondes ; `stream` : suivre les changements d'état en NDJSON jusqu'à la fin du job
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=60), stream: bool = False):
+    job = load_job(job_id)
+
+    if stream:
+        async def generate():
+            current = job
+            while current["status"] not in TERMINAL_STATES:
+                yield json.dumps(job_view(current), ensure_ascii=False) + "\n"
+                status = current["status"]
+                while current is not None and current["status"] == status:
+                    # Une ligne au moins toutes les 15 s, pour garder la connexion ouverte
+                    await job_queue.wait_for_change(job_id, 15)
+                    current = job_queue.store.load(job_id)
+                    if current is not None and current["status"] == status:
+                        yield json.dumps(job_view(current), ensure_ascii=False) + "\n"
+                if current is None:
+                    return
+            yield json.dumps(await job_with_result(current), ensure_ascii=False) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    deadline = time.monotonic() + wait
+    while job["status"] not in TERMINAL_STATES and time.monotonic() < deadline:
+        await job_queue.wait_for_change(job_id, deadline - time.monotonic())
+        job = load_job(job_id)
+    return await job_with_result(job)
@@ -0,0 +1,221 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from config import METRICS_ENABLED
+
+
+# Endpoint en cours et début de la requête, renseignés par le middleware de l'API
+current_endpoint = contextvars.ContextVar("current_endpoint", default="")
+request_started = contextvars.ContextVar("request_started", default=None)
+
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value not in (float("inf"), float("-inf")) else ("+Inf" if value > 0 else "-Inf")
+
+
+class Metric:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        # Copie sous le verrou : une nouvelle série peut être ajoutée pendant l'exposition
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = list(buckets)
+
+    def observe(self, *labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0, value]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+            entry[3] = max(entry[3], value)
+
+    def snapshot(self, *labels):
+        """Résumé d'une série pour `/stats` : effectif par case, somme, moyenne et maximum."""
+        with self._lock:
+            counts, total, count, maximum = self._values.get(labels, [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0])
+            counts = [*counts]
+        names = [f"<={bound}" for bound in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "buckets": dict(zip(names, counts)),
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6) if count else 0.0,
+            "max": round(maximum, 6),
+        }
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((labels, ([*counts], total, count)) for labels, (counts, total, count, _) in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [float("inf")], counts):
+                cumulative += bucket_count
+                le = {"le": "+Inf" if bound == float("inf") else repr(float(bound))}
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class CallbackGauge(Metric):
+    # Valeurs lues au moment de l'exposition (caches, pools, chargement du modèle) : aucun coût sur le chemin critique
+    kind = "gauge"
+
+    def __init__(self, name, help_text, label_names, callback):
+        super().__init__(name, help_text, label_names)
+        self.callback = callback
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class CallbackCounter(CallbackGauge):
+    # Totaux cumulés (tâches, succès des caches, lignes notées) : typés counter, pour que rate() et increase() gèrent les remises à zéro
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names, callback):
+        super().__init__(name if name.endswith("_total") else f"{name}_total", help_text, label_names, callback)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+stage_duration = REGISTRY.register(Histogram(
+    "autopredict_stage_duration_seconds",
+    "Durée de chaque étape du traitement d'une requête.",
+    ["endpoint", "stage"],
+))
+request_duration = REGISTRY.register(Histogram(
+    "autopredict_request_duration_seconds",
+    "Durée totale des requêtes HTTP.",
+    ["endpoint", "status"],
+))
+requests_in_flight = REGISTRY.register(Gauge(
+    "autopredict_requests_in_flight",
+    "Requêtes HTTP en cours de traitement.",
+    ["endpoint"],
+))
+
+
+@contextmanager
+def _timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(current_endpoint.get(), stage, value=time.perf_counter() - start)
+
+
+_NOOP = nullcontext()
+
+
+def timed(stage):
+    """Mesure la durée d'une étape pour l'endpoint en cours ; ne fait rien si les métriques sont désactivées."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _timed(stage)
+
+
+class StageClock:
+    """Chronomètre les étapes successives d'un endpoint : `mark` enregistre le temps écoulé depuis l'étape précédente.
+
+    La première étape, "validation", couvre le temps entre l'arrivée de la requête
+    et l'entrée dans l'endpoint (lecture du corps, validation Pydantic). Les durées
+    servent aussi au journal des requêtes : elles sont toujours mesurées, et ne sont
+    exportées dans `/metrics` que si `observe` est vrai.
+    """
+
+    def __init__(self, observe=True):
+        self.endpoint = current_endpoint.get()
+        self.observe = observe
+        self.timings = {}
+        self.last = time.perf_counter()
+        started = request_started.get()
+        if started is not None:
+            self._record("validation", self.last - started)
+
+    def _record(self, stage, duration):
+        self.timings[stage] = self.timings.get(stage, 0.0) + duration
+        if self.observe:
+            stage_duration.observe(self.endpoint, stage, value=duration)
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self._record(stage, now - self.last)
+        self.last = now
+
+
+def stage_clock():
+    return StageClock(observe=METRICS_ENABLED)
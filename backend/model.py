@@ -1,4 +1,3 @@
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import make_pipeline
 from sklearn.compose import make_column_transformer
@@ -7,20 +6,11 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import OrdinalEncoder
 import joblib
 
-# Charger les données
-df = pd.read_csv("./data/cartest.csv")
+from dataset import load_training_data
+from features import attach_encoder
 
-# Préparer les données
-df["fuel"].replace({'Diesel': 0, 'Petrol': 1, 'LPG': 2, 'CNG': 3, 'Electric': 4}, inplace=True)
-df["transmission"].replace({'Automatic': 0, 'Manual': 1}, inplace=True)
-df["owner"].replace({'First Owner': 0, 'Second Owner': 1, 'Third Owner': 2, 'Fourth & Above Owner': 3, 'Test Drive Car': 4}, inplace=True)  
-df["seller_type"].replace({'Dealer': 0, 'Individual': 1}, inplace=True)
-df["brand"] = df["name"].str.split().str[0]
-df = df.drop("name", axis=1)
-
-# Séparer les features et la cible
-y = df["selling_price"]
-X = df.drop("selling_price", axis=1)
+# Charger les données, préparées par le module partagé (cache Parquet typé)
+X, y = load_training_data()
 
 # Diviser les données
 x_train, x_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -38,5 +28,5 @@ tree_processor = make_column_transformer(
 rfr_pipeline = make_pipeline(tree_processor, RandomForestRegressor(n_estimators=100, random_state=42))
 rfr_pipeline.fit(x_train, y_train)
 
-# Sauvegarder le pipeline complet
-joblib.dump(rfr_pipeline, "rfr_pipeline.pkl")
+# Sauvegarder le pipeline complet, avec l'encodage des colonnes catégorielles
+joblib.dump(attach_encoder(rfr_pipeline), "rfr_pipeline.pkl")
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import joblib
+from sklearn.pipeline import Pipeline
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INDEX = "index.json"
+
+
+def unwrap_sklearn_pipeline(model):
+    """Retourne le pipeline sklearn sous-jacent d'un modèle, ou None s'il n'y en a pas."""
+    if isinstance(model, Pipeline):
+        return model
+    # Un modèle pyfunc de saveur sklearn expose l'objet d'origine via son implémentation
+    sklearn_model = getattr(getattr(model, "_model_impl", None), "sklearn_model", None)
+    if isinstance(sklearn_model, Pipeline):
+        return sklearn_model
+    return None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_snapshot_index(snapshot_dir):
+    path = os.path.join(snapshot_dir, SNAPSHOT_INDEX)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_snapshot_index(snapshot_dir, index):
+    # Écriture atomique : plusieurs workers peuvent exporter en même temps
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, os.path.join(snapshot_dir, SNAPSHOT_INDEX))
+
+
+def export_snapshot(model_uri, snapshot_dir, sklearn_model=None):
+    """Exporte le pipeline sklearn d'un modèle MLflow en snapshot local adressé par son contenu.
+
+    Le fichier est nommé d'après son empreinte SHA-256 et référencé dans `index.json`
+    sous l'URI du modèle. Retourne l'empreinte du snapshot.
+    """
+    if sklearn_model is None:
+        import mlflow.sklearn
+        sklearn_model = mlflow.sklearn.load_model(model_uri)
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, suffix=".joblib")
+    os.close(fd)
+    # Sans compression, pour permettre la lecture des tableaux par memory-mapping
+    joblib.dump(sklearn_model, tmp_path)
+    sha256 = file_sha256(tmp_path)
+    os.replace(tmp_path, os.path.join(snapshot_dir, f"{sha256}.joblib"))
+
+    index = read_snapshot_index(snapshot_dir)
+    index[model_uri] = {
+        "sha256": sha256,
+        "file": f"{sha256}.joblib",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    _write_snapshot_index(snapshot_dir, index)
+    logger.info(f"Snapshot exporté pour {model_uri} : {sha256}")
+    return sha256
+
+
+def load_snapshot(model_uri, snapshot_dir, mmap=True):
+    """Charge le snapshot local d'un modèle après vérification de son empreinte."""
+    entry = read_snapshot_index(snapshot_dir).get(model_uri)
+    if entry is None:
+        raise FileNotFoundError(f"Aucun snapshot local pour {model_uri} dans {snapshot_dir}")
+
+    path = os.path.join(snapshot_dir, entry["file"])
+    if file_sha256(path) != entry["sha256"]:
+        raise ValueError(f"Empreinte invalide pour le snapshot {path}")
+    # Les tableaux NumPy sont lus depuis le fichier projeté en mémoire, sans copie intermédiaire.
+    # Les arbres sklearn recopient tout de même leurs nœuds dans une mémoire privée au
+    # processus (Tree.__setstate__) : la forêt n'est pas partagée entre workers. Le gain porte
+    # sur le chargement (forêt factice de 300 arbres, 65 Mo : 0,26 s et 138 Mo de RSS anonyme,
+    # contre 0,38 s et 204 Mo sans memory-mapping)
+    return joblib.load(path, mmap_mode="r" if mmap else None)
+
+
+def load_model(model_uri, source, snapshot_dir, tracking_uri):
+    """Charge un modèle depuis le registre MLflow ou depuis un snapshot local.
+
+    `source` vaut "registry", "snapshot" ou "auto" (snapshot s'il existe, sinon registre
+    puis export du snapshot pour les démarrages suivants). Retourne le modèle, la source
+    effectivement utilisée et la durée de chaque phase du chargement en secondes.
+    """
+    timings = {"registry_fetch": 0.0, "deserialization": 0.0}
+
+    if source in ("snapshot", "auto"):
+        try:
+            start = time.perf_counter()
+            model = load_snapshot(model_uri, snapshot_dir)
+            timings["deserialization"] = time.perf_counter() - start
+            return model, "snapshot", timings
+        except FileNotFoundError:
+            if source == "snapshot":
+                raise
+            logger.info(f"Pas de snapshot local pour {model_uri}, chargement depuis le registre")
+
+    import mlflow
+    import mlflow.pyfunc
+
+    mlflow.set_tracking_uri(tracking_uri)
+    start = time.perf_counter()
+    local_path = mlflow.artifacts.download_artifacts(model_uri)
+    timings["registry_fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = mlflow.pyfunc.load_model(local_path)
+    timings["deserialization"] = time.perf_counter() - start
+
+    if source == "auto":
+        pipeline = unwrap_sklearn_pipeline(model)
+        if pipeline is not None:
+            try:
+                export_snapshot(model_uri, snapshot_dir, sklearn_model=pipeline)
+            except OSError as e:
+                logger.warning(f"Impossible d'écrire le snapshot local : {e}")
+    return model, "registry", timings
@@ -0,0 +1,224 @@
+import bisect
+import itertools
+import logging
+import random
+import threading
+from collections import deque
+
+import numpy as np
+
+from metrics import REGISTRY, Histogram
+
+
+logger = logging.getLogger(__name__)
+
+# Nom du modèle principal (MODEL_URI) : celui du rechargement à chaud et des explications
+DEFAULT_MODEL = "default"
+
+model_latency = REGISTRY.register(Histogram(
+    "autopredict_model_latency_seconds",
+    "Durée des prédictions par modèle servi, en principal ou en shadow.",
+    ["model", "role"],
+))
+
+
+def parse_assignments(value):
+    """Liste `nom=valeur,nom=valeur` (modèles servis, partage du trafic) en dictionnaire ordonné."""
+    entries = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, separator, entry = (part.strip() for part in item.partition("="))
+        if not separator or not name or not entry:
+            raise ValueError(f"Entrée invalide : {item!r} (format attendu : nom=valeur)")
+        entries[name] = entry
+    return entries
+
+
+def parse_weights(value):
+    weights = {}
+    for name, weight in parse_assignments(value).items():
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"Poids invalide pour {name} : {weight!r}")
+    return weights
+
+
+def parse_names(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def _quantiles(values, quantiles):
+    if not values:
+        return {f"p{q}": None for q in quantiles}
+    return {f"p{q}": round(float(value), 2) for q, value in zip(quantiles, np.percentile(values, quantiles))}
+
+
+class PredictionStats:
+    """Latence et distribution des prédictions d'un modèle, sur les `window` derniers appels.
+
+    Pour un modèle noté en shadow, l'écart relatif à la prédiction servie par le modèle
+    principal est conservé ligne par ligne : c'est la dérive à surveiller avant une promotion.
+    """
+
+    def __init__(self, window):
+        self.calls = 0
+        self.rows = 0
+        self.errors = 0
+        self.skipped = 0
+        self._latencies = deque(maxlen=window)
+        self._predictions = deque(maxlen=window)
+        self._deltas = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, predictions, seconds):
+        with self._lock:
+            self.calls += 1
+            self.rows += len(predictions)
+            self._latencies.append(seconds * 1000)
+            self._predictions.extend(float(value) for value in predictions)
+
+    def record_deltas(self, predictions, reference):
+        deltas = (np.asarray(predictions, dtype=float) - reference) / np.maximum(np.abs(reference), 1.0)
+        with self._lock:
+            self._deltas.extend(deltas.tolist())
+
+    def stats(self):
+        with self._lock:
+            latencies, predictions, deltas = list(self._latencies), list(self._predictions), list(self._deltas)
+        result = {
+            "calls": self.calls,
+            "rows": self.rows,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "latency_ms": _quantiles(latencies, (50, 95, 99)),
+            "prediction": {"mean": round(float(np.mean(predictions)), 2) if predictions else None, **_quantiles(predictions, (5, 50, 95))},
+        }
+        if deltas:
+            absolute = np.abs(deltas)
+            result["shadow_delta"] = {
+                "rows": len(deltas),
+                "mean_relative": round(float(np.mean(deltas)), 4),
+                "mean_abs_relative": round(float(np.mean(absolute)), 4),
+                "p95_abs_relative": round(float(np.percentile(absolute, 95)), 4),
+            }
+        return result
+
+
+class ModelRegistry:
+    """Modèles résidents servis par l'API, routage des requêtes et partage du trafic.
+
+    Chaque nom désigne un `ModelState` chargé au démarrage ; deux noms pour la même URI
+    partagent le même état. Une requête peut désigner son modèle, sinon elle est tirée au
+    sort selon `weights`. Les modèles de `shadows` notent en plus les requêtes servies par
+    un autre modèle, hors du chemin critique, pour comparer coût et prédictions.
+    """
+
+    def __init__(self, states, weights=None, shadows=(), stats_window=1000, seed=None):
+        self.states = dict(states)
+        self.stats_window = stats_window
+        self.prediction_stats = {(name, role): PredictionStats(stats_window) for name in self.states for role in ("primary", "shadow")}
+        self._random = random.Random(seed)
+        self.set_traffic(weights or {DEFAULT_MODEL: 1}, shadows)
+
+    def _check_name(self, name):
+        if name not in self.states:
+            raise ValueError(f"Modèle inconnu : {name}. Valeurs possibles : {list(self.states)}")
+
+    def set_traffic(self, weights, shadows=()):
+        weights = {name: float(weight) for name, weight in weights.items()}
+        for name in [*weights, *shadows]:
+            self._check_name(name)
+        if any(weight < 0 for weight in weights.values()) or sum(weights.values()) <= 0:
+            raise ValueError("Les poids du partage du trafic doivent être positifs, et au moins un non nul.")
+        # Affectation en une seule fois : les requêtes en cours lisent l'ancien partage ou le nouveau
+        self._split = (list(weights), list(itertools.accumulate(weights.values())))
+        self.weights = weights
+        self.shadows = list(shadows)
+        logger.info("Partage du trafic : %s, shadow : %s", weights, self.shadows or "aucun")
+
+    def get(self, name):
+        self._check_name(name)
+        return self.states[name]
+
+    def select(self, requested=None):
+        """Nom et état du modèle qui sert la requête : celui demandé, sinon un tirage selon les poids."""
+        if requested:
+            return requested, self.get(requested)
+        names, cumulative = self._split
+        name = names[bisect.bisect_right(cumulative, self._random.random() * cumulative[-1])]
+        return name, self.states[name]
+
+    def shadows_for(self, name):
+        return [(shadow, self.states[shadow]) for shadow in self.shadows if shadow != name]
+
+    def replace(self, name, state):
+        # Nouvelle version d'un modèle résident : ses statistiques repartent de zéro
+        self.states[name] = state
+        for role in ("primary", "shadow"):
+            self.prediction_stats[(name, role)] = PredictionStats(self.stats_window)
+
+    def record(self, name, role, predictions, seconds):
+        model_latency.observe(name, role, value=seconds)
+        self.prediction_stats[(name, role)].record(predictions, seconds)
+
+    def record_shadow(self, name, predictions, reference, seconds):
+        self.record(name, "shadow", predictions, seconds)
+        self.prediction_stats[(name, "shadow")].record_deltas(predictions, reference)
+
+    def record_error(self, name, role):
+        self.prediction_stats[(name, role)].errors += 1
+
+    def record_skipped(self, name):
+        # Shadow abandonné faute de capacité libre : les requêtes servies restent prioritaires
+        self.prediction_stats[(name, "shadow")].skipped += 1
+
+    def unique_states(self):
+        return list({id(state): state for state in self.states.values()}.values())
+
+    def describe(self):
+        return {
+            name: {**state.describe(), "weight": self.weights.get(name, 0.0), "shadow": name in self.shadows}
+            for name, state in self.states.items()
+        }
+
+    def stats(self):
+        return {
+            name: {role: self.prediction_stats[(name, role)].stats() for role in ("primary", "shadow")}
+            for name in self.states
+        }
+
+    def counter_samples(self):
+        # Totaux depuis le chargement du modèle (remis à zéro par `replace`)
+        return [
+            ((name, role, stat), getattr(stats, stat))
+            for (name, role), stats in self.prediction_stats.items()
+            for stat in ("rows", "errors", "skipped")
+        ]
+
+    def gauge_samples(self):
+        samples = []
+        for (name, role), stats in self.prediction_stats.items():
+            values = stats.stats()
+            if values["prediction"]["mean"] is not None:
+                samples.append(((name, role, "prediction_mean"), values["prediction"]["mean"]))
+            if "shadow_delta" in values:
+                samples.append(((name, role, "mean_abs_relative_delta"), values["shadow_delta"]["mean_abs_relative"]))
+        return samples
+
+
+def load_registry(models, build_state, weights=None, shadows=(), stats_window=1000):
+    """Charge les modèles `{nom: état ou URI}` ; une même URI n'est chargée qu'une fois.
+
+    Chaque modèle distinct occupe sa propre mémoire dans chaque worker (voir `load_snapshot`) :
+    garder un candidat résident coûte la taille de sa forêt.
+    """
+    states, by_uri = {}, {}
+    for name, model in models.items():
+        if isinstance(model, str):
+            if model not in by_uri:
+                by_uri[model] = build_state(model)
+            model = by_uri[model]
+        else:
+            by_uri.setdefault(model.model_uri, model)
+        states[name] = model
+    return ModelRegistry(states, weights, shadows, stats_window)
@@ -0,0 +1,195 @@
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from explainer import ExplanationEngine, encode_background
+from features import CATEGORICAL_MAPPINGS, DEFAULT_ENCODER, FEATURE_COLUMNS, LABEL_ENCODER, encoder_from_pipeline
+from forest_engine import CompiledForest
+from metrics import timed
+from model_loader import load_model, unwrap_sklearn_pipeline
+from onnx_engine import load_onnx_forest
+from price_grid import load_price_grid
+
+
+logger = logging.getLogger(__name__)
+
+# Numéro de chargement, pour distinguer deux chargements successifs d'une même URI
+_generations = itertools.count(1)
+
+
+def model_input_columns(model):
+    """Retourne les colonnes d'entrée déclarées par le modèle, ou None si elles sont inconnues."""
+    metadata = getattr(model, "metadata", None)
+    if metadata is not None and metadata.get_input_schema() is not None:
+        return metadata.get_input_schema().input_names()
+    pipeline = unwrap_sklearn_pipeline(model)
+    if pipeline is not None and hasattr(pipeline, "feature_names_in_"):
+        return list(pipeline.feature_names_in_)
+    return None
+
+
+def check_input_schema(model):
+    # Le modèle ne doit attendre que des colonnes que l'API sait construire à partir de `CarFeatures`
+    columns = model_input_columns(model)
+    if columns is None:
+        logger.warning("Schéma d'entrée du modèle inconnu, vérification ignorée")
+        return
+    logger.debug("Colonnes d'entrée du modèle : %s", columns)
+    unknown = sorted(set(columns) - set(FEATURE_COLUMNS))
+    if unknown:
+        raise ValueError(f"Colonnes attendues par le modèle absentes de CarFeatures : {unknown}")
+
+
+def encodes_labels(pipeline):
+    """True si le pipeline encode lui-même les libellés catégoriels (OneHotEncoder, comme SimpleRandomForestPipeline)."""
+    if pipeline is None or not hasattr(pipeline[0], "transformers_"):
+        return False
+    for _, transformer, columns in pipeline[0].transformers_:
+        steps = [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer]
+        if any(isinstance(step, OneHotEncoder) for step in steps) and set(columns) & set(CATEGORICAL_MAPPINGS):
+            return True
+    return False
+
+
+def fallback_encoder(pipeline):
+    # Modèles enregistrés sans encodeur : libellés bruts pour les pipelines OneHot, sinon encodage de référence
+    if encodes_labels(pipeline):
+        logger.warning("Aucun encodeur enregistré avec le modèle, libellés transmis tels quels au pipeline OneHot")
+        return LABEL_ENCODER
+    logger.warning("Aucun encodeur enregistré avec le modèle, utilisation de l'encodage de référence")
+    return DEFAULT_ENCODER
+
+
+def model_encoder(model):
+    """Encodage enregistré avec le modèle ; les modèles plus anciens utilisent un encodage déduit du pipeline."""
+    pipeline = unwrap_sklearn_pipeline(model)
+    return encoder_from_pipeline(pipeline) or fallback_encoder(pipeline)
+
+
+class ModelState:
+    """Modèle servi et tout ce qui en dépend (moteur compilé, moteur d'explication).
+
+    Un état est construit et mis en route entièrement avant d'être activé : le
+    remplacer revient à réassigner une seule référence, et les requêtes en cours
+    terminent sur l'état qu'elles ont lu au début.
+    """
+
+    def __init__(self, model_uri, model, source, timings, inference_engine, background, kernel_background_size, price_grid_dir=None,
+                 onnx_dir=None, onnx_threads=1, preload_explainer=False):
+        self.model_uri = model_uri
+        self.model = model
+        self.source = source
+        self.timings = timings
+        self.version = f"{model_uri}#{next(_generations)}"
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.swapped_at = None
+
+        check_input_schema(model)
+
+        self.encoder = model_encoder(model)
+
+        # La mise en route (moteurs, premières prédictions) est mesurée à part
+        warm_up_start = time.perf_counter()
+
+        # Moteur d'inférence compilé optionnel, sans pandas ni wrapper pyfunc
+        self.compiled_forest = None
+        if inference_engine == "compiled":
+            try:
+                self.compiled_forest = CompiledForest(unwrap_sklearn_pipeline(model))
+                logger.info(f"Moteur d'inférence compilé prêt ({self.compiled_forest.n_trees} arbres)")
+            except Exception as e:
+                logger.warning(f"Moteur compilé indisponible, utilisation du modèle pyfunc : {e}")
+
+        # Moteur ONNX optionnel : le pipeline complet exécuté par onnxruntime
+        self.onnx_forest = None
+        if inference_engine == "onnx":
+            try:
+                self.onnx_forest = load_onnx_forest(onnx_dir, unwrap_sklearn_pipeline(model), onnx_threads)
+                logger.info(f"Moteur d'inférence ONNX prêt ({onnx_threads} threads par appel)")
+            except Exception as e:
+                logger.warning(f"Moteur ONNX indisponible, utilisation du modèle pyfunc : {e}")
+
+        # Grille de prix précalculée pour ce modèle précis, si elle a été construite
+        self.price_grid = None
+        if price_grid_dir:
+            try:
+                self.price_grid = load_price_grid(price_grid_dir, unwrap_sklearn_pipeline(model))
+            except Exception as e:
+                logger.warning(f"Grille de prix indisponible, utilisation du modèle : {e}")
+
+        # Moteur d'explication SHAP construit une seule fois, à la première explication (import de shap
+        # compris) : un worker qui ne sert que `/predict` ne charge ni shap ni numba
+        # Fond tiré des données brutes, encodé comme les requêtes servies par ce modèle
+        self._background = encode_background(background, self.encoder)
+        self._kernel_background_size = kernel_background_size
+        self._explanation_engine = None
+        self._explanation_lock = threading.Lock()
+        if preload_explainer:
+            self.load_explanation_engine()
+
+        self.predict(self._background)
+        self.timings["warm_up"] = time.perf_counter() - warm_up_start
+
+    def load_explanation_engine(self):
+        if self._explanation_engine is None:
+            with self._explanation_lock:
+                if self._explanation_engine is None:
+                    self._explanation_engine = ExplanationEngine(self.model, self._background, kernel_background_size=self._kernel_background_size)
+                    logger.info(f"Moteur d'explication prêt ({self._explanation_engine.kind})")
+        return self._explanation_engine
+
+    @property
+    def explanation_engine(self):
+        return self.load_explanation_engine()
+
+    @property
+    def explainer_kind(self):
+        # None tant qu'aucune explication n'a été demandée pour ce modèle
+        return self._explanation_engine.kind if self._explanation_engine is not None else None
+
+    @property
+    def inference_engine(self):
+        if self.onnx_forest is not None:
+            return "onnx"
+        return "compiled" if self.compiled_forest is not None else "pyfunc"
+
+    def predict(self, input_data):
+        # `input_data` : DataFrame ou dictionnaire {colonne: valeurs} avec les colonnes de FEATURE_COLUMNS
+        if self.compiled_forest is not None:
+            with timed("compiled_forest"):
+                return self.compiled_forest.predict(input_data)
+        if self.onnx_forest is not None:
+            with timed("onnx"):
+                return self.onnx_forest.predict(input_data)
+
+        with timed("dataframe"):
+            frame = pd.DataFrame(input_data)[FEATURE_COLUMNS]
+        # Le modèle pyfunc reste le seul appel d'inférence (contrôle du schéma compris)
+        with timed("model"):
+            return self.model.predict(frame)
+
+    def describe(self):
+        return {
+            "model_uri": self.model_uri,
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "swapped_at": self.swapped_at,
+            "inference_engine": self.inference_engine,
+            "explainer": self.explainer_kind,
+            "price_grid": self.price_grid.describe() if self.price_grid is not None else {"enabled": False},
+        }
+
+
+def build_model_state(model_uri, source, snapshot_dir, tracking_uri, inference_engine, background, kernel_background_size, price_grid_dir=None,
+                      onnx_dir=None, onnx_threads=1, preload_explainer=False):
+    model, actual_source, timings = load_model(model_uri, source, snapshot_dir, tracking_uri)
+    logger.info(f"Modèle {model_uri} chargé avec succès ({actual_source})")
+    return ModelState(model_uri, model, actual_source, timings, inference_engine, background, kernel_background_size, price_grid_dir,
+                      onnx_dir, onnx_threads, preload_explainer)
@@ -0,0 +1,106 @@
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+from sklearn.preprocessing import OrdinalEncoder
+
+from compaction import compact_pipeline
+from price_grid import model_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+ONNX_FILE = "model.onnx"
+ONNX_OPSET = {"": 17, "ai.onnx.ml": 3}
+
+
+def pipeline_input_columns(pipeline):
+    """Colonnes réellement lues par le ColumnTransformer du pipeline, dans son ordre."""
+    return [
+        column
+        for name, transformer, columns in pipeline[0].transformers_
+        if name != "remainder" and transformer != "drop"
+        for column in columns
+    ]
+
+
+def to_onnx(pipeline):
+    """Graphe ONNX sérialisé du pipeline complet : imputer, OrdinalEncoder de `brand` et forêt.
+
+    Une entrée par colonne lue : float32 pour les colonnes numériques, chaîne pour les
+    colonnes catégorielles. Les seuils sont d'abord arrondis par `float32_floor` (voir
+    compaction.py) : les décisions des arbres restent celles de sklearn, seul le cumul
+    des feuilles, en float32 dans onnxruntime, s'écarte de quelques 1e-6 en relatif.
+    """
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+
+    categorical = {
+        column
+        for _, transformer, columns in pipeline[0].transformers_
+        if isinstance(transformer, OrdinalEncoder)
+        for column in columns
+    }
+    initial_types = [
+        (column, StringTensorType([None, 1]) if column in categorical else FloatTensorType([None, 1]))
+        for column in pipeline_input_columns(pipeline)
+    ]
+    graph = convert_sklearn(compact_pipeline(pipeline), initial_types=initial_types, target_opset=ONNX_OPSET)
+    return graph.SerializeToString()
+
+
+class OnnxForest:
+    """Pipeline exporté en ONNX, exécuté par une session onnxruntime sur CPU.
+
+    `intra_op_threads` borne les threads utilisés par un appel ; les appels concurrents
+    viennent déjà des workers du pool de prédiction.
+    """
+
+    def __init__(self, graph, intra_op_threads=1):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(graph, options, providers=["CPUExecutionProvider"])
+        self.inputs = [(node.name, node.type == "tensor(string)") for node in self.session.get_inputs()]
+
+    def predict(self, data):
+        # `data` : DataFrame ou dictionnaire {colonne: valeurs}, comme CompiledForest.predict
+        feeds = {}
+        for column, categorical in self.inputs:
+            if categorical:
+                values = np.asarray([str(value) for value in data[column]], dtype=object)
+            else:
+                values = np.asarray(data[column], dtype=np.float32)
+            feeds[column] = values.reshape(-1, 1)
+        return self.session.run(None, feeds)[0].ravel().astype(np.float64)
+
+
+def load_onnx_forest(directory, pipeline, intra_op_threads=1):
+    """Session ONNX du pipeline, à partir du graphe déjà exporté pour ce modèle (même empreinte).
+
+    Sans graphe en cache, le pipeline est converti puis le graphe est écrit dans `directory`
+    pour les chargements suivants (la conversion prend plusieurs secondes).
+    """
+    path = os.path.join(directory, f"{model_fingerprint(pipeline)}.onnx")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            graph = f.read()
+    else:
+        start = time.perf_counter()
+        graph = to_onnx(pipeline)
+        logger.info("Pipeline converti en ONNX en %.1f s", time.perf_counter() - start)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".onnx")
+            with os.fdopen(fd, "wb") as f:
+                f.write(graph)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Impossible d'écrire le graphe ONNX : {e}")
+    return OnnxForest(graph, intra_op_threads)
@@ -0,0 +1,122 @@
+import io
+
+import numpy as np
+
+
+IMAGE_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+POSITIVE_COLOR = "#ff0051"
+NEGATIVE_COLOR = "#008bfb"
+
+
+def render_waterfall(base_value, values, data, columns, image_format="png"):
+    """Dessine un graphique en cascade des contributions SHAP et renvoie l'image en mémoire.
+
+    Le rendu passe par l'API objet de matplotlib (Figure + canvas Agg) et ne touche
+    pas à l'état global de pyplot : il peut être appelé depuis plusieurs threads.
+    """
+    values = np.asarray(values, dtype=float)
+    # Les contributions les plus fortes sont affichées en haut, comme `shap.waterfall_plot`
+    order = np.argsort(np.abs(values))
+
+    figure, ax = _new_axes((8, 0.5 * len(columns) + 1.5))
+
+    start = base_value
+    labels = []
+    for position, index in enumerate(order):
+        value = values[index]
+        ax.barh(position, value, left=start, color=POSITIVE_COLOR if value >= 0 else NEGATIVE_COLOR)
+        ax.text(
+            start + value,
+            position,
+            f" {value:+,.0f}",
+            va="center",
+            ha="left" if value >= 0 else "right",
+            fontsize=9,
+        )
+        labels.append(f"{data[index]} = {columns[index]}")
+        start += value
+
+    ax.axvline(base_value, color="gray", linestyle="--", linewidth=1)
+    ax.axvline(start, color="black", linewidth=1)
+    ax.set_yticks(range(len(order)))
+    ax.set_yticklabels(labels)
+    ax.set_title(f"E[f(X)] = {base_value:,.0f}    f(x) = {start:,.0f}")
+    ax.set_xlabel("Prix")
+    return _figure_bytes(figure, image_format)
+
+
+def _figure_bytes(figure, image_format="png"):
+    figure.tight_layout()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def _new_axes(figsize):
+    # Import au premier rendu : les workers qui ne dessinent jamais ne chargent pas matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+
+def render_actual_vs_predicted(actual, predicted, image_format="png"):
+    """Prix prédits en fonction des prix réels ; au-delà de quelques milliers de points, densité hexagonale."""
+    figure, ax = _new_axes((7, 7))
+    if len(actual) > 5000:
+        hexbin = ax.hexbin(actual, predicted, gridsize=60, bins="log", mincnt=1, cmap="viridis")
+        figure.colorbar(hexbin, ax=ax, label="Annonces (log)")
+    else:
+        ax.scatter(actual, predicted, s=6, alpha=0.4, color=NEGATIVE_COLOR)
+    limit = max(np.max(actual), np.max(predicted))
+    ax.plot([0, limit], [0, limit], color="gray", linestyle="--", linewidth=1)
+    ax.set_xlabel("Prix réel")
+    ax.set_ylabel("Prix prédit")
+    ax.set_title("Prix réels et prédits")
+    return _figure_bytes(figure, image_format)
+
+
+def render_residuals(actual, predicted, image_format="png"):
+    figure, ax = _new_axes((8, 4.5))
+    ax.hist(np.asarray(predicted) - np.asarray(actual), bins=80, color=NEGATIVE_COLOR)
+    ax.axvline(0, color="black", linewidth=1)
+    ax.set_xlabel("Résidu (prédit - réel)")
+    ax.set_ylabel("Annonces")
+    ax.set_title("Distribution des résidus")
+    return _figure_bytes(figure, image_format)
+
+
+def render_group_errors(groups, values, lows, highs, title, image_format="png"):
+    """Erreur par groupe (barres horizontales), avec intervalle de confiance lorsqu'il est connu."""
+    values = np.asarray(values, dtype=float)
+    figure, ax = _new_axes((8, 0.3 * len(groups) + 1.5))
+    xerr = None
+    if lows is not None:
+        xerr = np.vstack([values - np.asarray(lows, dtype=float), np.asarray(highs, dtype=float) - values])
+    ax.barh(range(len(groups)), values, xerr=xerr, color=POSITIVE_COLOR, ecolor="black", capsize=2)
+    ax.set_yticks(range(len(groups)))
+    ax.set_yticklabels(groups)
+    ax.invert_yaxis()
+    ax.set_xlabel("Erreur absolue moyenne")
+    ax.set_title(title)
+    return _figure_bytes(figure, image_format)
+
+
+def render_price_comparison(actual, predicted, labels, image_format="png"):
+    # Les annonces les plus mal prédites, comme le graphique affiché auparavant par model_evaluation.py
+    figure, ax = _new_axes((14, 8))
+    indices = range(len(labels))
+    ax.plot(indices, actual, label="Prix Réel", marker="o", color="blue", linewidth=2)
+    ax.plot(indices, predicted, label="Prix Prédit", marker="o", color="orange", linewidth=2)
+    ax.fill_between(indices, actual, predicted, color="gray", alpha=0.3, label="Différence (abs)")
+    ax.set_xticks(list(indices))
+    ax.set_xticklabels(labels, rotation=45)
+    ax.set_title("Comparaison des prix réels et prédits avec différence", fontsize=14)
+    ax.set_ylabel("Prix", fontsize=12)
+    ax.set_xlabel("Marque", fontsize=12)
+    ax.legend(fontsize=12)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    return _figure_bytes(figure, image_format)
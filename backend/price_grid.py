@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from forest_engine import CompiledForest, UnsupportedModel
+
+
+logger = logging.getLogger(__name__)
+
+
+def model_fingerprint(pipeline):
+    """Empreinte du contenu de la forêt et de ses encodages : identique quel que soit le mode de chargement."""
+    compiled = CompiledForest(pipeline)
+    digest = hashlib.sha256()
+    for array in (compiled.feature, compiled.threshold, compiled.left, compiled.right, compiled.value):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    for kind, columns, params in compiled.steps:
+        digest.update(json.dumps([kind, columns]).encode())
+        if kind == "ordinal":
+            for categories, _ in params[0]:
+                digest.update(json.dumps([str(category) for category in categories]).encode())
+    return digest.hexdigest()
+
+
+def grid_axes(pipeline, data, max_buckets=2048):
+    """Axes de la grille : une colonne catégorielle par catégorie connue, une colonne numérique par intervalle entre seuils.
+
+    La prédiction de la forêt ne change qu'en franchissant l'un de ses seuils : avec un
+    intervalle par seuil, la grille est exacte. Au-delà de `max_buckets` intervalles (None :
+    sans limite), une partie des seuils est gardée, répartie selon les quantiles des valeurs
+    distinctes de `data` ; chaque intervalle prend alors la prédiction de la valeur médiane
+    des annonces qu'il contient.
+    """
+    compiled = CompiledForest(pipeline)
+    internal = compiled.left != np.arange(len(compiled.left))
+    axes = []
+    position = 0
+    for kind, columns, params in compiled.steps:
+        for index, column in enumerate(columns):
+            if kind == "ordinal":
+                categories = params[0][index][0]
+                axes.append({"column": column, "kind": "category", "categories": [str(category) for category in categories]})
+            else:
+                edges = np.unique(compiled.threshold[internal & (compiled.feature == position)])
+                axes.append(_numeric_axis(column, edges, data[column].to_numpy(dtype=np.float64), max_buckets))
+            position += 1
+    return axes
+
+
+def _numeric_axis(column, edges, values, max_buckets):
+    # Variables comparées en float32, comme dans la forêt
+    values = values.astype(np.float32)
+    exact = max_buckets is None or len(edges) + 1 <= max_buckets
+    if not exact:
+        # Quantiles des valeurs distinctes : les valeurs très fréquentes (50 000 km…) ne concentrent pas tous les seuils
+        targets = np.quantile(np.unique(values), np.linspace(0, 1, max_buckets + 1)[1:-1])
+        edges = np.unique(edges[np.searchsorted(edges, targets).clip(0, len(edges) - 1)])
+    # Représentant de chaque intervalle ]e(b-1), e(b)] : le seuil e(b) lui-même (un float32),
+    # et pour le dernier intervalle le float32 suivant le dernier seuil
+    representatives = np.append(edges, np.nextafter(edges[-1], np.float32(np.inf))) if len(edges) else np.zeros(1, np.float32)
+    if not exact:
+        buckets = np.searchsorted(edges, values, side="left")
+        for bucket in np.unique(buckets):
+            representatives[bucket] = np.median(values[buckets == bucket])
+    return {"column": column, "kind": "numeric", "edges": edges.tolist(), "representatives": representatives.tolist(), "exact": exact}
+
+
+def build_grid(pipeline, axes, chunk_rows=200000):
+    """Prédiction du pipeline pour chaque cellule de la grille, en tableau à une dimension par axe."""
+    shape = [len(axis["categories"]) if axis["kind"] == "category" else len(axis["representatives"]) for axis in axes]
+    points = [axis["categories"] if axis["kind"] == "category" else axis["representatives"] for axis in axes]
+    # Colonnes ignorées par le pipeline : valeur quelconque, elles ne sont pas lues
+    fill = {column: 0 for column in pipeline.feature_names_in_}
+    values = np.empty(int(np.prod(shape)))
+    for start in range(0, len(values), chunk_rows):
+        index = np.unravel_index(np.arange(start, min(start + chunk_rows, len(values))), shape)
+        frame = pd.DataFrame({**fill, **{axis["column"]: np.asarray(point)[i] for axis, point, i in zip(axes, points, index)}})
+        values[start:start + len(frame)] = pipeline.predict(frame[list(pipeline.feature_names_in_)])
+    return values.reshape(shape)
+
+
+def save_grid(directory, fingerprint, values, metadata):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, fingerprint)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npy")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp_path, f"{path}.npy")
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".json") as f:
+        json.dump({**metadata, "fingerprint": fingerprint, "shape": list(values.shape)}, f, indent=2)
+    os.replace(f.name, f"{path}.json")
+
+
+class PriceGrid:
+    """Prix précalculés sur toute la grille des entrées du modèle, lus en mémoire mappée.
+
+    Une prédiction revient à un index par axe (recherche dichotomique dans les seuils, ou
+    dictionnaire des catégories) et à une lecture dans le tableau. Les entrées hors grille
+    (catégorie inconnue du modèle, colonne absente) renvoient None.
+    """
+
+    def __init__(self, values, metadata):
+        self.values = values
+        self.metadata = metadata
+        self.columns = [axis["column"] for axis in metadata["axes"]]
+        self._lookups = []
+        for axis in metadata["axes"]:
+            if axis["kind"] == "category":
+                self._lookups.append(("category", {category: index for index, category in enumerate(axis["categories"])}))
+            else:
+                self._lookups.append(("numeric", np.asarray(axis["edges"], dtype=np.float32)))
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, row):
+        # Pas de verrou : les compteurs ne servent qu'aux statistiques
+        index = []
+        for column, (kind, table) in zip(self.columns, self._lookups):
+            value = row.get(column)
+            if kind == "category":
+                position = table.get(str(value))
+                if position is None:
+                    self.misses += 1
+                    return None
+            else:
+                if value is None:
+                    self.misses += 1
+                    return None
+                position = int(np.searchsorted(table, np.float32(value), side="left"))
+            index.append(position)
+        self.hits += 1
+        return float(self.values[tuple(index)])
+
+    def lookup_frame(self, frame):
+        """Version vectorisée de `lookup` : prix et masque des lignes présentes dans la grille."""
+        index = []
+        found = np.ones(len(frame), dtype=bool)
+        for column, (kind, table) in zip(self.columns, self._lookups):
+            if kind == "category":
+                positions = frame[column].astype(str).map(table)
+                found &= positions.notna().to_numpy()
+                index.append(positions.fillna(0).to_numpy(dtype=np.intp))
+            else:
+                index.append(np.searchsorted(table, frame[column].to_numpy(dtype=np.float32), side="left"))
+        return np.where(found, self.values[tuple(index)], np.nan), found
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def describe(self):
+        return {
+            "fingerprint": self.metadata["fingerprint"],
+            "model_uri": self.metadata.get("model_uri"),
+            "created_at": self.metadata.get("created_at"),
+            "shape": self.metadata["shape"],
+            "exact": all(axis.get("exact", True) for axis in self.metadata["axes"]),
+            "error_bound": self.metadata.get("error_bound"),
+            **self.stats(),
+        }
+
+
+def load_price_grid(directory, pipeline):
+    """Grille construite pour ce modèle précis (même empreinte), ou None s'il n'y en a pas."""
+    if pipeline is None:
+        return None
+    try:
+        fingerprint = model_fingerprint(pipeline)
+    except UnsupportedModel as e:
+        logger.info("Grille de prix non prise en charge pour ce modèle : %s", e)
+        return None
+    path = os.path.join(directory, fingerprint)
+    if not os.path.exists(f"{path}.json"):
+        logger.info("Aucune grille de prix pour ce modèle (%s)", fingerprint[:12])
+        return None
+    with open(f"{path}.json") as f:
+        metadata = json.load(f)
+    # Projeté en mémoire : seules les pages lues sont chargées, et partagées entre processus
+    values = np.load(f"{path}.npy", mmap_mode="r")
+    logger.info("Grille de prix chargée : %s cellules", values.size)
+    return PriceGrid(values, metadata)
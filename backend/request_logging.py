@@ -0,0 +1,94 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+
+# Identifiant de la requête en cours (en-tête X-Request-ID du client, sinon généré à la demande)
+request_id = contextvars.ContextVar("request_id", default=None)
+
+_listener = None
+_previous_handlers = []
+_request_logger = logging.getLogger("autopredict.requests")
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Le message est mis en forme par le thread d'écriture, pas par la boucle d'événements
+    def prepare(self, record):
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(), **record.fields}
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level, request_log_path=""):
+    """Installe des handlers non bloquants : les logs passent par une file vidée dans un thread dédié."""
+    global _listener, _previous_handlers
+    if _listener is not None:
+        return
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    requests_handler = logging.FileHandler(request_log_path) if request_log_path else logging.StreamHandler(sys.stderr)
+    requests_handler.setFormatter(JsonLinesFormatter())
+
+    # Un seul thread d'écriture : chaque enregistrement est routé vers son handler selon son logger
+    console.addFilter(lambda record: record.name != _request_logger.name)
+    requests_handler.addFilter(lambda record: record.name == _request_logger.name)
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, console, requests_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    _previous_handlers = root.handlers
+    root.handlers = [_DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+    _request_logger.setLevel(logging.INFO)
+
+
+def shutdown_logging():
+    # Vide la file, puis rend au logger racine ses handlers d'origine : les logs émis ensuite
+    # (arrêt d'uvicorn, nouvelle mise en route dans le même processus) sont encore écrits
+    global _listener, _previous_handlers
+    if _listener is not None:
+        root = logging.getLogger()
+        root.handlers = [handler for handler in root.handlers if not isinstance(handler, _DeferredQueueHandler)] + _previous_handlers
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _previous_handlers = []
+
+
+class RequestLog:
+    """Journal des requêtes en JSON lines, échantillonné.
+
+    `sampled()` est appelé avant de construire quoi que ce soit : une requête non
+    retenue ne coûte qu'un tirage aléatoire.
+    """
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    def sampled(self):
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def log(self, endpoint, features, timings, **result):
+        if not self.sampled():
+            return
+        fields = {
+            "request_id": request_id.get() or uuid.uuid4().hex,
+            "endpoint": endpoint,
+            "features": features,
+            **result,
+            "timings_ms": {stage: round(duration * 1000, 3) for stage, duration in timings.items()},
+        }
+        _request_logger.info("requête", extra={"fields": fields})
@@ -1,4 +1,6 @@
-import pandas as pd
+import os
+import sys
+
 import mlflow
 import mlflow.sklearn
 from sklearn.model_selection import train_test_split
@@ -9,16 +11,16 @@ from sklearn.preprocessing import OneHotEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.metrics import mean_squared_error
 
-# Charger les données
-df = pd.read_csv("./data/cartest.csv")
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from dataset import load_training_data
+from features import LABEL_ENCODER, attach_encoder
 
-# Préparer les colonnes
-df["brand"] = df["name"].str.split().str[0]
-df = df.drop("name", axis=1)
+# Charger les données, avec les libellés d'origine : le pipeline OneHot les encode lui-même
+X, y = load_training_data(encoded=False)
 
 # Diviser les données
-X = df.drop("selling_price", axis=1)
-y = df["selling_price"]
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
 # Définir les colonnes
@@ -53,6 +55,9 @@ print("Entraînement en cours...")
 model.fit(X_train, y_train)
 print("Modèle entraîné avec succès.")
 
+# Enregistrer l'encodage avec le modèle : l'API valide les libellés puis les transmet tels quels
+attach_encoder(model, LABEL_ENCODER)
+
 # Évaluer le modèle
 y_pred = model.predict(X_test)
 mse = mean_squared_error(y_test, y_pred)
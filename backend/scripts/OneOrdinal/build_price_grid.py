@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from config import MLFLOW_TRACKING_URI, MODEL_SNAPSHOT_DIR, MODEL_SOURCE, MODEL_URI, PRICE_GRID_DIR
+from dataset import load_training_data
+from features import DEFAULT_ENCODER, encoder_from_pipeline
+from model_loader import load_model, unwrap_sklearn_pipeline
+from price_grid import PriceGrid, build_grid, grid_axes, model_fingerprint, save_grid
+
+
+def error_bound(grid, pipeline, X):
+    # Écart entre la grille et les prédictions exactes du modèle sur toutes les annonces connues
+    exact = pipeline.predict(X)
+    approximate, found = grid.lookup_frame(X)
+    difference = np.abs(approximate[found] - exact[found])
+    relative = difference / np.maximum(np.abs(exact[found]), 1)
+    return {
+        "rows_checked": len(X),
+        "coverage": round(float(found.mean()), 4),
+        "max_abs_error": float(difference.max()) if len(difference) else None,
+        "mean_abs_error": float(difference.mean()) if len(difference) else None,
+        "p99_abs_error": float(np.quantile(difference, 0.99)) if len(difference) else None,
+        "max_relative_error": float(relative.max()) if len(relative) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Précalcule les prix du modèle sur toute la grille des entrées, pour /predict.")
+    parser.add_argument("--model-uri", default=MODEL_URI)
+    parser.add_argument("--source", default=MODEL_SOURCE, choices=["auto", "registry", "snapshot"])
+    parser.add_argument("--snapshot-dir", default=MODEL_SNAPSHOT_DIR)
+    parser.add_argument("--tracking-uri", default=MLFLOW_TRACKING_URI)
+    parser.add_argument("--data", default="./data/cartest.csv", help="Annonces utilisées pour répartir les intervalles et mesurer l'erreur")
+    parser.add_argument("--output-dir", default=PRICE_GRID_DIR)
+    parser.add_argument("--max-buckets", type=int, default=2048,
+                        help="Intervalles au plus par colonne numérique, au-delà la grille est approchée ; 0 : grille exacte")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    args = parser.parse_args()
+
+    model, source, _ = load_model(args.model_uri, args.source, args.snapshot_dir, args.tracking_uri)
+    pipeline = unwrap_sklearn_pipeline(model)
+    if pipeline is None:
+        raise ValueError(f"{args.model_uri} n'est pas un pipeline sklearn")
+    fingerprint = model_fingerprint(pipeline)
+    print(f"Modèle {args.model_uri} chargé ({source}), empreinte {fingerprint[:12]}")
+
+    X, _ = load_training_data(args.data, encoder=encoder_from_pipeline(pipeline) or DEFAULT_ENCODER)
+    axes = grid_axes(pipeline, X, args.max_buckets or None)
+    for axis in axes:
+        size = len(axis["categories"]) if axis["kind"] == "category" else len(axis["representatives"])
+        exact = "" if axis["kind"] == "category" or axis["exact"] else " (approché)"
+        print(f"  {axis['column']} : {size} valeurs{exact}")
+
+    start = time.perf_counter()
+    pipeline[-1].set_params(n_jobs=args.n_jobs)
+    values = build_grid(pipeline, axes)
+    build_seconds = time.perf_counter() - start
+    print(f"{values.size} cellules calculées en {build_seconds:.1f} s ({values.nbytes / 1e6:.1f} Mo)")
+
+    metadata = {
+        "model_uri": args.model_uri,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "build_seconds": round(build_seconds, 2),
+        "axes": axes,
+    }
+    grid = PriceGrid(values, {**metadata, "fingerprint": fingerprint, "shape": list(values.shape)})
+    metadata["error_bound"] = error_bound(grid, pipeline, X)
+    print(f"Écart avec le modèle sur {args.data} : {metadata['error_bound']}")
+
+    save_grid(args.output_dir, fingerprint, values, metadata)
+    print(f"Grille écrite dans {os.path.join(args.output_dir, fingerprint)}.npy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+import numpy as np
+import mlflow.pyfunc
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from dataset import decode_categories, load_dataset
+from features import FEATURE_COLUMNS, encode_frame
+from forest_engine import CompiledForest
+from model_loader import unwrap_sklearn_pipeline
+
+# Charger le modèle depuis MLflow
+mlflow.set_tracking_uri("http://127.0.0.1:8080")
+model_uri = "models:/OptimizedRandomForestModel/3"  # Mettre la bonne version du modèle
+model = mlflow.pyfunc.load_model(model_uri)
+print("Modèle chargé avec succès.")
+
+# Compiler la forêt
+compiled = CompiledForest(unwrap_sklearn_pipeline(model))
+print(f"Forêt compilée : {compiled.n_trees} arbres, {len(compiled.value)} nœuds, profondeur {compiled.max_depth}")
+
+# Charger toutes les lignes de cartest.csv
+X, _ = encode_frame(decode_categories(load_dataset())[FEATURE_COLUMNS])
+print(f"{len(X)} lignes à comparer")
+
+# Comparer les prédictions sur l'ensemble du jeu de données
+start = time.perf_counter()
+expected = model.predict(X)
+pyfunc_time = time.perf_counter() - start
+
+start = time.perf_counter()
+actual = compiled.predict(X)
+compiled_time = time.perf_counter() - start
+
+mismatches = np.flatnonzero(np.asarray(expected) != actual)
+print(f"Temps pyfunc : {pyfunc_time * 1000:.1f} ms, temps compilé : {compiled_time * 1000:.1f} ms")
+print(f"Écart absolu maximal : {np.max(np.abs(np.asarray(expected) - actual))}")
+
+# Comparer aussi ligne par ligne, le cas servi par /predict
+for index in range(0, len(X), max(1, len(X) // 50)):
+    row = X.iloc[[index]]
+    if model.predict(row)[0] != compiled.predict({column: row[column].tolist() for column in FEATURE_COLUMNS})[0]:
+        mismatches = np.append(mismatches, index)
+
+if len(mismatches):
+    print(f"ÉCHEC : {len(mismatches)} prédictions différentes, par exemple aux lignes {mismatches[:10].tolist()}")
+    sys.exit(1)
+print("OK : prédictions strictement identiques à model.predict.")
@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from config import MLFLOW_TRACKING_URI, MODEL_SNAPSHOT_DIR, MODEL_SOURCE, MODEL_URI, ONNX_INTRA_OP_THREADS, ONNX_MODEL_DIR
+from dataset import load_training_data
+from features import DEFAULT_ENCODER, FEATURE_COLUMNS, encoder_from_pipeline
+from model_loader import load_model, unwrap_sklearn_pipeline
+from onnx_engine import load_onnx_forest
+
+
+def median_ms(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return 1000 * float(np.median(durations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les prédictions du moteur ONNX à celles du pipeline sklearn.")
+    parser.add_argument("--model-uri", default=MODEL_URI)
+    parser.add_argument("--source", default=MODEL_SOURCE, choices=["auto", "registry", "snapshot"])
+    parser.add_argument("--snapshot-dir", default=MODEL_SNAPSHOT_DIR)
+    parser.add_argument("--tracking-uri", default=MLFLOW_TRACKING_URI)
+    parser.add_argument("--onnx-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--threads", type=int, default=ONNX_INTRA_OP_THREADS)
+    parser.add_argument("--data", default="./data/cartest.csv")
+    parser.add_argument("--rtol", type=float, default=1e-5, help="Écart relatif accepté (cumul des arbres en float32 dans onnxruntime)")
+    parser.add_argument("--repeat", type=int, default=200, help="Prédictions d'une ligne chronométrées par moteur")
+    args = parser.parse_args()
+
+    model, source, _ = load_model(args.model_uri, args.source, args.snapshot_dir, args.tracking_uri)
+    pipeline = unwrap_sklearn_pipeline(model)
+    if pipeline is None:
+        raise ValueError(f"{args.model_uri} n'est pas un pipeline sklearn")
+    print(f"Modèle {args.model_uri} chargé ({source}).")
+
+    start = time.perf_counter()
+    onnx_forest = load_onnx_forest(args.onnx_dir, pipeline, args.threads)
+    print(f"Session ONNX prête en {time.perf_counter() - start:.1f} s ({args.threads} threads par appel)")
+
+    # Toutes les lignes du jeu de données, plus une marque inconnue et des valeurs manquantes
+    X, _ = load_training_data(args.data, encoder=encoder_from_pipeline(pipeline) or DEFAULT_ENCODER)
+    X = X[FEATURE_COLUMNS]
+    edge_cases = X.iloc[:3].copy()
+    edge_cases["brand"] = edge_cases["brand"].astype(object)
+    edge_cases.iloc[0, edge_cases.columns.get_loc("brand")] = "Marque inconnue"
+    edge_cases["year"] = edge_cases["year"].astype(float)
+    edge_cases.iloc[1, edge_cases.columns.get_loc("year")] = np.nan
+    edge_cases["km_driven"] = edge_cases["km_driven"].astype(float)
+    edge_cases.iloc[2, edge_cases.columns.get_loc("km_driven")] = np.nan
+    print(f"{len(X)} lignes à comparer, plus {len(edge_cases)} cas limites")
+
+    failed = False
+    for name, frame in (("jeu de données", X), ("cas limites", edge_cases)):
+        expected = pipeline.predict(frame)
+        actual = onnx_forest.predict(frame)
+        difference = np.abs(actual - expected)
+        relative = difference / np.maximum(np.abs(expected), 1)
+        print(f"{name} : écart absolu maximal {difference.max():.4f}, relatif maximal {relative.max():.2e}")
+        mismatches = np.flatnonzero(relative > args.rtol)
+        if len(mismatches):
+            print(f"  ÉCHEC : {len(mismatches)} prédictions hors tolérance, par exemple aux lignes {mismatches[:10].tolist()}")
+            failed = True
+
+    row = X.iloc[[0]]
+    row_dict = {column: row[column].tolist() for column in FEATURE_COLUMNS}
+    print(
+        f"Latence d'une ligne : sklearn {median_ms(lambda: pipeline.predict(row), args.repeat):.3f} ms, "
+        f"ONNX {median_ms(lambda: onnx_forest.predict(row_dict), args.repeat):.3f} ms"
+    )
+    print(
+        f"Lot complet : sklearn {median_ms(lambda: pipeline.predict(X), 3):.1f} ms, "
+        f"ONNX {median_ms(lambda: onnx_forest.predict(X), 3):.1f} ms"
+    )
+
+    if failed:
+        sys.exit(1)
+    print(f"OK : prédictions ONNX identiques à sklearn à {args.rtol:g} près en relatif.")
+
+
+if __name__ == "__main__":
+    main()
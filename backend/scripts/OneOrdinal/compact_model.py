@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+import zlib
+
+import numpy as np
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from compaction import compact_pipeline, compaction_grid, select_compaction
+from config import MLFLOW_TRACKING_URI, MODEL_SNAPSHOT_DIR, MODEL_SOURCE, MODEL_URI
+from dataset import load_training_data, rows_sha256, source_sha256
+from features import DEFAULT_ENCODER, encoder_from_pipeline
+from forest_engine import CompiledForest
+from model_loader import load_model, unwrap_sklearn_pipeline
+
+
+def parse_depths(value):
+    return [None if depth == "none" else int(depth) for depth in value.split(",")]
+
+
+def median_ms(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return 1000 * float(np.median(durations))
+
+
+def describe(pipeline, X, y, repeat):
+    """Taille, temps de chargement, latence et erreur d'un pipeline, pour le rapport côte à côte."""
+    payload = pickle.dumps(pipeline, protocol=pickle.HIGHEST_PROTOCOL)
+    forest = pipeline[-1]
+    compiled = CompiledForest(pipeline)
+    row = X.iloc[[0]]
+    predictions = pipeline.predict(X)
+    return {
+        "n_trees": len(forest.estimators_),
+        "max_depth": max(estimator.tree_.max_depth for estimator in forest.estimators_),
+        "nodes": sum(estimator.tree_.node_count for estimator in forest.estimators_),
+        "size_bytes": len(payload),
+        "compressed_bytes": len(zlib.compress(payload)),
+        "load_ms": median_ms(lambda: pickle.loads(payload), 3),
+        "predict_row_ms": median_ms(lambda: pipeline.predict(row), repeat),
+        "predict_batch_ms": median_ms(lambda: pipeline.predict(X), 3),
+        "compiled_row_ms": median_ms(lambda: compiled.predict(row), repeat),
+        "mae": float(mean_absolute_error(y, predictions)),
+        "rmse": float(mean_squared_error(y, predictions) ** 0.5),
+        "r2": float(r2_score(y, predictions)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réduit la forêt d'un modèle (arbres, profondeur, float32) dans une tolérance d'erreur donnée.")
+    parser.add_argument("--model-uri", default=MODEL_URI)
+    parser.add_argument("--source", default=MODEL_SOURCE, choices=["auto", "registry", "snapshot"])
+    parser.add_argument("--snapshot-dir", default=MODEL_SNAPSHOT_DIR)
+    parser.add_argument("--tracking-uri", default=MLFLOW_TRACKING_URI)
+    parser.add_argument("--data", default="./data/cartest.csv")
+    parser.add_argument("--test-size", type=float, default=0.2, help="Part de test utilisée à l'entraînement (mêmes lignes)")
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--metric", choices=["rmse", "mae"], default="rmse")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Hausse relative de l'erreur acceptée (0.01 : +1 %%)")
+    parser.add_argument("--tree-counts", default="10,20,30,50,75,100,150,200,300,400,500")
+    parser.add_argument("--depths", default="6,8,10,12,14,16,20,25,30,none", help="Profondeurs candidates ; none : sans limite")
+    parser.add_argument("--no-quantize", action="store_true", help="Garder les seuils et valeurs des feuilles en float64")
+    parser.add_argument("--repeat", type=int, default=200, help="Prédictions d'une ligne chronométrées par modèle")
+    parser.add_argument("--report", default="compaction_report.json")
+    parser.add_argument("--no-mlflow", action="store_true", help="Ne pas enregistrer le modèle réduit dans MLflow")
+    parser.add_argument("--experiment", default="optimized_experiment")
+    parser.add_argument("--registered-model", default="OptimizedRandomForestModel")
+    args = parser.parse_args()
+
+    model, source, _ = load_model(args.model_uri, args.source, args.snapshot_dir, args.tracking_uri)
+    pipeline = unwrap_sklearn_pipeline(model)
+    if pipeline is None:
+        raise ValueError(f"{args.model_uri} n'est pas un pipeline sklearn")
+    print(f"Modèle {args.model_uri} chargé ({source}).")
+
+    # Lignes de test de l'entraînement, partagées en deux : l'une choisit la réduction, l'autre la mesure
+    X, y = load_training_data(args.data, encoder=encoder_from_pipeline(pipeline) or DEFAULT_ENCODER)
+    _, X_test, _, y_test = train_test_split(X, y, test_size=args.test_size, random_state=args.random_state)
+    X_select, X_eval, y_select, y_eval = train_test_split(X_test, y_test, test_size=0.5, random_state=args.random_state)
+
+    tree_counts = [int(count) for count in args.tree_counts.split(",")]
+    grid = compaction_grid(pipeline, X_select, y_select, tree_counts, parse_depths(args.depths))
+    full, chosen = select_compaction(grid, args.metric, args.tolerance)
+    print(
+        f"Retenu : {chosen['n_trees']} arbres, profondeur {chosen['max_depth'] or 'illimitée'}, "
+        f"{args.metric} {chosen[args.metric]:.0f} (forêt complète : {full[args.metric]:.0f}), "
+        f"{chosen['nodes']} nœuds sur {full['nodes']}"
+    )
+
+    compacted = compact_pipeline(pipeline, chosen["n_trees"], chosen["max_depth"], quantize=not args.no_quantize)
+    report = {
+        "model_uri": args.model_uri,
+        "metric": args.metric,
+        "tolerance": args.tolerance,
+        "quantized": not args.no_quantize,
+        "selection_rows": len(X_select),
+        "evaluation_rows": len(X_eval),
+        "chosen": chosen,
+        "original": describe(pipeline, X_eval, y_eval, args.repeat),
+        "compacted": describe(compacted, X_eval, y_eval, args.repeat),
+        "grid": grid,
+    }
+    for name in ("original", "compacted"):
+        entry = report[name]
+        print(
+            f"{name:>10} : {entry['size_bytes'] / 1e6:7.1f} Mo, chargement {entry['load_ms']:7.1f} ms, "
+            f"1 ligne {entry['predict_row_ms']:6.2f} ms (compilé {entry['compiled_row_ms']:6.2f} ms), "
+            f"lot {entry['predict_batch_ms']:7.1f} ms, RMSE {entry['rmse']:.0f}, MAE {entry['mae']:.0f}"
+        )
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Rapport écrit dans {args.report}")
+
+    if args.no_mlflow:
+        return
+
+    import mlflow
+    import mlflow.sklearn
+    from mlflow.models.signature import infer_signature
+
+    mlflow.set_tracking_uri(args.tracking_uri)
+    mlflow.set_experiment(args.experiment)
+    with mlflow.start_run(run_name="compaction"):
+        # Mêmes données que le modèle d'origine, pour les mises à jour incrémentales (incremental_train.py)
+        mlflow.set_tags({
+            "compacted_from": args.model_uri,
+            "data_sha256": source_sha256(args.data),
+            "data_rows": len(X),
+            "data_rows_sha256": rows_sha256(args.data),
+        })
+        mlflow.log_params({
+            "n_trees": chosen["n_trees"],
+            "max_depth": chosen["max_depth"],
+            "quantized": not args.no_quantize,
+            "tolerance": args.tolerance,
+            "metric": args.metric,
+        })
+        mlflow.log_metrics({f"{name}_{key}": value for name in ("original", "compacted")
+                            for key, value in report[name].items() if key not in ("n_trees", "max_depth")})
+        mlflow.log_dict(report, "compaction_report.json")
+        mlflow.sklearn.log_model(
+            sk_model=compacted,
+            artifact_path="optimized_model",
+            signature=infer_signature(X_eval, compacted.predict(X_eval)),
+            registered_model_name=args.registered_model,
+        )
+    print("Modèle réduit enregistré dans MLflow comme nouvelle version.")
+
+
+if __name__ == "__main__":
+    main()
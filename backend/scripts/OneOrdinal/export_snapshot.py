@@ -0,0 +1,25 @@
+import argparse
+import os
+import sys
+
+import mlflow
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from config import MLFLOW_TRACKING_URI, MODEL_SNAPSHOT_DIR, MODEL_URI
+from model_loader import export_snapshot, load_snapshot
+
+# Exporter une fois le modèle du registre MLflow en snapshot local vérifié par empreinte
+parser = argparse.ArgumentParser(description="Exporte un modèle MLflow en snapshot local pour l'API.")
+parser.add_argument("--model-uri", default=MODEL_URI)
+parser.add_argument("--snapshot-dir", default=MODEL_SNAPSHOT_DIR)
+args = parser.parse_args()
+
+mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+sha256 = export_snapshot(args.model_uri, args.snapshot_dir)
+print(f"Snapshot de {args.model_uri} écrit dans {args.snapshot_dir} ({sha256})")
+
+# Vérifier que le snapshot se recharge correctement
+load_snapshot(args.model_uri, args.snapshot_dir)
+print("Snapshot vérifié avec succès.")
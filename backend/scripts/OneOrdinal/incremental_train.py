@@ -0,0 +1,204 @@
+import argparse
+import copy
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import OrdinalEncoder
+from mlflow.models.signature import infer_signature
+from mlflow.tracking import MlflowClient
+import mlflow
+import mlflow.sklearn
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from dataset import load_training_data, rows_sha256, source_sha256
+from features import DEFAULT_ENCODER, attach_encoder, encoder_from_pipeline
+
+
+def resolve_base_version(client, name, version):
+    if version is None:
+        versions = client.search_model_versions(f"name='{name}'")
+        if not versions:
+            raise ValueError(f"Aucune version enregistrée pour {name}")
+        version = max(int(v.version) for v in versions)
+    model_version = client.get_model_version(name, str(version))
+    tags = client.get_run(model_version.run_id).data.tags
+    if "data_rows" not in tags or "data_rows_sha256" not in tags:
+        raise ValueError(
+            f"La version {version} de {name} n'indique pas les données utilisées (tags data_rows et data_rows_sha256) : "
+            "entraînez-la d'abord avec train_model.py."
+        )
+    return model_version, int(tags["data_rows"]), tags["data_rows_sha256"]
+
+
+def brand_encoder(pipeline):
+    preprocessor = pipeline[0]
+    if not isinstance(preprocessor, ColumnTransformer):
+        raise ValueError("Le premier étage du pipeline n'est pas un ColumnTransformer")
+    for name, transformer, columns in preprocessor.transformers_:
+        if isinstance(transformer, OrdinalEncoder) and "brand" in list(columns):
+            return transformer, list(columns).index("brand")
+    raise ValueError("Aucun OrdinalEncoder sur la colonne brand")
+
+
+def extend_brand_categories(pipeline, brands):
+    """Ajoute les marques inconnues à la fin des catégories de l'encodeur.
+
+    Les codes des marques connues ne changent pas : les arbres existants restent valides
+    et seuls les nouveaux arbres apprennent les nouvelles marques.
+    """
+    encoder, position = brand_encoder(pipeline)
+    known = encoder.categories_[position]
+    new_brands = sorted(set(brands.dropna()) - set(known))
+    if new_brands:
+        encoder.categories_[position] = np.concatenate([known, np.array(new_brands, dtype=known.dtype)])
+    return new_brands
+
+
+def evaluate(model, X, y):
+    y_pred = model.predict(X)
+    return {
+        "mse": float(mean_squared_error(y, y_pred)),
+        "mae": float(mean_absolute_error(y, y_pred)),
+        "r2": float(r2_score(y, y_pred)),
+    }
+
+
+def warm_start_update(pipeline, X_new, y_new, new_trees):
+    # Le prétraitement existant est conservé : seuls des arbres sont ajoutés, entraînés sur les nouvelles lignes
+    forest = pipeline[-1]
+    forest.set_params(warm_start=True, n_estimators=forest.n_estimators + new_trees)
+    forest.fit(pipeline[:-1].transform(X_new), y_new)
+    forest.set_params(warm_start=False)
+    return pipeline
+
+
+def window_update(pipeline, X_window, y_window):
+    # Nouvelle forêt, mêmes hyperparamètres, entraînée sur les lignes les plus récentes
+    pipeline.steps[-1] = (pipeline.steps[-1][0], clone(pipeline[-1]))
+    pipeline[-1].fit(pipeline[:-1].transform(X_window), y_window)
+    return pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Met à jour le modèle enregistré avec les annonces ajoutées depuis son entraînement.")
+    parser.add_argument("--data", default="./data/cartest.csv")
+    parser.add_argument("--registered-model", default="OptimizedRandomForestModel")
+    parser.add_argument("--base-version", type=int, help="Version de départ ; par défaut la dernière version enregistrée")
+    parser.add_argument("--mode", choices=["warm_start", "window"], default="warm_start",
+                        help="warm_start : arbres ajoutés sur les nouvelles lignes ; window : forêt réentraînée sur les lignes récentes")
+    parser.add_argument("--new-trees", type=int, help="Arbres ajoutés (warm_start) ; par défaut proportionnel au nombre de nouvelles lignes")
+    parser.add_argument("--window", type=int, default=2000, help="Nombre de lignes récentes utilisées en mode window")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--no-compare", action="store_true", help="Ne pas réentraîner entièrement pour comparaison")
+    parser.add_argument("--report", default="incremental_report.json")
+    parser.add_argument("--tracking-uri", default="http://127.0.0.1:8080")
+    parser.add_argument("--experiment", default="optimized_experiment")
+    args = parser.parse_args()
+
+    mlflow.set_tracking_uri(args.tracking_uri)
+    mlflow.set_experiment(args.experiment)
+    client = MlflowClient()
+    base_version, base_rows, base_sha256 = resolve_base_version(client, args.registered_model, args.base_version)
+    print(f"Version de départ : {args.registered_model}/{base_version.version} ({base_rows} lignes)")
+
+    # Empreinte des valeurs des lignes d'origine, indépendante de la mise en forme du CSV
+    if rows_sha256(args.data, base_rows) != base_sha256:
+        raise ValueError(
+            f"Les {base_rows} premières lignes de {args.data} ont changé depuis l'entraînement de la version "
+            f"{base_version.version} : seul un réentraînement complet (train_model.py) est possible."
+        )
+
+    X, y = load_training_data(args.data)
+    if len(X) == base_rows:
+        print("Aucune nouvelle ligne depuis la dernière version : rien à faire.")
+        return
+    print(f"{len(X) - base_rows} nouvelles lignes")
+
+    # Même découpage que l'entraînement d'origine pour les anciennes lignes ; les nouvelles sont découpées à part.
+    # Les trois modèles (départ, incrémental, complet) sont évalués sur le même ensemble de test.
+    old_train, old_test = train_test_split(np.arange(base_rows), test_size=args.test_size, random_state=args.random_state)
+    new_train, new_test = train_test_split(np.arange(base_rows, len(X)), test_size=args.test_size, random_state=args.random_state)
+    test_rows = np.concatenate([old_test, new_test])
+    X_test, y_test = X.iloc[test_rows], y.iloc[test_rows]
+
+    base_model = mlflow.sklearn.load_model(f"models:/{args.registered_model}/{base_version.version}")
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "base_version": base_version.version,
+        "mode": args.mode,
+        "rows_base": base_rows,
+        "rows_new": len(X) - base_rows,
+        "rows_test": len(test_rows),
+        "base": evaluate(base_model, X_test, y_test),
+    }
+
+    # Mise à jour incrémentale, sur une copie du modèle de départ
+    model = attach_encoder(copy.deepcopy(base_model), encoder_from_pipeline(base_model) or DEFAULT_ENCODER)
+    new_brands = extend_brand_categories(model, X["brand"].iloc[base_rows:])
+    if new_brands:
+        print(f"Nouvelles marques ajoutées à l'encodeur : {new_brands}")
+    start = time.perf_counter()
+    if args.mode == "warm_start":
+        n_trees = model[-1].n_estimators
+        new_trees = args.new_trees or max(10, math.ceil(n_trees * len(new_train) / len(old_train)))
+        model = warm_start_update(model, X.iloc[new_train], y.iloc[new_train], new_trees)
+        report["trees_added"] = new_trees
+    else:
+        window_rows = np.sort(np.concatenate([old_train, new_train]))[-args.window:]
+        model = window_update(model, X.iloc[window_rows], y.iloc[window_rows])
+        report["window_rows"] = len(window_rows)
+    report["new_brands"] = new_brands
+    report["incremental"] = {"train_seconds": time.perf_counter() - start, **evaluate(model, X_test, y_test)}
+
+    # Réentraînement complet de référence, avec les mêmes hyperparamètres
+    if not args.no_compare:
+        full_model = clone(base_model)
+        train_rows = np.concatenate([old_train, new_train])
+        start = time.perf_counter()
+        full_model.fit(X.iloc[train_rows], y.iloc[train_rows])
+        report["full_retrain"] = {"train_seconds": time.perf_counter() - start, **evaluate(full_model, X_test, y_test)}
+        report["speedup"] = report["full_retrain"]["train_seconds"] / report["incremental"]["train_seconds"]
+        print(
+            f"Incrémental : MSE {report['incremental']['mse']:.0f} en {report['incremental']['train_seconds']:.1f} s ; "
+            f"complet : MSE {report['full_retrain']['mse']:.0f} en {report['full_retrain']['train_seconds']:.1f} s"
+        )
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Rapport écrit dans {args.report}")
+
+    with mlflow.start_run(run_name=f"incremental-{args.mode}"):
+        mlflow.set_tags({
+            "data_rows": len(X),
+            "data_sha256": source_sha256(args.data),
+            "data_rows_sha256": rows_sha256(args.data),
+            "training_mode": args.mode,
+            "base_version": base_version.version,
+        })
+        mlflow.log_params(model[-1].get_params())
+        mlflow.log_metrics({f"{name}_{metric}": value for name in ("base", "incremental", "full_retrain") if name in report
+                            for metric, value in report[name].items()})
+        mlflow.log_dict(report, "incremental_report.json")
+        mlflow.sklearn.log_model(
+            sk_model=model,
+            artifact_path="optimized_model",
+            signature=infer_signature(X_test, model.predict(X_test)),
+            registered_model_name=args.registered_model,
+        )
+        print("Nouvelle version enregistrée dans MLflow.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,88 +1,123 @@
-import pandas as pd
-import mlflow.pyfunc
-from sklearn.model_selection import train_test_split
-import matplotlib.pyplot as plt
-
-# Charger le modèle depuis MLflow
-mlflow.set_tracking_uri("http://127.0.0.1:8080")
-model_uri = "models:/OptimizedRandomForestModel/3"  # Mettre la bonne version du modèle
-model = mlflow.pyfunc.load_model(model_uri)
-print("Modèle chargé avec succès.")
-
-# Charger les données de test
-df = pd.read_csv("./data/cartest.csv")
-
-# Préparer les données comme dans le script d'entraînement
-df["fuel"].replace({'Diesel': 0, 'Petrol': 1, 'LPG': 2, 'CNG': 3, 'Electric': 4}, inplace=True)
-df["transmission"].replace({'Automatic': 0, 'Manual': 1}, inplace=True)
-df["owner"].replace({'First Owner': 0, 'Second Owner': 1, 'Third Owner': 2, 'Fourth & Above Owner': 3, 'Test Drive Car': 4}, inplace=True)
-df["seller_type"].replace({'Dealer': 0, 'Individual': 1, 'Trustmark Dealer': 2}, inplace=True)
-df["brand"] = df["name"].str.split().str[0]
-df = df.drop("name", axis=1)
-
-# Séparer les features et la cible
-y = df["selling_price"]
-X = df.drop("selling_price", axis=1)
-
-# Diviser les données (utiliser les données de test pour l'affichage)
-_, X_test, _, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Faire des prédictions
-predictions = model.predict(X_test)
-
-# Créer un DataFrame pour afficher les résultats
-result = X_test.copy()
-result["actual_price"] = y_test.values
-result["predicted_price"] = predictions
-result["difference"] = abs(result["actual_price"] - result["predicted_price"])
-
-# Formater les colonnes en nombres entiers pour la lisibilité
-result["actual_price"] = result["actual_price"].astype(int)
-result["predicted_price"] = result["predicted_price"].round(0).astype(int)
-result["difference"] = result["difference"].round(0).astype(int)
-
-# Afficher un échantillon de résultats
-result_sample = result.sort_values(by="difference", ascending=False).head(10)
-print("Comparaison des prix réels et prédits :")
-print(result_sample)
-
-
-
-# Indices pour les marques
-indices = range(len(result_sample))
-
-# Création du graphique
-plt.figure(figsize=(14, 8))
-
-# Courbe pour les prix réels
-plt.plot(indices, result_sample["actual_price"], label="Prix Réel", marker="o", color="blue", linewidth=2)
-
-# Courbe pour les prix prédits
-plt.plot(indices, result_sample["predicted_price"], label="Prix Prédit", marker="o", color="orange", linewidth=2)
-
-# Zone colorée pour la différence
-plt.fill_between(
-    indices,
-    result_sample["actual_price"],
-    result_sample["predicted_price"],
-    color="gray",
-    alpha=0.3,
-    label="Différence (abs)"
-)
-
-# Ajout des labels
-plt.xticks(indices, result_sample["brand"], rotation=45)
-plt.title("Comparaison des prix réels et prédits avec différence", fontsize=14)
-plt.ylabel("Prix", fontsize=12)
-plt.xlabel("Marque", fontsize=12)
-plt.legend(fontsize=12)
-plt.grid(axis="y", linestyle="--", alpha=0.7)
-
-plt.tight_layout()
-plt.show()
-
+import argparse
+import json
+import os
+import sys
+import time
 
+import numpy as np
+from sklearn.model_selection import train_test_split
 
-# Sauvegarder les résultats dans un fichier CSV pour analyse ultérieure
-#result_sample.to_csv("evaluation_results.csv", index=False)
-#print("Les résultats ont été sauvegardés dans 'evaluation_results.csv'.")
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from config import MLFLOW_TRACKING_URI, MODEL_SNAPSHOT_DIR, MODEL_SOURCE, MODEL_URI
+from dataset import load_training_data
+from evaluation import METRICS, evaluate, largest_errors, render_html
+from features import DEFAULT_ENCODER, encoder_from_pipeline
+from model_loader import load_model, unwrap_sklearn_pipeline
+from plots import render_actual_vs_predicted, render_group_errors, render_price_comparison, render_residuals
+
+
+def predict_in_chunks(model, X, chunk_rows):
+    # Prédictions par paquets : la mémoire temporaire du modèle reste bornée quelle que soit la taille des données
+    return np.concatenate([model.predict(X.iloc[start:start + chunk_rows]) for start in range(0, len(X), chunk_rows)])
+
+
+def render_images(report, y, predictions, top):
+    brands = report["metrics"]["brand"][:30]
+    mae = [row["mae"] for row in brands]
+    has_ci = all(entry.get("ci_low") is not None for entry in mae)
+    return {
+        "Prix réels et prédits": render_actual_vs_predicted(y, predictions),
+        "Résidus": render_residuals(y, predictions),
+        "Erreur par marque (30 marques les plus fréquentes)": render_group_errors(
+            [row["group"] for row in brands],
+            [entry["value"] for entry in mae],
+            [entry["ci_low"] for entry in mae] if has_ci else None,
+            [entry["ci_high"] for entry in mae] if has_ci else None,
+            "MAE par marque",
+        ),
+        "Plus grands écarts": render_price_comparison(top["actual_price"], top["predicted_price"], top["brand"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Évalue un modèle et écrit un rapport HTML et JSON (métriques globales et par segment).")
+    parser.add_argument("--model-uri", default=MODEL_URI)
+    parser.add_argument("--source", default=MODEL_SOURCE, choices=["auto", "registry", "snapshot"])
+    parser.add_argument("--snapshot-dir", default=MODEL_SNAPSHOT_DIR)
+    parser.add_argument("--tracking-uri", default=MLFLOW_TRACKING_URI)
+    parser.add_argument("--data", default="./data/cartest.csv")
+    parser.add_argument("--split", choices=["test", "all"], default="test",
+                        help="test : les 20 %% de test de l'entraînement ; all : toutes les lignes")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Réplications du bootstrap (0 : pas d'intervalles de confiance)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processus utilisés pour le bootstrap")
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--output-dir", default="./evaluation_report")
+    parser.add_argument("--no-mlflow", action="store_true", help="Ne pas enregistrer le rapport dans MLflow")
+    parser.add_argument("--experiment", default="model_evaluation")
+    args = parser.parse_args()
+
+    model, source, _ = load_model(args.model_uri, args.source, args.snapshot_dir, args.tracking_uri)
+    encoder = encoder_from_pipeline(unwrap_sklearn_pipeline(model)) or DEFAULT_ENCODER
+    print(f"Modèle {args.model_uri} chargé ({source}).")
+
+    # Données préparées comme pour l'entraînement (cache Parquet partagé), avec l'encodage du modèle
+    X, y = load_training_data(args.data, encoder=encoder)
+    if args.split == "test":
+        _, X, _, y = train_test_split(X, y, test_size=args.test_size, random_state=args.random_state)
+
+    start = time.perf_counter()
+    predictions = predict_in_chunks(model, X, args.chunk_rows)
+    predict_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metrics = evaluate(X, y.to_numpy(), predictions, args.bootstrap, args.workers, encoder)
+    evaluation_seconds = time.perf_counter() - start
+
+    report = {
+        "meta": {
+            "model_uri": args.model_uri,
+            "data": args.data,
+            "split": args.split,
+            "rows": len(X),
+            "bootstrap": args.bootstrap,
+            "predict_seconds": round(predict_seconds, 2),
+            "evaluation_seconds": round(evaluation_seconds, 2),
+        },
+        "metrics": metrics,
+    }
+    top = largest_errors(X, y.to_numpy(), predictions)
+    report["largest_errors"] = top.to_dict(orient="records")
+    print("Comparaison des prix réels et prédits :")
+    print(top)
+
+    overall = metrics["overall"]
+    print("Global : " + ", ".join(f"{metric} {overall[metric]['value']:.3f}" for metric in METRICS))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    json_path = os.path.join(args.output_dir, "evaluation.json")
+    html_path = os.path.join(args.output_dir, "evaluation.html")
+    with open(json_path, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    with open(html_path, "w") as f:
+        f.write(render_html(report, render_images(report, y.to_numpy(), predictions, top), f"Évaluation de {args.model_uri}"))
+    print(f"Rapport écrit dans {html_path} et {json_path}")
+
+    if not args.no_mlflow:
+        import mlflow
+
+        mlflow.set_tracking_uri(args.tracking_uri)
+        mlflow.set_experiment(args.experiment)
+        with mlflow.start_run(run_name=f"evaluation-{args.split}"):
+            mlflow.set_tags({"model_uri": args.model_uri, "split": args.split})
+            mlflow.log_metrics({metric: overall[metric]["value"] for metric in METRICS if overall[metric]["value"] is not None})
+            mlflow.log_artifact(html_path)
+            mlflow.log_artifact(json_path)
+        print("Rapport enregistré dans MLflow.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
+import os
+import sys
+
 import pandas as pd
 import mlflow.pyfunc
 
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from features import DEFAULT_ENCODER, encoder_from_pipeline
+from model_loader import unwrap_sklearn_pipeline
+
 # Charger le modèle depuis MLflow
 mlflow.set_tracking_uri("http://127.0.0.1:8080")
 model_uri = "models:/OptimizedRandomForestModel/3"  # Remplacer par la bonne version
@@ -11,15 +20,16 @@ print("Modèle chargé avec succès.")
 user_input = {
     "year": 2015,
     "km_driven": 45000,
-    "fuel": 1,
-    "transmission": 1,
-    "owner": 0,
-    "seller_type": 0,
+    "fuel": "Petrol",
+    "transmission": "Manual",
+    "owner": "First Owner",
+    "seller_type": "Dealer",
     "brand": "Hyundai"  # Gardé en texte pour le modèle
 }
 
-# Convertir en DataFrame
-test_data = pd.DataFrame([user_input])
+# Encoder avec l'encodeur enregistré avec le modèle, puis convertir en DataFrame
+encoder = encoder_from_pipeline(unwrap_sklearn_pipeline(model)) or DEFAULT_ENCODER
+test_data = pd.DataFrame([encoder.encode_record(user_input)])
 
 # Afficher les colonnes fournies
 print("Colonnes fournies :", test_data.columns.tolist())
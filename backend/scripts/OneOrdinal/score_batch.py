@@ -0,0 +1,245 @@
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from config import MLFLOW_TRACKING_URI, MODEL_SNAPSHOT_DIR, MODEL_SOURCE, MODEL_URI
+from features import DEFAULT_ENCODER, FEATURE_COLUMNS, encoder_from_pipeline
+from forest_engine import CompiledForest
+from model_loader import load_model, unwrap_sklearn_pipeline
+
+OUTPUT_COLUMNS = ["predicted_selling_price", "error"]
+
+# Modèle et encodeur chargés une fois dans le processus parent, puis hérités par les
+# processus de travail au fork (pages partagées en copie à l'écriture)
+_predict = None
+_encoder = None
+
+
+def score_frame(raw):
+    """Prédit un paquet de lignes brutes ; les lignes invalides reçoivent un message d'erreur au lieu d'un prix."""
+    raw = raw.reset_index(drop=True)
+    features = raw.copy()
+    if "brand" not in features.columns and "name" in features.columns:
+        features["brand"] = features["name"].str.split().str[0]
+    missing = [column for column in FEATURE_COLUMNS if column not in features.columns]
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans le fichier d'entrée : {missing}")
+
+    errors = np.full(len(raw), "", dtype=object)
+    valid = np.ones(len(raw), dtype=bool)
+    for column in ("year", "km_driven"):
+        values = pd.to_numeric(features[column], errors="coerce")
+        invalid = values.isna().to_numpy() & valid
+        errors[invalid] = f"{column} invalide"
+        valid &= ~invalid
+        features[column] = values
+
+    encoded, encoding_errors = _encoder.encode_frame(features.loc[valid, FEATURE_COLUMNS])
+    for index, message in encoding_errors.items():
+        errors[index] = message
+
+    predictions = np.full(len(raw), np.nan)
+    if len(encoded):
+        predictions[encoded.index.to_numpy()] = _predict(encoded)
+
+    result = raw.copy()
+    result["predicted_selling_price"] = np.round(predictions, 2)
+    result["error"] = errors
+    return result, len(encoding_errors) + int((~valid).sum())
+
+
+def score_chunk(payload):
+    # Exécuté dans un processus de travail : `payload` est un morceau de CSV (en-tête compris) ou un DataFrame
+    raw = pd.read_csv(io.BytesIO(payload)) if isinstance(payload, bytes) else payload
+    result, n_errors = score_frame(raw)
+    return result.to_csv(index=False, header=False).encode(), len(result), n_errors
+
+
+def iter_csv_chunks(path, chunk_rows, position):
+    # Découpage par lignes : `position` est l'offset en octets après le dernier paquet écrit.
+    # Les champs contenant des retours à la ligne ne sont pas pris en charge.
+    with open(path, "rb") as f:
+        header = f.readline()
+        if position:
+            f.seek(position)
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            yield header + b"".join(lines), f.tell()
+
+
+def iter_parquet_chunks(path, chunk_rows, position):
+    # `position` est le nombre de lignes déjà traitées ; les paquets ont toujours la même taille
+    import pyarrow.parquet as pq
+
+    consumed = 0
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows):
+        consumed += batch.num_rows
+        if consumed > position:
+            yield batch.to_pandas(), consumed
+
+
+def input_columns(path, is_parquet):
+    if is_parquet:
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+class Checkpoint:
+    """Avancement enregistré après chaque paquet écrit, pour reprendre après un arrêt brutal.
+
+    La sortie est tronquée à `output_bytes` à la reprise : un paquet à moitié écrit est refait.
+    """
+
+    def __init__(self, path, identity):
+        self.path = path
+        self.identity = identity
+        self.state = {"position": 0, "rows": 0, "errors": 0, "output_bytes": 0, "completed": False}
+
+    def load(self):
+        with open(self.path) as f:
+            saved = json.load(f)
+        changed = [key for key, value in self.identity.items() if saved.get(key) != value]
+        if changed:
+            raise ValueError(f"Point de reprise incompatible ({changed}) : relancez sans --resume")
+        self.state.update({key: saved[key] for key in self.state})
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({**self.identity, **self.state}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(children, 1)
+
+
+def main():
+    global _predict, _encoder
+
+    parser = argparse.ArgumentParser(description="Prédit le prix de chaque ligne d'un fichier CSV ou Parquet de taille quelconque.")
+    parser.add_argument("input", help="Fichier CSV ou Parquet (colonnes de CarFeatures, ou `name` à la place de `brand`)")
+    parser.add_argument("output", help="Fichier CSV de sortie : colonnes d'entrée, predicted_selling_price et error")
+    parser.add_argument("--model-uri", default=MODEL_URI)
+    parser.add_argument("--source", default=MODEL_SOURCE, choices=["auto", "registry", "snapshot"])
+    parser.add_argument("--snapshot-dir", default=MODEL_SNAPSHOT_DIR)
+    parser.add_argument("--engine", default="pyfunc", choices=["pyfunc", "compiled"])
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-pending", type=int, help="Paquets en vol au maximum (mémoire bornée) ; par défaut 2 par processus")
+    parser.add_argument("--resume", action="store_true", help="Reprendre depuis le point de reprise de la sortie")
+    parser.add_argument("--progress-every", type=float, default=5, help="Intervalle entre deux lignes d'avancement, en secondes")
+    parser.add_argument("--report", help="Fichier JSON où écrire le rapport final")
+    args = parser.parse_args()
+
+    is_parquet = args.input.endswith((".parquet", ".pq"))
+    input_size = os.path.getsize(args.input)
+    checkpoint = Checkpoint(f"{args.output}.checkpoint.json", {
+        "input": os.path.abspath(args.input),
+        "input_size": input_size,
+        "model_uri": args.model_uri,
+        "chunk_rows": args.chunk_rows,
+    })
+    if args.resume:
+        checkpoint.load()
+        if checkpoint.state["completed"]:
+            print(f"{args.output} est déjà complet ({checkpoint.state['rows']} lignes).")
+            return
+        print(f"Reprise après {checkpoint.state['rows']} lignes")
+    elif os.path.exists(args.output):
+        raise ValueError(f"{args.output} existe déjà : utilisez --resume ou supprimez-le")
+
+    model, source, _ = load_model(args.model_uri, args.source, args.snapshot_dir, MLFLOW_TRACKING_URI)
+    pipeline = unwrap_sklearn_pipeline(model)
+    _encoder = encoder_from_pipeline(pipeline) or DEFAULT_ENCODER
+    _predict = CompiledForest(pipeline).predict if args.engine == "compiled" else model.predict
+    print(f"Modèle {args.model_uri} chargé ({source}, moteur {args.engine})")
+
+    if args.resume:
+        out = open(args.output, "r+b")
+        out.truncate(checkpoint.state["output_bytes"])
+        out.seek(checkpoint.state["output_bytes"])
+    else:
+        out = open(args.output, "wb")
+        out.write(pd.DataFrame(columns=input_columns(args.input, is_parquet) + OUTPUT_COLUMNS).to_csv(index=False).encode())
+
+    state = checkpoint.state
+    iter_chunks = iter_parquet_chunks if is_parquet else iter_csv_chunks
+    chunks = iter_chunks(args.input, args.chunk_rows, state["position"])
+    max_pending = args.max_pending or 2 * args.workers
+    rows_at_start = state["rows"]
+    start = last_progress = time.perf_counter()
+
+    def write_result(result, position):
+        nonlocal last_progress
+        data, rows, errors = result
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+        state.update(position=position, output_bytes=out.tell(), rows=state["rows"] + rows, errors=state["errors"] + errors)
+        checkpoint.save()
+
+        now = time.perf_counter()
+        if now - last_progress >= args.progress_every:
+            last_progress = now
+            rate = (state["rows"] - rows_at_start) / (now - start)
+            done = f" ({100 * position / input_size:.1f} %)" if not is_parquet else ""
+            print(f"{state['rows']} lignes{done}, {rate:.0f} lignes/s, {state['errors']} erreurs")
+
+    # Fenêtre bornée de paquets en vol, écrits dans l'ordre du fichier d'entrée
+    pending = deque()
+    with multiprocessing.get_context("fork").Pool(args.workers) as pool:
+        for payload, position in chunks:
+            pending.append((pool.apply_async(score_chunk, (payload,)), position))
+            if len(pending) >= max_pending:
+                result, position = pending.popleft()
+                write_result(result.get(), position)
+        while pending:
+            result, position = pending.popleft()
+            write_result(result.get(), position)
+    out.close()
+
+    state["completed"] = True
+    checkpoint.save()
+    elapsed = time.perf_counter() - start
+    rss, children_rss = peak_rss_mb()
+    report = {
+        "input": args.input,
+        "output": args.output,
+        "model_uri": args.model_uri,
+        "rows": state["rows"],
+        "rows_this_run": state["rows"] - rows_at_start,
+        "errors": state["errors"],
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round((state["rows"] - rows_at_start) / elapsed, 1) if elapsed > 0 else None,
+        "workers": args.workers,
+        "chunk_rows": args.chunk_rows,
+        "peak_rss_mb": rss,
+        "peak_worker_rss_mb": children_rss,
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
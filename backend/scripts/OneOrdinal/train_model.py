@@ -1,5 +1,14 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split, RandomizedSearchCV
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import KFold, ParameterSampler, cross_validate, train_test_split
 from sklearn.pipeline import make_pipeline
 from sklearn.compose import make_column_transformer
 from sklearn.impute import SimpleImputer
@@ -10,81 +19,265 @@ from mlflow.models.signature import infer_signature
 import mlflow
 import mlflow.sklearn
 
-# Charger les données
-df = pd.read_csv("./data/cartest.csv")
-
-# Préparer les données
-df["fuel"] = df["fuel"].replace({'Diesel': 0, 'Petrol': 1, 'LPG': 2, 'CNG': 3, 'Electric': 4})
-df["transmission"] = df["transmission"].replace({'Automatic': 0, 'Manual': 1})
-df["owner"] = df["owner"].replace({'First Owner': 0, 'Second Owner': 1, 'Third Owner': 2, 'Fourth & Above Owner': 3, 'Test Drive Car': 4})
-df["seller_type"] = df["seller_type"].replace({'Dealer': 0, 'Individual': 1, 'Trustmark Dealer': 2})
-df["brand"] = df["name"].str.split().str[0]
-df = df.drop("name", axis=1)
-
-# Séparer les features et la cible
-y = df["selling_price"]
-X = df.drop("selling_price", axis=1)
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-# Diviser les données
-x_train, x_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+from dataset import load_training_data, rows_sha256, source_sha256
+from features import attach_encoder
+from onnx_engine import ONNX_FILE, OnnxForest, to_onnx
 
-# Pipeline pour la préparation des données
-preprocessor = make_column_transformer(
-    (SimpleImputer(strategy="mean"), ["year", "km_driven"]),
-    (OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1), ["brand"])
-)
-
-# Construire le pipeline
-pipeline = make_pipeline(preprocessor, RandomForestRegressor(random_state=42))
-
-# Paramètres pour RandomizedSearchCV
-param_distributions = {
+# Espace de recherche des hyperparamètres
+PARAM_DISTRIBUTIONS = {
     "randomforestregressor__n_estimators": [100, 200, 300, 400, 500],
     "randomforestregressor__max_depth": [None, 10, 20, 30, 40],
     "randomforestregressor__min_samples_split": [2, 5, 10],
     "randomforestregressor__min_samples_leaf": [1, 2, 4],
     "randomforestregressor__max_features": ["auto", "sqrt", "log2"]
 }
+SCORING = "neg_mean_squared_error"
+
+# Paramètres de la recherche : une reprise n'est possible qu'avec les mêmes valeurs
+SEARCH_SETTINGS = ("mode", "n_iter", "cv", "factor", "random_state", "test_size", "data_sha256")
 
-# RandomizedSearchCV
-print("Recherche des meilleurs hyperparamètres en cours...")
-search = RandomizedSearchCV(
-    pipeline,
-    param_distributions,
-    n_iter=50,
-    scoring="neg_mean_squared_error",
-    cv=3,
-    verbose=1,
-    random_state=42,
-    n_jobs=-1
-)
-
-search.fit(x_train, y_train)
-best_model = search.best_estimator_
-print(f"Meilleurs hyperparamètres : {search.best_params_}")
-
-# Évaluation sur les données de test
-y_pred = best_model.predict(x_test)
-mse = mean_squared_error(y_test, y_pred)
-r2 = r2_score(y_test, y_pred)
-print(f"Mean Squared Error : {mse}")
-print(f"R² : {r2}")
-
-# Signature pour MLflow
-signature = infer_signature(x_test, y_pred)
-
-# Intégration avec MLflow
-mlflow.set_tracking_uri("http://127.0.0.1:8080")
-mlflow.set_experiment("optimized_experiment")
-
-with mlflow.start_run():
-    mlflow.log_params(search.best_params_)
-    mlflow.log_metric("mse", mse)
-    mlflow.log_metric("r2", r2)
-    mlflow.sklearn.log_model(
-        sk_model=best_model,
-        artifact_path="optimized_model",
-        signature=signature,
-        registered_model_name="OptimizedRandomForestModel",
+
+def build_pipeline(memory=None, random_state=42):
+    """Pipeline de préparation et forêt ; `memory` met en cache le prétraitement ajusté (dossier ou joblib.Memory)."""
+    preprocessor = make_column_transformer(
+        (SimpleImputer(strategy="mean"), ["year", "km_driven"]),
+        (OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1), ["brand"])
     )
-    print("Modèle optimisé logué avec succès dans MLflow.")
+    return make_pipeline(preprocessor, RandomForestRegressor(random_state=random_state), memory=memory)
+
+
+def trial_key(params, rung):
+    return json.dumps({"rung": rung, "params": params}, sort_keys=True)
+
+
+class TrialLog:
+    """Essais terminés, ajoutés au fil de l'eau à un fichier JSON lines.
+
+    Une recherche interrompue repart de ce fichier : les essais déjà présents
+    ne sont pas réévalués.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.trials = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        trial = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Dernière ligne tronquée par l'interruption : l'essai sera refait
+                        continue
+                    self.trials[trial_key(trial["params"], trial["rung"])] = trial
+
+    def get(self, params, rung):
+        return self.trials.get(trial_key(params, rung))
+
+    def append(self, trial):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(trial) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.trials[trial_key(trial["params"], trial["rung"])] = trial
+
+
+def run_trial(pipeline, params, X, y, cv, n_jobs):
+    # Les arbres sont construits dans des threads : le temps CPU du processus couvre tout l'essai
+    estimator = clone(pipeline).set_params(**params, randomforestregressor__n_jobs=n_jobs)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    scores = cross_validate(estimator, X, y, cv=cv, scoring=SCORING)["test_score"]
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+    cores = os.cpu_count() if n_jobs == -1 else n_jobs
+    return {
+        "scores": scores.tolist(),
+        "mean_score": float(scores.mean()),
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        "cpu_utilization": cpu_seconds / (wall_seconds * cores) if wall_seconds > 0 else 0.0,
+    }
+
+
+def rung_schedule(mode, n_iter, n_rows, factor, min_samples=100):
+    """Taille de l'échantillon d'entraînement de chaque tour.
+
+    En mode "halving", seul le meilleur tiers (pour `factor=3`) des candidats passe au
+    tour suivant, sur trois fois plus de lignes ; le dernier tour utilise toutes les lignes.
+    """
+    if mode != "halving":
+        return [n_rows]
+    n_rungs = 1
+    while n_iter // factor ** n_rungs > 1:
+        n_rungs += 1
+    first = max(min_samples, n_rows // factor ** (n_rungs - 1))
+    return [min(n_rows, first * factor ** rung) for rung in range(n_rungs)]
+
+
+def search(pipeline, X, y, settings, trial_log, n_jobs, on_trial=None):
+    """Recherche aléatoire (éventuellement par élimination successive) ; retourne le meilleur essai et les essais du dernier tour."""
+    factor = settings["factor"]
+    candidates = list(ParameterSampler(PARAM_DISTRIBUTIONS, settings["n_iter"], random_state=settings["random_state"]))
+    order = np.random.RandomState(settings["random_state"]).permutation(len(X))
+    cv = KFold(settings["cv"], shuffle=True, random_state=settings["random_state"])
+    schedule = rung_schedule(settings["mode"], settings["n_iter"], len(X), factor)
+
+    for rung, n_samples in enumerate(schedule):
+        # Même sous-échantillon et mêmes plis pour tous les candidats d'un tour : le prétraitement est réutilisé
+        X_rung, y_rung = X.iloc[order[:n_samples]], y.iloc[order[:n_samples]]
+        results = []
+        for params in candidates:
+            trial = trial_log.get(params, rung)
+            if trial is None:
+                trial = {"rung": rung, "n_samples": n_samples, "params": params, **run_trial(pipeline, params, X_rung, y_rung, cv, n_jobs)}
+                trial_log.append(trial)
+                if on_trial is not None:
+                    on_trial(trial)
+            results.append(trial)
+        print(f"Tour {rung} : {len(candidates)} candidats sur {n_samples} lignes, meilleur MSE {-max(t['mean_score'] for t in results):.0f}")
+        results.sort(key=lambda t: t["mean_score"], reverse=True)
+        candidates = [t["params"] for t in results[:max(1, math.ceil(len(candidates) / factor))]]
+
+    return results[0], results
+
+
+def load_settings(state_dir, settings):
+    # Reprendre une recherche existante si ses paramètres sont identiques
+    path = os.path.join(state_dir, "search.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+        changed = [name for name in SEARCH_SETTINGS if saved.get(name) != settings[name]]
+        if changed:
+            raise ValueError(f"Paramètres différents de la recherche enregistrée dans {state_dir} : {changed}. Utilisez un autre --state-dir.")
+        print(f"Reprise de la recherche enregistrée dans {state_dir}")
+        return saved
+    return dict(settings)
+
+
+def save_settings(state_dir, settings):
+    with open(os.path.join(state_dir, "search.json"), "w") as f:
+        json.dump(settings, f, indent=2)
+
+
+def log_trial(trial):
+    # Un run MLflow imbriqué par essai, avec son coût en temps et en CPU
+    with mlflow.start_run(run_name=f"tour{trial['rung']}", nested=True):
+        mlflow.log_params({name.split("__")[-1]: value for name, value in trial["params"].items()})
+        mlflow.log_metrics({
+            "rung": trial["rung"],
+            "n_samples": trial["n_samples"],
+            "cv_mse": -trial["mean_score"],
+            "wall_seconds": trial["wall_seconds"],
+            "cpu_seconds": trial["cpu_seconds"],
+            "cpu_utilization": trial["cpu_utilization"],
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche des hyperparamètres et enregistrement du modèle dans MLflow.")
+    parser.add_argument("--data", default="./data/cartest.csv")
+    parser.add_argument("--mode", choices=["halving", "random"], default="halving",
+                        help="halving : élimination successive sur des échantillons croissants ; random : tous les candidats sur toutes les lignes")
+    parser.add_argument("--n-iter", type=int, default=50)
+    parser.add_argument("--cv", type=int, default=3)
+    parser.add_argument("--factor", type=int, default=3, help="Facteur d'élimination entre deux tours (mode halving)")
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--state-dir", default="./training_runs/optimized", help="Essais terminés et cache du prétraitement, pour reprendre une recherche")
+    parser.add_argument("--tracking-uri", default="http://127.0.0.1:8080")
+    parser.add_argument("--experiment", default="optimized_experiment")
+    parser.add_argument("--registered-model", default="OptimizedRandomForestModel")
+    parser.add_argument("--no-onnx", action="store_true", help="Ne pas exporter le graphe ONNX du modèle")
+    args = parser.parse_args()
+
+    X, y = load_training_data(args.data)
+    x_train, x_test, y_train, y_test = train_test_split(X, y, test_size=args.test_size, random_state=args.random_state)
+
+    os.makedirs(args.state_dir, exist_ok=True)
+    settings = load_settings(args.state_dir, {
+        "mode": args.mode,
+        "n_iter": args.n_iter,
+        "cv": args.cv,
+        "factor": args.factor,
+        "random_state": args.random_state,
+        "test_size": args.test_size,
+        "data_sha256": source_sha256(args.data),
+    })
+    trial_log = TrialLog(os.path.join(args.state_dir, "trials.jsonl"))
+    if trial_log.trials:
+        print(f"{len(trial_log.trials)} essais déjà terminés")
+
+    mlflow.set_tracking_uri(args.tracking_uri)
+    mlflow.set_experiment(args.experiment)
+
+    # Un seul run parent par recherche, repris après une interruption
+    with mlflow.start_run(run_id=settings.get("run_id")) as run:
+        settings["run_id"] = run.info.run_id
+        save_settings(args.state_dir, settings)
+
+        # Le prétraitement ajusté sur un pli est mis en cache sur disque et réutilisé par tous les candidats
+        pipeline = build_pipeline(memory=os.path.join(args.state_dir, "preprocessing_cache"), random_state=args.random_state)
+
+        print("Recherche des meilleurs hyperparamètres en cours...")
+        search_start = time.perf_counter()
+        fits_before = len(trial_log.trials)
+        best, _ = search(pipeline, x_train, y_train, settings, trial_log, args.n_jobs, on_trial=log_trial)
+        print(f"Meilleurs hyperparamètres : {best['params']}")
+
+        # Réentraîner le meilleur candidat sur tout l'ensemble d'entraînement, sans cache attaché au modèle
+        best_model = build_pipeline(random_state=args.random_state).set_params(**best["params"], randomforestregressor__n_jobs=args.n_jobs)
+        fit_start = time.perf_counter()
+        best_model.fit(x_train, y_train)
+        fit_seconds = time.perf_counter() - fit_start
+        best_model.set_params(randomforestregressor__n_jobs=None)
+        # L'encodage des colonnes catégorielles est enregistré avec le modèle, et repris tel quel par l'API
+        attach_encoder(best_model)
+
+        # Évaluation sur les données de test
+        y_pred = best_model.predict(x_test)
+        mse = mean_squared_error(y_test, y_pred)
+        r2 = r2_score(y_test, y_pred)
+        print(f"Mean Squared Error : {mse}")
+        print(f"R² : {r2}")
+
+        # Signature pour MLflow
+        signature = infer_signature(x_test, y_pred)
+
+        mlflow.log_params(best["params"])
+        mlflow.log_params({"search_" + name: settings[name] for name in SEARCH_SETTINGS if name != "data_sha256"})
+        # Données d'entraînement, pour les mises à jour incrémentales (incremental_train.py)
+        mlflow.set_tags({"data_sha256": settings["data_sha256"], "data_rows": len(X), "data_rows_sha256": rows_sha256(args.data)})
+        mlflow.log_metric("mse", mse)
+        mlflow.log_metric("r2", r2)
+        mlflow.log_metric("search_seconds", time.perf_counter() - search_start)
+        mlflow.log_metric("search_trials_run", len(trial_log.trials) - fits_before)
+        mlflow.log_metric("final_fit_seconds", fit_seconds)
+        mlflow.sklearn.log_model(
+            sk_model=best_model,
+            artifact_path="optimized_model",
+            signature=signature,
+            registered_model_name=args.registered_model,
+        )
+        print("Modèle optimisé logué avec succès dans MLflow.")
+
+        if not args.no_onnx:
+            # Graphe ONNX du même pipeline (encodage de `brand` compris), rangé avec le modèle sklearn
+            export_start = time.perf_counter()
+            onnx_graph = to_onnx(best_model)
+            onnx_error = float(np.max(np.abs(OnnxForest(onnx_graph).predict(x_test) - y_pred)))
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                onnx_path = os.path.join(tmp_dir, ONNX_FILE)
+                with open(onnx_path, "wb") as f:
+                    f.write(onnx_graph)
+                mlflow.log_artifact(onnx_path, artifact_path="optimized_model")
+            mlflow.log_metric("onnx_export_seconds", time.perf_counter() - export_start)
+            mlflow.log_metric("onnx_max_abs_error", onnx_error)
+            print(f"Graphe ONNX logué ({len(onnx_graph) / 1e6:.1f} Mo), écart maximal avec sklearn : {onnx_error:.4f}")
+
+
+if __name__ == "__main__":
+    main()
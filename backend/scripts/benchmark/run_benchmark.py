@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Rendre les modules de l'API (backend/) et ce dossier importables depuis ce script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_ENDPOINTS = ["/predict", "/explain", "/explain_visual"]
+DEFAULT_CONCURRENCY = [1, 4, 16]
+
+
+def load_payloads(data_path, limit):
+    # Rejouer les lignes de cartest.csv telles qu'un client les enverrait
+    df = pd.read_csv(data_path)
+    df["brand"] = df["name"].str.split().str[0]
+    columns = ["year", "km_driven", "fuel", "transmission", "owner", "seller_type", "brand"]
+    return df[columns].head(limit).to_dict(orient="records")
+
+
+def peak_rss_mb():
+    # ru_maxrss est en kilo-octets sous Linux ; les processus enfants (pool d'explication) sont comptés à part
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(children, 1)
+
+
+async def run_level(client, endpoint, payloads, concurrency, n_requests):
+    latencies = []
+    errors = 0
+    counter = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            payload = payloads[i % len(payloads)]
+            start = time.perf_counter()
+            response = await client.post(endpoint, json=payload)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    rss, children_rss = peak_rss_mb()
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "requests_per_second": round(n_requests / elapsed, 2),
+        "peak_rss_mb": rss,
+        "peak_children_rss_mb": children_rss,
+    }
+
+
+async def run_benchmark(args, payloads):
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        app = None
+    else:
+        # Application chargée dans ce processus, appelée directement via ASGI
+        import main
+        app = main.app
+        await app.router.startup()
+        client = httpx.AsyncClient(app=app, base_url="http://benchmark", timeout=args.timeout)
+
+    results = []
+    try:
+        for endpoint in args.endpoints:
+            # Une requête de chauffe par endpoint, exclue des mesures
+            await client.post(endpoint, json=payloads[0])
+            for concurrency in args.concurrency:
+                n_requests = args.requests if endpoint == "/predict" else args.explain_requests
+                result = await run_level(client, endpoint, payloads, concurrency, n_requests)
+                print(
+                    f"{endpoint:<16} c={concurrency:<3} p50={result['p50_ms']:>9.2f} ms "
+                    f"p95={result['p95_ms']:>9.2f} ms p99={result['p99_ms']:>9.2f} ms "
+                    f"{result['requests_per_second']:>8.1f} req/s RSS={result['peak_rss_mb']} Mo "
+                    f"erreurs={result['errors']}"
+                )
+                results.append(result)
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """Compare aux résultats de référence ; retourne la liste des régressions détectées."""
+    with open(baseline_path) as f:
+        baseline = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        reference = baseline.get((result["endpoint"], result["concurrency"]))
+        if reference is None:
+            continue
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{result['endpoint']} c={result['concurrency']} : p95 {reference['p95_ms']} -> {result['p95_ms']} ms")
+        if result["requests_per_second"] < reference["requests_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result['endpoint']} c={result['concurrency']} : débit "
+                f"{reference['requests_per_second']} -> {result['requests_per_second']} req/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure la latence et le débit des endpoints de l'API.")
+    parser.add_argument("--url", help="URL d'un serveur uvicorn déjà lancé ; par défaut l'application est chargée en ASGI")
+    parser.add_argument("--model-uri", help="Modèle à servir en mode ASGI ; par défaut un modèle factice local est entraîné")
+    parser.add_argument("--snapshot-dir", help="Dossier des snapshots du modèle (mode ASGI)")
+    parser.add_argument("--endpoints", nargs="+", default=DEFAULT_ENDPOINTS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=500, help="Requêtes par niveau pour /predict")
+    parser.add_argument("--explain-requests", type=int, default=50, help="Requêtes par niveau pour les explications")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Résultats de référence à comparer (fichier JSON produit par ce script)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Dégradation relative tolérée avant de signaler une régression")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Démarrages à froid mesurés (mode ASGI, voir startup_profile.py) ; 0 pour ne pas les mesurer")
+    args = parser.parse_args()
+
+    if not args.url:
+        # Le modèle et le registre sont remplacés par un snapshot local : aucun serveur MLflow n'est nécessaire
+        snapshot_dir = args.snapshot_dir or tempfile.mkdtemp(prefix="autopredict-bench-")
+        from stub_model import STUB_MODEL_URI, build_stub_snapshot
+        # Environnement fixé avant tout import de la configuration de l'API, qui le lit une seule fois
+        os.environ.update({"MODEL_URI": args.model_uri or STUB_MODEL_URI, "MODEL_SOURCE": "snapshot", "MODEL_SNAPSHOT_DIR": snapshot_dir})
+        if args.model_uri is None:
+            build_stub_snapshot(snapshot_dir)
+    model_uri = os.environ.get("MODEL_URI")
+
+    # Démarrage à froid mesuré dans des processus neufs, avant le chargement de l'API dans ce processus
+    startup = None
+    if not args.url and args.startup_runs:
+        from startup_profile import print_profile, profile_startup
+        startup = profile_startup(dict(os.environ), args.startup_runs)
+        print_profile(startup)
+
+    from config import DATA_PATH
+    payloads = load_payloads(DATA_PATH, limit=1000)
+    results = asyncio.run(run_benchmark(args, payloads))
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "model_uri": model_uri,
+            "target": args.url or "asgi",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if startup is not None:
+        report["startup"] = startup
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        with open(args.baseline) as f:
+            baseline_startup = json.load(f).get("startup")
+        if startup is not None and baseline_startup is not None:
+            from startup_profile import compare_startup
+            regressions += compare_startup(startup, baseline_startup, args.tolerance)
+        for regression in regressions:
+            print(f"RÉGRESSION : {regression}")
+        if regressions:
+            sys.exit(1)
+        print("Aucune régression par rapport à la référence.")
+
+
+if __name__ == "__main__":
+    main()
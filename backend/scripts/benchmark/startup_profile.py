@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Rendre les modules de l'API (backend/) et ce dossier importables depuis ce script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Bibliothèques lourdes : un worker qui ne sert que `/predict` ne doit pas les charger au démarrage
+HEAVY_MODULES = ["shap", "numba", "llvmlite", "matplotlib", "mlflow", "onnxruntime", "skl2onnx"]
+
+# Exécuté dans un processus neuf : import de l'API (chargement et mise en route du modèle compris)
+CHILD_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+import_seconds = time.perf_counter() - start
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "model_load_seconds": main.state.timings,
+    "modules": sorted({name.split(".")[0] for name in sys.modules}),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Temps d'import propre (hors sous-imports) cumulé par paquet de premier niveau, en secondes."""
+    by_package = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return by_package
+
+
+def profile_once(env):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Échec du démarrage de l'API :\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["import_time_by_package"] = parse_importtime(completed.stderr)
+    return result
+
+
+def profile_startup(env, runs=3, top=15):
+    """Profil de démarrage à froid de l'API : médianes sur `runs` processus neufs.
+
+    Durée de `import main` (imports, chargement du modèle, mise en route), pic de mémoire
+    résidente, phases du chargement du modèle, bibliothèques lourdes chargées et temps
+    d'import par paquet (à la manière de `python -X importtime`).
+    """
+    profiles = [profile_once(env) for _ in range(runs)]
+    by_package = defaultdict(list)
+    for profile in profiles:
+        for package, seconds in profile["import_time_by_package"].items():
+            by_package[package].append(seconds)
+    packages = sorted(((package, float(np.median(values))) for package, values in by_package.items()), key=lambda item: -item[1])
+    return {
+        "runs": runs,
+        "import_seconds": round(float(np.median([p["import_seconds"] for p in profiles])), 3),
+        "peak_rss_mb": round(float(np.median([p["peak_rss_mb"] for p in profiles])), 1),
+        "model_load_seconds": {
+            phase: round(float(np.median([p["model_load_seconds"][phase] for p in profiles])), 3)
+            for phase in profiles[0]["model_load_seconds"]
+        },
+        "heavy_modules_loaded": [module for module in HEAVY_MODULES if any(module in p["modules"] for p in profiles)],
+        "import_ms_by_package": {package: round(seconds * 1000, 1) for package, seconds in packages[:top]},
+    }
+
+
+def compare_startup(current, baseline, tolerance):
+    """Compare au profil de référence ; retourne la liste des régressions détectées."""
+    regressions = []
+    if current["import_seconds"] > baseline["import_seconds"] * (1 + tolerance):
+        regressions.append(f"démarrage : {baseline['import_seconds']} -> {current['import_seconds']} s")
+    if current["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(f"mémoire au démarrage : {baseline['peak_rss_mb']} -> {current['peak_rss_mb']} Mo")
+    for module in sorted(set(current["heavy_modules_loaded"]) - set(baseline["heavy_modules_loaded"])):
+        regressions.append(f"démarrage : {module} est désormais chargé à l'import")
+    return regressions
+
+
+def print_profile(profile):
+    print(
+        f"Démarrage : {profile['import_seconds']:.2f} s, pic RSS {profile['peak_rss_mb']:.0f} Mo "
+        f"(médiane sur {profile['runs']} processus)"
+    )
+    print(f"  chargement du modèle : {profile['model_load_seconds']}")
+    print(f"  bibliothèques lourdes chargées : {profile['heavy_modules_loaded'] or 'aucune'}")
+    for package, milliseconds in profile["import_ms_by_package"].items():
+        print(f"  {package:<20} {milliseconds:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure le démarrage à froid d'un worker de l'API (temps d'import, mémoire).")
+    parser.add_argument("--model-uri", help="Modèle à charger ; par défaut un modèle factice local est entraîné")
+    parser.add_argument("--snapshot-dir", help="Dossier des snapshots du modèle")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Paquets les plus longs à importer affichés dans le rapport")
+    parser.add_argument("--output", default="startup_profile.json")
+    parser.add_argument("--baseline", help="Profil de référence à comparer (fichier JSON produit par ce script ou par run_benchmark.py)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Dégradation relative tolérée avant de signaler une régression")
+    args = parser.parse_args()
+
+    # Comme run_benchmark.py : snapshot local, aucun serveur MLflow n'est nécessaire
+    snapshot_dir = args.snapshot_dir or tempfile.mkdtemp(prefix="autopredict-startup-")
+    model_uri = args.model_uri
+    if model_uri is None:
+        from stub_model import build_stub_snapshot
+        model_uri = build_stub_snapshot(snapshot_dir)
+    env = {**os.environ, "MODEL_URI": model_uri, "MODEL_SOURCE": "snapshot", "MODEL_SNAPSHOT_DIR": snapshot_dir}
+
+    profile = profile_startup(env, args.runs, args.top)
+    print_profile(profile)
+    report = {
+        "meta": {"created_at": datetime.now(timezone.utc).isoformat(), "model_uri": model_uri, "python": sys.version.split()[0]},
+        "startup": profile,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Profil écrit dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("startup")
+        if baseline is None:
+            print(f"Pas de profil de démarrage dans {args.baseline}")
+            return
+        regressions = compare_startup(profile, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"RÉGRESSION : {regression}")
+        if regressions:
+            sys.exit(1)
+        print("Aucune régression du démarrage par rapport à la référence.")
+
+
+if __name__ == "__main__":
+    main()
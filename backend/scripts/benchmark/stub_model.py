@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pandas as pd
+from sklearn.compose import make_column_transformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import OrdinalEncoder
+
+# Rendre les modules de l'API (backend/) importables depuis ce script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from features import FEATURE_COLUMNS, attach_encoder, encode_frame
+from model_loader import export_snapshot
+
+STUB_MODEL_URI = "models:/BenchmarkStubModel/1"
+
+
+def build_stub_snapshot(snapshot_dir, n_estimators=100, data_path=None):
+    """Entraîne un pipeline de même structure que `OptimizedRandomForestModel` et l'exporte en snapshot local.
+
+    L'API peut ensuite démarrer avec `MODEL_SOURCE=snapshot`, sans serveur MLflow.
+    """
+    if data_path is None:
+        # Import tardif : la configuration de l'API lit l'environnement au premier import
+        from config import DATA_PATH as data_path
+    df = pd.read_csv(data_path)
+    df["brand"] = df["name"].str.split().str[0]
+    X, _ = encode_frame(df[FEATURE_COLUMNS])
+    y = df.loc[X.index, "selling_price"]
+    X = X[["year", "km_driven", "fuel", "seller_type", "transmission", "owner", "brand"]]
+
+    preprocessor = make_column_transformer(
+        (SimpleImputer(strategy="mean"), ["year", "km_driven"]),
+        (OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1), ["brand"])
+    )
+    pipeline = make_pipeline(preprocessor, RandomForestRegressor(n_estimators=n_estimators, random_state=42))
+    pipeline.fit(X, y)
+
+    export_snapshot(STUB_MODEL_URI, snapshot_dir, sklearn_model=attach_encoder(pipeline))
+    return STUB_MODEL_URI
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import make_column_transformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import OrdinalEncoder
+
+# Rendre les modules de l'API (backend/) importables depuis les tests
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config import DATA_PATH
+from features import FEATURE_COLUMNS, encode_frame
+
+
+@pytest.fixture(scope="session")
+def car_data():
+    """Annonces du jeu de test encodées comme en entrée du modèle, et leurs prix."""
+    df = pd.read_csv(DATA_PATH)
+    df["brand"] = df["name"].str.split().str[0]
+    X, _ = encode_frame(df[FEATURE_COLUMNS])
+    return X.reset_index(drop=True), df.loc[X.index, "selling_price"].to_numpy(dtype=np.float64)
+
+
+@pytest.fixture(scope="session")
+def pipeline(car_data):
+    """Petit pipeline de même structure que le modèle servi, entraîné localement (sans MLflow)."""
+    X, y = car_data
+    preprocessor = make_column_transformer(
+        (SimpleImputer(strategy="mean"), ["year", "km_driven"]),
+        (OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1), ["brand"])
+    )
+    model = make_pipeline(preprocessor, RandomForestRegressor(n_estimators=20, max_depth=8, min_samples_leaf=5, random_state=42))
+    return model.fit(X, y)
+
+
+@pytest.fixture(scope="session")
+def sample(car_data):
+    """Lignes du jeu de test, plus des valeurs manquantes et une marque inconnue du modèle."""
+    X, _ = car_data
+    rows = X.sample(300, random_state=0)
+    edge = rows.head(3).copy()
+    edge["year"] = [np.nan, edge["year"].iloc[1], np.nan]
+    edge["km_driven"] = [edge["km_driven"].iloc[0], np.nan, np.nan]
+    edge["brand"] = ["Inconnue", edge["brand"].iloc[1], "Inconnue"]
+    return pd.concat([rows, edge], ignore_index=True)
@@ -0,0 +1,51 @@
+import json
+
+import pandas as pd
+import pytest
+
+from batch import InvalidRecord, iter_chunks, parse_records, validate_records
+from features import FEATURE_COLUMNS
+
+
+CAR = {"year": 2014, "km_driven": 80000, "fuel": "Diesel", "transmission": "Manual",
+       "owner": "First Owner", "seller_type": "Individual", "brand": "Maruti"}
+
+
+def test_parse_json():
+    body = json.dumps([CAR, CAR]).encode()
+    assert parse_records(body, "application/json; charset=utf-8") == [CAR, CAR]
+    assert parse_records(body, None) == [CAR, CAR]
+    with pytest.raises(ValueError):
+        parse_records(json.dumps(CAR).encode(), "application/json")
+
+
+def test_parse_ndjson():
+    body = f"{json.dumps(CAR)}\n\n{{invalide\n{json.dumps(CAR)}\n".encode()
+    records = parse_records(body, "application/x-ndjson")
+    assert len(records) == 3
+    assert records[0] == records[2] == CAR
+    assert isinstance(records[1], InvalidRecord)
+
+
+def test_parse_csv():
+    body = pd.DataFrame([CAR, CAR]).to_csv(index=False).encode()
+    records = parse_records(body, "text/csv")
+    assert len(records) == 2
+    assert records[0]["year"] == "2014"
+
+
+def test_validate_records():
+    records = [CAR, {**CAR, "year": "ancienne"}, InvalidRecord("Ligne NDJSON invalide"), [1, 2], dict(CAR, km_driven="15000")]
+    raw, errors = validate_records(records)
+    assert list(raw.index) == [0, 4]
+    assert list(raw.columns) == FEATURE_COLUMNS
+    # Les valeurs lues en CSV sont converties comme celles d'un corps JSON
+    assert raw.loc[4, "km_driven"] == 15000
+    assert set(errors) == {1, 2, 3}
+    assert errors[1].startswith("year : ")
+    assert errors[2] == "Ligne NDJSON invalide"
+
+
+def test_iter_chunks():
+    frame = pd.DataFrame({"year": range(10)})
+    assert [len(chunk) for chunk in iter_chunks(frame, 4)] == [4, 4, 2]
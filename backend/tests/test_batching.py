@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from batching import MicroBatcher
+from features import FEATURE_COLUMNS
+
+
+def row(year):
+    return {**dict.fromkeys(FEATURE_COLUMNS, 0), "year": year}
+
+
+def run_batcher(rows, window_ms, max_size, fail=False):
+    """Soumet toutes les lignes en même temps ; retourne les résultats, la taille de chaque lot et la durée."""
+    batches = []
+
+    def predict(input_data):
+        batches.append(len(input_data))
+        if fail:
+            raise RuntimeError("modèle indisponible")
+        return (input_data["year"] * 10).tolist()
+
+    async def main():
+        batcher = MicroBatcher(predict, window_ms, max_size)
+        batcher.start()
+        start = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(batcher.submit(r) for r in rows), return_exceptions=True)
+        finally:
+            await batcher.stop()
+        return results, time.perf_counter() - start, batcher.stats()
+
+    results, elapsed, stats = asyncio.run(main())
+    return results, batches, elapsed, stats
+
+
+def test_flush_on_window():
+    results, batches, elapsed, stats = run_batcher([row(year) for year in range(3)], window_ms=50, max_size=100)
+    assert batches == [3]
+    # Chaque requête reçoit la prédiction de sa propre ligne
+    assert results == [0, 10, 20]
+    assert elapsed >= 0.05
+    assert stats["batch_size"]["count"] >= 1
+
+
+def test_flush_on_max_size():
+    results, batches, elapsed, _ = run_batcher([row(year) for year in range(8)], window_ms=10000, max_size=4)
+    assert batches == [4, 4]
+    assert results == [year * 10 for year in range(8)]
+    # Lots complets : envoyés sans attendre la fin de la fenêtre
+    assert elapsed < 5
+
+
+def test_failed_batch():
+    results, batches, _, stats = run_batcher([row(1), row(2)], window_ms=20, max_size=10, fail=True)
+    assert batches == [2]
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert stats["failed_batches"] == 1
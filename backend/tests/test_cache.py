@@ -0,0 +1,47 @@
+import cache
+from cache import LRUCache, ModelCache
+
+
+def test_lru_eviction():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    # "b" est la moins récemment lue
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert lru.stats()["hits"] == 3 and lru.stats()["misses"] == 1
+
+
+def test_lru_disabled():
+    lru = LRUCache(maxsize=0)
+    lru.put("a", 1)
+    assert lru.get("a") is None and len(lru) == 0
+
+
+def test_lru_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = LRUCache(maxsize=10, ttl=5)
+    lru.put("a", 1)
+    now[0] += 4
+    assert lru.get("a") == 1
+    now[0] += 2
+    assert lru.get("a") is None and len(lru) == 0
+
+
+def test_model_cache_version():
+    predictions = ModelCache(maxsize=10, version="1")
+    predictions.put("ligne", 1000.0)
+    assert predictions.get("ligne") == 1000.0
+
+    # Une requête servie par un autre modèle ne lit ni n'écrit le cache
+    assert predictions.get("ligne", version="2") is None
+    predictions.put("autre", 5.0, version="2")
+    assert predictions.get("autre") is None
+
+    predictions.set_version("2")
+    assert len(predictions) == 0
+    assert predictions.get("ligne") is None
+    assert predictions.stats()["model_version"] == "2"
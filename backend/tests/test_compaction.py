@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from compaction import compact_pipeline, compaction_grid, select_compaction
+from forest_engine import CompiledForest
+
+
+@pytest.fixture(scope="module")
+def grid(pipeline, car_data):
+    X, y = car_data
+    return compaction_grid(pipeline, X, y, tree_counts=[5, 10], depths=[3, 5], n_bootstrap=100)
+
+
+def test_grid_errors_match_compacted_pipelines(pipeline, car_data, grid):
+    # Chaque combinaison de la grille doit être l'erreur du pipeline compacté correspondant
+    X, y = car_data
+    assert len(grid) == 9
+    for entry in grid:
+        compacted = compact_pipeline(pipeline, entry["n_trees"], entry["max_depth"], quantize=False)
+        error = compacted.predict(X) - y
+        assert entry["mae"] == pytest.approx(np.abs(error).mean(), rel=1e-10)
+        assert entry["rmse"] == pytest.approx(np.sqrt((error ** 2).mean()), rel=1e-10)
+        assert entry["nodes"] == sum(estimator.tree_.node_count for estimator in compacted[-1].estimators_)
+
+
+def test_full_forest_is_last(pipeline, grid):
+    full = grid[-1]
+    assert (full["n_trees"], full["max_depth"]) == (pipeline[-1].n_estimators, None)
+    assert full["mae_increase_upper"] == 0.0
+
+
+def test_select_compaction(grid):
+    full, selected = select_compaction(grid, metric="mae", tolerance=0.05)
+    assert full is grid[-1]
+    candidates = [entry for entry in grid if entry["mae_increase_upper"] <= 0.05]
+    assert selected in candidates
+    assert selected["nodes"] == min(entry["nodes"] for entry in candidates)
+
+
+def test_quantization_keeps_tree_decisions(pipeline, sample):
+    compacted = compact_pipeline(pipeline)
+    X = pipeline[0].transform(sample).astype(np.float32)
+    assert np.array_equal(compacted[-1].apply(X), pipeline[-1].apply(X))
+    np.testing.assert_allclose(compacted.predict(sample), pipeline.predict(sample), rtol=1e-6)
+    assert np.array_equal(CompiledForest(compacted).predict(sample), compacted.predict(sample))
+
+
+def test_depth_cut(pipeline, sample):
+    compacted = compact_pipeline(pipeline, n_trees=10, max_depth=4, quantize=False)
+    forest = compacted[-1]
+    assert forest.n_estimators == 10
+    assert max(estimator.tree_.max_depth for estimator in forest.estimators_) <= 4
+    # Le moteur compilé lit aussi les forêts compactées
+    assert np.array_equal(CompiledForest(compacted).predict(sample), compacted.predict(sample))
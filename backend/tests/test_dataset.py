@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+from config import DATA_PATH
+from dataset import load_dataset, rows_sha256
+
+
+@pytest.fixture(scope="module")
+def listings():
+    df = pd.read_csv(DATA_PATH).head(60)
+    # Champ entre guillemets sur deux lignes physiques : une annonce reste une seule ligne
+    df.loc[5, "name"] = "Maruti Swift\nVDI"
+    return df
+
+
+def write_csv(path, df, line_terminator="\n", trailing_newline=True):
+    text = df.to_csv(index=False, lineterminator=line_terminator)
+    path.write_text(text if trailing_newline else text.rstrip(line_terminator), newline="")
+    return str(path)
+
+
+def test_appended_rows_keep_the_hash(tmp_path, listings):
+    cache_dir = str(tmp_path / "cache")
+    original = write_csv(tmp_path / "original.csv", listings.head(40), trailing_newline=False)
+    appended = write_csv(tmp_path / "appended.csv", listings, line_terminator="\r\n")
+
+    assert len(load_dataset(appended, cache_dir)) == 60
+    assert rows_sha256(appended, 40, cache_dir) == rows_sha256(original, cache_dir=cache_dir)
+    assert rows_sha256(appended, cache_dir=cache_dir) != rows_sha256(original, cache_dir=cache_dir)
+    # Moins de lignes que demandé
+    assert rows_sha256(original, 41, cache_dir) is None
+
+
+def test_modified_row_changes_the_hash(tmp_path, listings):
+    cache_dir = str(tmp_path / "cache")
+    modified = listings.copy()
+    modified.loc[10, "km_driven"] += 1
+    original = write_csv(tmp_path / "original.csv", listings)
+    changed = write_csv(tmp_path / "changed.csv", modified)
+    assert rows_sha256(changed, 40, cache_dir) != rows_sha256(original, 40, cache_dir)
+    assert rows_sha256(changed, 10, cache_dir) == rows_sha256(original, 10, cache_dir)
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from executors import BoundedPool, PoolSaturated
+
+
+def crash_once(marker):
+    # Le premier appel tue le processus du pool, comme une mémoire épuisée
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return os.getpid()
+
+
+def test_broken_process_pool_recreated(tmp_path):
+    pool = BoundedPool("test", "process", 1, 1, retry_after=1)
+    marker = str(tmp_path / "crash")
+
+    async def main():
+        broken = pool.executor
+        pid = await pool.run(crash_once, marker)
+        return broken, pid, await pool.run(crash_once, marker)
+
+    try:
+        broken, pid, again = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert pool.executor is not broken
+    assert pid == again != os.getpid()
+    assert (pool.completed, pool.failed) == (2, 0)
+
+
+def fail():
+    raise ValueError("Entrée invalide.")
+
+
+def test_pool_saturated():
+    pool = BoundedPool("test", "thread", max_workers=1, max_queue=1, retry_after=2)
+    release = threading.Event()
+
+    async def main():
+        tasks = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        busy = pool.stats()
+        with pytest.raises(PoolSaturated) as rejected:
+            await pool.run(release.wait)
+        release.set()
+        await asyncio.gather(*tasks)
+        with pytest.raises(ValueError):
+            await pool.run(fail)
+        return busy, rejected.value
+
+    try:
+        busy, rejected = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert (busy["in_flight"], busy["queued"]) == (1, 1)
+    assert rejected.retry_after == 2
+    stats = pool.stats()
+    assert (stats["in_flight"], stats["queued"]) == (0, 0)
+    assert (stats["completed"], stats["failed"], stats["rejected"]) == (2, 1, 1)
@@ -0,0 +1,65 @@
+import copy
+import pickle
+
+import pandas as pd
+import pytest
+
+from features import (
+    CATEGORICAL_MAPPINGS,
+    DEFAULT_ENCODER,
+    FEATURE_COLUMNS,
+    FUEL_MAPPING,
+    LABEL_ENCODER,
+    FeatureEncoder,
+    attach_encoder,
+    encoder_from_pipeline,
+)
+
+
+CAR = {"year": 2014, "km_driven": 80000, "fuel": "Diesel", "transmission": "Manual",
+       "owner": "First Owner", "seller_type": "Individual", "brand": "Maruti"}
+
+
+def test_brand_normalised_on_every_path():
+    # Même encodage, donc même prix et même clé de cache, pour une ligne seule et pour un lot
+    padded = {**CAR, "brand": " Maruti "}
+    assert DEFAULT_ENCODER.encode_record(padded) == DEFAULT_ENCODER.encode_record(CAR)
+    encoded, _ = DEFAULT_ENCODER.encode_frame(pd.DataFrame([padded, CAR]))
+    assert encoded["brand"].tolist() == ["Maruti", "Maruti"]
+
+
+def test_encode_frame_errors_per_row():
+    raw = pd.DataFrame(
+        [CAR, {**CAR, "fuel": "Water"}, {**CAR, "owner": "Nobody", "transmission": "Robot"}, CAR],
+        index=[10, 11, 12, 13],
+    )
+    encoded, errors = DEFAULT_ENCODER.encode_frame(raw)
+    # Index d'origine conservé, une seule erreur par ligne (la première colonne invalide)
+    assert list(encoded.index) == [10, 13]
+    assert list(encoded.columns) == FEATURE_COLUMNS
+    assert encoded.loc[10, "fuel"] == FUEL_MAPPING["Diesel"]
+    assert errors == {
+        11: DEFAULT_ENCODER.invalid_value_message("fuel", "Water"),
+        12: DEFAULT_ENCODER.invalid_value_message("transmission", "Robot"),
+    }
+    assert errors[11].startswith("Fuel invalide : Water. Valeurs possibles : ")
+
+
+def test_encode_record_rejects_unknown_value():
+    with pytest.raises(ValueError, match="Seller Type invalide : Broker"):
+        DEFAULT_ENCODER.encode_record({**CAR, "seller_type": "Broker"})
+
+
+def test_encoder_round_trip_with_pipeline(pipeline):
+    encoder = FeatureEncoder({**CATEGORICAL_MAPPINGS, "fuel": {**FUEL_MAPPING, "Hydrogen": 5}})
+    model = pickle.loads(pickle.dumps(attach_encoder(copy.deepcopy(pipeline), encoder)))
+    restored = encoder_from_pipeline(model)
+    assert restored.mappings == encoder.mappings
+    assert restored.encode_record({**CAR, "fuel": "Hydrogen"})["fuel"] == 5
+    # Modèle enregistré avant l'encodeur partagé
+    assert encoder_from_pipeline(pipeline) is None
+    assert encoder_from_pipeline(None) is None
+
+
+def test_label_encoder_keeps_labels():
+    assert LABEL_ENCODER.encode_record(CAR) == CAR
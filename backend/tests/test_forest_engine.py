@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.pipeline import make_pipeline
+
+from forest_engine import CompiledForest, UnsupportedModel, float32_floor
+
+
+def test_predictions_identical_to_sklearn(pipeline, sample):
+    assert np.array_equal(CompiledForest(pipeline).predict(sample), pipeline.predict(sample))
+
+
+def test_accepts_column_dict(pipeline, sample):
+    columns = {column: sample[column].to_numpy() for column in sample.columns}
+    assert np.array_equal(CompiledForest(pipeline).predict(columns), pipeline.predict(sample))
+
+
+def test_transform_matches_column_transformer(pipeline, sample):
+    assert np.array_equal(CompiledForest(pipeline).transform(sample), pipeline[0].transform(sample))
+
+
+def test_unsupported_model(pipeline, car_data):
+    X, y = car_data
+    boosted = make_pipeline(pipeline[0], GradientBoostingRegressor(n_estimators=5)).fit(X, y)
+    with pytest.raises(UnsupportedModel):
+        CompiledForest(boosted)
+    # Les appelants qui attrapent ValueError se replient aussi sur le modèle d'origine
+    assert issubclass(UnsupportedModel, ValueError)
+
+
+def test_float32_floor_keeps_decisions():
+    rng = np.random.default_rng(0)
+    thresholds = rng.uniform(-1e6, 1e6, 1000)
+    floored = float32_floor(thresholds)
+    assert np.all(floored <= thresholds)
+    assert np.array_equal(floored.astype(np.float32), floored)
+
+    values = np.concatenate([floored, np.nextafter(floored.astype(np.float32), np.float32(np.inf))]).astype(np.float64)
+    for threshold, floor in zip(thresholds[:50], floored[:50]):
+        assert np.array_equal(values <= threshold, values <= floor)
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from executors import PoolSaturated
+from jobs import JobQueue, JobStore
+
+
+def run_queue(tmp_path, scenario, max_workers=1, max_queue=10, ttl=60):
+    """Exécute `scenario(queue, order)` dans une boucle asyncio, avec une file démarrée puis arrêtée."""
+    order = []
+
+    async def square(payload):
+        order.append(payload["n"])
+        return {"result": payload["n"] ** 2}
+
+    async def invalid(payload):
+        raise ValueError("Entrée invalide.")
+
+    async def broken(payload):
+        raise RuntimeError("détail interne")
+
+    async def main():
+        queue = JobQueue(JobStore(str(tmp_path), ttl), {"square": square, "invalid": invalid, "broken": broken}, max_workers, max_queue, retry_after=0.01)
+        queue.start()
+        try:
+            return await scenario(queue, order)
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+async def wait_done(queue, job_id):
+    for _ in range(500):
+        job = queue.store.load(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} non terminé")
+
+
+def test_job_result_stored(tmp_path):
+    async def scenario(queue, order):
+        job, existing = queue.submit("square", {"n": 3}, "normal", "1")
+        assert not existing and job["status"] == "queued"
+        job = await wait_done(queue, job["id"])
+        return job, queue.store.load_result(job["id"]), queue.stats()
+
+    job, result, stats = run_queue(tmp_path, scenario)
+    assert job["status"] == "done" and job["expires_at"] is not None
+    assert result == {"result": 9}
+    assert stats["completed"] == 1 and stats["failed"] == 0
+
+
+def test_identical_jobs_deduplicated(tmp_path):
+    async def scenario(queue, order):
+        first, _ = queue.submit("square", {"n": 2}, "normal", "1")
+        second, existing = queue.submit("square", {"n": 2}, "high", "1")
+        other, other_existing = queue.submit("square", {"n": 2}, "normal", "2")
+        await wait_done(queue, other["id"])
+        return first, second, existing, other, other_existing, queue.stats()
+
+    first, second, existing, other, other_existing, stats = run_queue(tmp_path, scenario)
+    assert existing and second["id"] == first["id"]
+    # Même contenu sur une autre version du modèle : autre résultat possible, nouveau job
+    assert not other_existing and other["id"] != first["id"]
+    assert stats["submitted"] == 2 and stats["deduplicated"] == 1
+
+
+def test_priority_order(tmp_path):
+    async def scenario(queue, order):
+        jobs = [queue.submit("square", {"n": n}, priority, "1")[0] for n, priority in ((1, "low"), (2, "normal"), (3, "high"), (4, "normal"))]
+        for job in jobs:
+            await wait_done(queue, job["id"])
+        return list(order)
+
+    assert run_queue(tmp_path, scenario) == [3, 2, 4, 1]
+
+
+def test_queue_saturated(tmp_path):
+    async def scenario(queue, order):
+        for n in range(2):
+            queue.submit("square", {"n": n}, "normal", "1")
+        with pytest.raises(PoolSaturated):
+            queue.submit("square", {"n": 2}, "normal", "1")
+
+    run_queue(tmp_path, scenario, max_queue=2)
+
+
+def test_invalid_submissions(tmp_path):
+    async def scenario(queue, order):
+        with pytest.raises(ValueError):
+            queue.submit("inconnu", {}, "normal", "1")
+        with pytest.raises(ValueError):
+            queue.submit("square", {"n": 1}, "urgent", "1")
+
+    run_queue(tmp_path, scenario)
+
+
+def test_failed_jobs(tmp_path):
+    async def scenario(queue, order):
+        invalid, _ = queue.submit("invalid", {}, "normal", "1")
+        broken, _ = queue.submit("broken", {}, "normal", "1")
+        return await wait_done(queue, invalid["id"]), await wait_done(queue, broken["id"]), queue.stats()
+
+    invalid, broken, stats = run_queue(tmp_path, scenario)
+    assert (invalid["status"], invalid["error"]) == ("failed", "Entrée invalide.")
+    # Le détail d'une erreur interne n'est pas exposé au client
+    assert (broken["status"], broken["error"]) == ("failed", "Erreur interne du serveur.")
+    assert stats["failed"] == 2 and stats["completed"] == 0
+
+
+def test_pending_jobs_resumed_on_start(tmp_path):
+    store = JobStore(str(tmp_path), ttl=60)
+    store.save({
+        "id": "interrompu", "kind": "square", "priority": "normal", "status": "running", "key": "k",
+        "payload": {"n": 5}, "model_version": "1", "created_at": "2024-01-01T00:00:00+00:00",
+        "started_at": None, "finished_at": None, "expires_at": None, "error": None,
+    })
+
+    async def scenario(queue, order):
+        return await wait_done(queue, "interrompu")
+
+    assert run_queue(tmp_path, scenario)["status"] == "done"
+    assert store.load_result("interrompu") == {"result": 25}
+
+
+def test_expired_jobs_purged(tmp_path):
+    store = JobStore(str(tmp_path), ttl=60)
+    store.save({"id": "ancien", "status": "done", "expires_at": time.time() - 1})
+    store.save_result("ancien", {"result": 1})
+    store.save({"id": "recent", "status": "done", "expires_at": time.time() + 60})
+
+    assert store.load("ancien") is None
+    assert store.purge() == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["recent.json"]
+
+
+def test_workers_share_the_store(tmp_path):
+    # Deux workers uvicorn sur le même dossier : un job n'est exécuté qu'une fois, et dédupliqué entre workers
+    runs = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def slow(payload):
+            runs.append(payload["n"])
+            await release.wait()
+            return {"result": payload["n"]}
+
+        first = JobQueue(JobStore(str(tmp_path), 60), {"slow": slow}, 1, 10, retry_after=0.01)
+        second = JobQueue(JobStore(str(tmp_path), 60), {"slow": slow}, 1, 10, retry_after=0.01)
+        first.start()
+        try:
+            job, _ = first.submit("slow", {"n": 1}, "normal", "1")
+            await asyncio.sleep(0.05)
+            second.start()
+            duplicate, existing = second.submit("slow", {"n": 1}, "normal", "1")
+            release.set()
+            done = await wait_done(first, job["id"])
+        finally:
+            await first.stop()
+            await second.stop()
+        return job, duplicate, existing, done, first.stats(), second.stats()
+
+    job, duplicate, existing, done, first, second = asyncio.run(main())
+    assert existing and duplicate["id"] == job["id"]
+    assert done["status"] == "done" and runs == [1]
+    assert (first["completed"], second["completed"], second["recovered"]) == (1, 0, 0)
+    assert not list(tmp_path.glob("*.lease")) and not list(tmp_path.glob("*.key"))
+
+
+def pending_job(store, job_id, n):
+    store.save({
+        "id": job_id, "kind": "square", "priority": "normal", "status": "running", "key": job_id,
+        "payload": {"n": n}, "model_version": "1", "created_at": "2024-01-01T00:00:00+00:00",
+        "started_at": None, "finished_at": None, "expires_at": None, "error": None,
+    })
+
+
+def test_only_stale_leases_recovered(tmp_path):
+    store = JobStore(str(tmp_path), ttl=60, lease_timeout=30)
+    pending_job(store, "actif", 2)
+    pending_job(store, "abandonne", 3)
+    assert store.claim("actif", {"id": "autre", "host": "autre-machine", "pid": 1})
+    assert store.claim("abandonne", {"id": "disparu", "host": "autre-machine", "pid": 1})
+    old = time.time() - 60
+    os.utime(tmp_path / "abandonne.lease", (old, old))
+
+    async def scenario(queue, order):
+        done = await wait_done(queue, "abandonne")
+        return done, queue.store.load("actif"), queue.stats()
+
+    done, active, stats = run_queue(tmp_path, scenario)
+    assert done["status"] == "done" and stats["recovered"] == 1
+    # Bail renouvelé par un autre worker : le job n'est pas relancé ici
+    assert active["status"] == "running"
+    assert not store.claim("actif", {"id": "moi", "host": "autre-machine", "pid": 1})
+
+
+def test_wait_for_job_run_by_another_worker(tmp_path):
+    async def main():
+        release = asyncio.Event()
+
+        async def slow(payload):
+            await release.wait()
+            return {}
+
+        runner = JobQueue(JobStore(str(tmp_path), 60), {"slow": slow}, 1, 10, retry_after=0.01)
+        reader = JobQueue(JobStore(str(tmp_path), 60), {"slow": slow}, 1, 10, retry_after=0.01, poll_interval=0.02)
+        runner.start()
+        try:
+            job, _ = runner.submit("slow", {}, "normal", "1")
+            await asyncio.sleep(0.05)
+            assert reader.store.load(job["id"])["status"] == "running"
+            asyncio.get_running_loop().call_later(0.1, release.set)
+            start = time.monotonic()
+            # Sans événement dans ce processus : réveil par la modification du fichier du job
+            await reader.wait_for_change(job["id"], 10)
+            waited = time.monotonic() - start
+            await reader.wait_for_change(job["id"], 0.05)
+            return waited, reader.store.load(job["id"])["status"], dict(reader._changed)
+        finally:
+            await runner.stop()
+
+    waited, status, pending = asyncio.run(main())
+    assert waited < 2 and status == "done"
+    # Aucun événement conservé après l'attente, réveillée ou expirée
+    assert pending == {}
@@ -0,0 +1,73 @@
+from collections import Counter
+
+import pytest
+
+from model_registry import DEFAULT_MODEL, ModelRegistry, load_registry, parse_assignments, parse_weights
+
+
+class FakeState:
+    def __init__(self, model_uri):
+        self.model_uri = model_uri
+
+
+def test_parse_assignments():
+    assert parse_assignments(" a = models:/A/1 ,b=models:/B/2,") == {"a": "models:/A/1", "b": "models:/B/2"}
+    assert parse_assignments("") == {}
+    with pytest.raises(ValueError):
+        parse_assignments("a=models:/A/1,b")
+
+
+def test_parse_weights():
+    assert parse_weights("default=0.9,candidat=0.1") == {"default": 0.9, "candidat": 0.1}
+    with pytest.raises(ValueError, match="candidat"):
+        parse_weights("default=0.9,candidat=beaucoup")
+
+
+def test_same_uri_loaded_once():
+    built = []
+
+    def build_state(uri):
+        built.append(uri)
+        return FakeState(uri)
+
+    registry = load_registry({DEFAULT_MODEL: "models:/A/1", "alias": "models:/A/1", "b": "models:/B/1"}, build_state)
+    assert built == ["models:/A/1", "models:/B/1"]
+    assert registry.get("alias") is registry.get(DEFAULT_MODEL)
+    assert len(registry.unique_states()) == 2
+
+
+def test_select():
+    states = {DEFAULT_MODEL: FakeState("a"), "b": FakeState("b"), "c": FakeState("c")}
+    registry = ModelRegistry(states, weights={DEFAULT_MODEL: 3, "b": 1, "c": 0}, seed=0)
+    assert registry.select("c") == ("c", registry.get("c"))
+
+    picks = Counter(registry.select()[0] for _ in range(4000))
+    # Un poids nul n'est jamais tiré
+    assert set(picks) == {DEFAULT_MODEL, "b"}
+    assert picks[DEFAULT_MODEL] / 4000 == pytest.approx(0.75, abs=0.03)
+
+
+def test_unknown_model():
+    registry = load_registry({DEFAULT_MODEL: FakeState("a")}, None)
+    with pytest.raises(ValueError, match="Modèle inconnu"):
+        registry.select("inconnu")
+    with pytest.raises(ValueError):
+        registry.set_traffic({"inconnu": 1})
+    with pytest.raises(ValueError):
+        registry.set_traffic({DEFAULT_MODEL: 0})
+
+
+def test_shadow_deltas():
+    registry = load_registry({DEFAULT_MODEL: FakeState("a"), "b": FakeState("b")}, None, shadows=["b"])
+    assert [name for name, _ in registry.shadows_for(DEFAULT_MODEL)] == ["b"]
+    assert registry.shadows_for("b") == []
+
+    registry.record(DEFAULT_MODEL, "primary", [100.0, 200.0], 0.01)
+    registry.record_shadow("b", [110.0, 180.0], [100.0, 200.0], 0.02)
+    stats = registry.stats()
+    assert stats[DEFAULT_MODEL]["primary"]["rows"] == 2
+    assert stats["b"]["shadow"]["shadow_delta"]["mean_abs_relative"] == pytest.approx(0.1)
+
+    # Nouvelle version : les statistiques repartent de zéro
+    registry.replace("b", FakeState("b2"))
+    assert registry.stats()["b"]["shadow"]["rows"] == 0
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("skl2onnx")
+pytest.importorskip("onnxruntime")
+
+from onnx_engine import OnnxForest, load_onnx_forest, to_onnx
+from price_grid import model_fingerprint
+
+
+@pytest.fixture(scope="module")
+def onnx_forest(pipeline):
+    return OnnxForest(to_onnx(pipeline))
+
+
+def test_predictions_close_to_sklearn(pipeline, sample, onnx_forest):
+    # Valeurs manquantes et marque inconnue comprises ; seul le cumul en float32 diffère
+    np.testing.assert_allclose(onnx_forest.predict(sample), pipeline.predict(sample), rtol=1e-5)
+
+
+def test_accepts_column_dict(sample, onnx_forest):
+    columns = {column: sample[column].to_numpy() for column in sample.columns}
+    assert np.array_equal(onnx_forest.predict(columns), onnx_forest.predict(sample))
+
+
+def test_graph_cached_by_fingerprint(pipeline, sample, tmp_path):
+    forest = load_onnx_forest(str(tmp_path), pipeline)
+    path = tmp_path / f"{model_fingerprint(pipeline)}.onnx"
+    assert path.exists()
+    modified = os.path.getmtime(path)
+
+    reloaded = load_onnx_forest(str(tmp_path), pipeline)
+    assert os.path.getmtime(path) == modified
+    assert np.array_equal(reloaded.predict(sample), forest.predict(sample))
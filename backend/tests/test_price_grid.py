@@ -0,0 +1,56 @@
+import copy
+
+import numpy as np
+import pytest
+
+from compaction import compact_pipeline
+from price_grid import build_grid, grid_axes, load_price_grid, model_fingerprint, save_grid
+
+
+@pytest.fixture(scope="module")
+def price_grid(pipeline, car_data, tmp_path_factory):
+    X, _ = car_data
+    directory = tmp_path_factory.mktemp("price_grids")
+    axes = grid_axes(pipeline, X, max_buckets=None)
+    save_grid(str(directory), model_fingerprint(pipeline), build_grid(pipeline, axes), {"axes": axes})
+    return load_price_grid(str(directory), pipeline)
+
+
+def test_exact_grid_matches_pipeline(pipeline, sample, price_grid):
+    # Lignes complètes et marques connues : la grille exacte redonne la prédiction du pipeline
+    known = sample.dropna()
+    known = known[known["brand"] != "Inconnue"]
+    assert price_grid.describe()["exact"]
+
+    prices, found = price_grid.lookup_frame(known)
+    assert found.all()
+    assert np.array_equal(prices, pipeline.predict(known))
+
+    for row, expected in zip(known.head(20).to_dict("records"), pipeline.predict(known.head(20))):
+        assert price_grid.lookup(row) == expected
+
+
+def test_unknown_category_is_a_miss(sample, price_grid):
+    row = {**sample.iloc[0].to_dict(), "brand": "Inconnue"}
+    misses = price_grid.misses
+    assert price_grid.lookup(row) is None
+    assert price_grid.misses == misses + 1
+
+    _, found = price_grid.lookup_frame(sample.assign(brand="Inconnue").head(5))
+    assert not found.any()
+
+
+def test_bucketed_axes(pipeline, car_data):
+    X, _ = car_data
+    axes = {axis["column"]: axis for axis in grid_axes(pipeline, X, max_buckets=16)}
+    assert not axes["km_driven"]["exact"]
+    assert len(axes["km_driven"]["representatives"]) <= 16
+
+
+def test_grid_bound_to_fingerprint(pipeline, price_grid, tmp_path):
+    fingerprint = model_fingerprint(pipeline)
+    assert model_fingerprint(copy.deepcopy(pipeline)) == fingerprint == price_grid.metadata["fingerprint"]
+    save_grid(str(tmp_path), fingerprint, np.asarray(price_grid.values), price_grid.metadata)
+    assert load_price_grid(str(tmp_path), pipeline) is not None
+    # Un autre modèle ne lit pas la grille de celui-ci
+    assert load_price_grid(str(tmp_path), compact_pipeline(pipeline, n_trees=10)) is None
@@ -0,0 +1,74 @@
+import json
+import logging
+
+import pytest
+
+import request_logging
+from request_logging import RequestLog, request_id, setup_logging, shutdown_logging
+
+
+@pytest.fixture
+def request_log_path(tmp_path):
+    root = logging.getLogger()
+    level = root.level
+    path = tmp_path / "requests.jsonl"
+    setup_logging(logging.WARNING, str(path))
+    yield path
+    shutdown_logging()
+    root.setLevel(level)
+
+
+def read_entries(path):
+    # L'arrêt vide la file avant de fermer le fichier
+    shutdown_logging()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_json_lines_fields(request_log_path):
+    token = request_id.set("abc123")
+    try:
+        RequestLog(1).log("/predict", {"year": 2015}, {"model": 0.0012345}, predicted_selling_price=500000.0, cached=False)
+    finally:
+        request_id.reset(token)
+
+    [entry] = read_entries(request_log_path)
+    assert entry["request_id"] == "abc123"
+    assert entry["endpoint"] == "/predict"
+    assert entry["features"] == {"year": 2015}
+    assert entry["predicted_selling_price"] == 500000.0 and entry["cached"] is False
+    assert entry["timings_ms"] == {"model": 1.234}
+    assert "time" in entry
+
+
+def test_sampling(request_log_path, monkeypatch):
+    RequestLog(0).log("/predict", {}, {})
+    draws = iter([0.05, 0.5])
+    monkeypatch.setattr(request_logging.random, "random", lambda: next(draws))
+    sampled = RequestLog(0.1)
+    sampled.log("/explain", {}, {})
+    sampled.log("/predict_batch", {}, {})
+
+    entries = read_entries(request_log_path)
+    # Seul le tirage sous le taux d'échantillonnage est écrit, avec un identifiant généré
+    assert [entry["endpoint"] for entry in entries] == ["/explain"]
+    assert len(entries[0]["request_id"]) == 32
+
+
+def test_application_logs_not_in_request_log(request_log_path):
+    logging.getLogger("autopredict.test").warning("message applicatif")
+    assert read_entries(request_log_path) == []
+
+
+def test_shutdown_restores_handlers(tmp_path, caplog):
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    setup_logging(logging.INFO, str(tmp_path / "requests.jsonl"))
+    try:
+        assert root.handlers != handlers and len(root.handlers) == 1
+    finally:
+        shutdown_logging()
+        root.setLevel(level)
+    # Handlers d'origine rendus (ceux de pytest compris) : les logs émis après l'arrêt sont encore écrits
+    assert root.handlers == handlers
+    logging.getLogger("autopredict.test").warning("après l'arrêt")
+    assert "après l'arrêt" in caplog.text